@@ -0,0 +1,799 @@
+import argparse
+import asyncio
+import gc
+import grpc
+import grpc.aio
+import multiprocessing
+import random
+import resource
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import reddit_pb2
+import reddit_pb2_grpc
+import dataset
+import ids
+import ranking
+import snapshot
+import launcher
+import metrics
+import wal
+import wire
+from client import RedditClient, batched
+from controller import RedditNativeController
+from server import RedditServicer, make_server
+from storage import CommentStore, PostStore
+from votes import UserInterner, VoteStore, UPVOTE, DOWNVOTE
+
+
+def skewed_index(rng: random.Random, n: int, skew: float):
+    """Pick an index in [0, n), small indexes are picked far more often"""
+    return min(int(n * rng.random() ** skew), n - 1)
+
+
+def rss_bytes():
+    """Resident memory of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # peak rather than current, good enough when memory only grows
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def make_comment(rng: random.Random, i: int):
+    return reddit_pb2.Comment(
+        parent_post_id=rng.randrange(1000),
+        author=reddit_pb2.User(user_id=f"user{rng.randrange(100_000)}"),
+        text=f"comment {i} " + "x" * rng.randrange(20, 120),
+        comment_state=reddit_pb2.CommentState.COMMENT_STATE_NORMAL,
+        publication_date="2023-01-01T00:00:00.000000",
+    )
+
+
+def bench_storage(args):
+    """Memory per comment and score update cost: column store vs messages"""
+    rng = random.Random(args.seed)
+    gc.collect()
+    before = rss_bytes()
+    users = UserInterner()
+    store = CommentStore(users, PostStore(users))
+    for i in range(args.comments):
+        with store.lock:
+            store.append(make_comment(rng, i), time.time())
+    store_bytes = rss_bytes() - before
+
+    rng = random.Random(args.seed)
+    gc.collect()
+    before = rss_bytes()
+    messages = {}
+    for i in range(args.comments):
+        comment = make_comment(rng, i)
+        comment.comment_id = i
+        comment.score = 0
+        messages[i] = comment
+    messages_bytes = rss_bytes() - before
+
+    print(f"comments: {args.comments}")
+    print(f"column store: {store_bytes / args.comments:.1f} bytes/comment "
+          f"(columns report {store.memory_usage() / args.comments:.1f})")
+    print(f"protobuf messages: {messages_bytes / args.comments:.1f} "
+          f"bytes/comment")
+
+    ids = [rng.randrange(args.comments) for _ in range(args.updates)]
+    score = store.score
+    start = time.perf_counter()
+    for i in ids:
+        score[i] += 1
+    store_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in ids:
+        messages[i].score += 1
+    messages_time = time.perf_counter() - start
+    print(f"score update: column {store_time / args.updates * 1e9:.0f} ns, "
+          f"protobuf field {messages_time / args.updates * 1e9:.0f} ns")
+
+
+def time_per_call(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_ranking(args):
+    """Top-n read and vote cost of each child index by number of children"""
+    if ranking.np is None:
+        print("numpy is not installed, only the sorted index is measured")
+    rng = random.Random(args.seed)
+    print(f"{'children':>10} {'full sort':>12} {'sorted read':>12} "
+          f"{'numpy read':>12} {'sorted vote':>12} {'numpy vote':>12}")
+    for size in args.sizes:
+        scores = [int(rng.paretovariate(1.2)) for _ in range(size)]
+        state = [reddit_pb2.CommentState.COMMENT_STATE_NORMAL] * size
+        indexes = [ranking.SortedChildren()]
+        if ranking.np is not None:
+            indexes.append(ranking.NumpyChildren())
+        for children in indexes:
+            for comment_id, score in enumerate(scores):
+                children.add(comment_id, score, True)
+        repeat = max(3, 200_000 // size)
+        row = [time_per_call(lambda: sorted(
+            enumerate(scores), key=lambda x: x[1], reverse=True)[:args.limit],
+            repeat)]
+        for children in indexes:
+            row.append(time_per_call(
+                lambda: children.top(args.limit, state), repeat))
+        for children in indexes:
+            current = list(scores)
+
+            def vote():
+                comment_id = rng.randrange(size)
+                children.move(comment_id, current[comment_id],
+                              current[comment_id] + 1)
+                current[comment_id] += 1
+            row.append(time_per_call(vote, 2000))
+        if len(indexes) == 1:
+            row = row[:2] + [float('nan')] + row[2:] + [float('nan')]
+        print(f"{size:>10} " + " ".join(f"{t * 1e6:>10.1f}us" for t in row))
+
+
+def run_threads(threads: int, target):
+    """Run target(thread_index) on `threads` threads, return elapsed time"""
+    workers = [threading.Thread(target=target, args=(t,))
+               for t in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def bench_wal(args):
+    """Vote throughput and fsyncs per vote for each durability mode"""
+    modes = [None] + list(wal.WriteAheadLog.DURABILITY)
+    for durability in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            controller = RedditNativeController()
+            if durability is not None:
+                controller.log = wal.WriteAheadLog(
+                    os.path.join(directory, 'bench.wal'), durability)
+                controller.log.open()
+            posts = [controller.create_post(reddit_pb2.Post(title='p'))
+                     for _ in range(100)]
+
+            def voter(t):
+                for i in range(args.votes_per_thread):
+                    controller.vote_post(
+                        posts[i % len(posts)].post_id, f'user{t}-{i}', True)
+
+            elapsed = run_threads(args.threads, voter)
+            votes = args.threads * args.votes_per_thread
+            fsyncs = controller.log.fsyncs if controller.log else 0
+            if controller.log is not None:
+                controller.log.close()
+        print(f"{durability or 'no log':>8}: {votes / elapsed:>9,.0f} votes/s, "
+              f"{fsyncs} fsyncs ({fsyncs / votes:.3f} per vote)")
+
+
+def first_rpc(reddit_controller):
+    """Serve the controller and time one GetMostUpvotedComments call"""
+    server, port = make_server('localhost', 0, reddit_controller)
+    try:
+        with grpc.insecure_channel(f'localhost:{port}') as channel:
+            RedditClient(reddit_pb2_grpc.RedditServiceStub(channel)) \
+                .get_most_upvoted_comments(0, 10)
+    finally:
+        server.stop(None)
+
+
+def bench_startup(args):
+    """Time to first RPC: rebuilding with create_* calls vs a snapshot"""
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    controller = RedditNativeController()
+    for i in range(args.posts):
+        controller.create_post(reddit_pb2.Post(title=f'post {i}'), 0.0)
+    for i in range(args.comments):
+        comment = make_comment(rng, i)
+        # half of the comments answer an earlier comment
+        if i and rng.random() < 0.5:
+            comment.ClearField('parent_post_id')
+            comment.parent_comment_id = skewed_index(rng, i, 2.0)
+        else:
+            comment.parent_post_id = skewed_index(rng, args.posts, 3.0)
+        controller.create_comment(comment, 0.0)
+    for i in range(args.votes):
+        controller.vote_comment(skewed_index(rng, args.comments, 3.0),
+                                f'user{rng.randrange(100_000)}',
+                                rng.random() < 0.8)
+    first_rpc(controller)
+    rebuild = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.snap')
+        start = time.perf_counter()
+        snapshot.save(controller, path)
+        saved = time.perf_counter() - start
+        size = os.path.getsize(path)
+        del controller
+        gc.collect()
+
+        start = time.perf_counter()
+        controller, _ = snapshot.load(path)
+        loaded = time.perf_counter() - start
+        first_rpc(controller)
+        ready = time.perf_counter() - start
+    print(f"posts: {args.posts}, comments: {args.comments}, "
+          f"votes: {args.votes}")
+    print(f"rebuild with create/vote calls: {rebuild:.2f}s to first RPC")
+    print(f"snapshot: {size / 2**20:.1f} MiB written in {saved:.2f}s, "
+          f"loaded in {loaded:.3f}s, {ready:.3f}s to first RPC")
+
+
+def bench_cache(args):
+    """Read throughput on one hot thread that is also voted on"""
+    controller = RedditNativeController()
+    post = controller.create_post(reddit_pb2.Post(title='hot'))
+    comment_ids = [controller.create_comment(reddit_pb2.Comment(
+        parent_post_id=post.post_id, text=f'comment {i}')).comment_id
+        for i in range(args.comments)]
+    request = reddit_pb2.GetMostUpvotedCommentsRequest(
+        post_id=post.post_id, limit=10)
+    print(f"{'cache':>22} {'reads/s':>10} {'votes':>7} {'recomputed':>10}")
+    for label, cache_size, max_staleness in (
+            ('off', 0, 0.0), ('versioned', 1000, 0.0),
+            (f'max staleness {args.max_staleness}s', 1000,
+             args.max_staleness)):
+        servicer = RedditServicer(controller, cache_size, max_staleness)
+        reads = [0] * args.threads
+        votes = [0] * args.threads
+
+        def reader(t):
+            rng = random.Random(args.seed + t)
+            deadline = time.perf_counter() + args.seconds
+            while time.perf_counter() < deadline:
+                servicer.GetMostUpvotedComments(request, None)
+                reads[t] += 1
+                if reads[t] % args.reads_per_vote == 0:
+                    controller.vote_comment(
+                        rng.choice(comment_ids),
+                        f'user{rng.randrange(10**9)}', True)
+                    votes[t] += 1
+
+        elapsed = run_threads(args.threads, reader)
+        reads = sum(reads)
+        votes = sum(votes)
+        recomputed = servicer.cache.misses if servicer.cache else reads
+        print(f"{label:>22} {reads / elapsed:>10,.0f} {votes:>7} "
+              f"{recomputed:>10}")
+
+
+def comment_thread(args, **controller_kwargs):
+    """
+    A controller with a post of args.limit comments with args.limit
+    sub comments each, return it, the post id and the comment ids
+    """
+    rng = random.Random(args.seed)
+    controller = RedditNativeController(**controller_kwargs)
+    post = controller.create_post(reddit_pb2.Post(title='thread'))
+    top = []
+    for i in range(args.limit):
+        comment = make_comment(rng, i)
+        comment.parent_post_id = post.post_id
+        top.append(controller.create_comment(comment).comment_id)
+    for parent_id in top:
+        for i in range(args.limit):
+            comment = make_comment(rng, i)
+            comment.ClearField('parent_post_id')
+            comment.parent_comment_id = parent_id
+            controller.create_comment(comment)
+    return controller, post.post_id, top
+
+
+def bench_wire(args):
+    """Cost of answering and serializing the comment RPCs per call"""
+    controller, post_id, top = comment_thread(args, wire_cache=True)
+    top_request = reddit_pb2.GetMostUpvotedCommentsRequest(
+        post_id=post_id, limit=args.limit)
+    branch_request = reddit_pb2.ExpandCommentBranchRequest(
+        comment_id=top[0], limit=args.limit)
+    # what the server does with the response
+    serialize = wire.raw_serializer(lambda r: r.SerializeToString())
+    print(f"{'responses':>10} {'top comments':>13} {'branch':>13}")
+    for label, raw_responses in (('messages', False), ('raw', True)):
+        servicer = RedditServicer(controller, cache_size=0,
+                                  raw_responses=raw_responses)
+        row = [time_per_call(lambda: serialize(
+                   servicer.GetMostUpvotedComments(top_request, None)),
+                   args.repeat),
+               time_per_call(lambda: serialize(
+                   servicer.ExpandCommentBranch(branch_request, None)),
+                   args.repeat)]
+        print(f"{label:>10} " + " ".join(f"{t * 1e6:>11.1f}us" for t in row))
+
+
+def bench_metrics(args):
+    """Cost of answering the comment RPCs per call with metrics off and on"""
+    print(f"{'metrics':>10} {'post':>11} {'top comments':>13} {'branch':>13}")
+    for label in ('off', 'on'):
+        controller, post_id, top = comment_thread(args)
+        servicer = RedditServicer(controller, cache_size=0)
+        interceptor = None
+        if label == 'on':
+            controller.instrument(metrics.Metrics())
+            interceptor = metrics.MetricsInterceptor(metrics.Metrics())
+        row = []
+        for method, request in (
+                ('GetPostContent',
+                 reddit_pb2.GetPostContentRequest(post_id=post_id)),
+                ('GetMostUpvotedComments',
+                 reddit_pb2.GetMostUpvotedCommentsRequest(
+                     post_id=post_id, limit=args.limit)),
+                ('ExpandCommentBranch',
+                 reddit_pb2.ExpandCommentBranchRequest(
+                     comment_id=top[0], limit=args.limit))):
+            # what the server does with the handler of the method
+            handler = grpc.unary_unary_rpc_method_handler(
+                getattr(servicer, method),
+                response_serializer=lambda r: r.SerializeToString())
+            if interceptor is not None:
+                handler = interceptor.wrap(handler, method)
+            row.append(time_per_call(
+                lambda: handler.response_serializer(
+                    handler.unary_unary(request, None)), args.repeat))
+        print(f"{label:>10} " + " ".join(f"{t * 1e6:>11.1f}us" for t in row))
+
+
+def bench_hot_votes(args):
+    """Vote throughput on one hot post and on the comments of one thread"""
+    print(f"{'votes':>10} {'post votes/s':>13} {'comment votes/s':>16}")
+    for label, interval in (('direct', 0.0),
+                            ('coalesced', args.flush_interval)):
+        controller = RedditNativeController(
+            vote_flush_interval=interval, vote_batch=args.batch)
+        post = controller.create_post(reddit_pb2.Post(title='hot'))
+        comment_ids = [controller.create_comment(reddit_pb2.Comment(
+            parent_post_id=post.post_id)).comment_id
+            for _ in range(args.comments)]
+
+        def post_voter(t):
+            for i in range(args.votes_per_thread):
+                controller.vote_post(post.post_id, f'user{t}-{i}', True)
+
+        def comment_voter(t):
+            for i in range(args.votes_per_thread):
+                controller.vote_comment(comment_ids[i % len(comment_ids)],
+                                        f'user{t}-{i}', i % 5 != 0)
+
+        votes = args.threads * args.votes_per_thread
+        post_rate = votes / run_threads(args.threads, post_voter)
+        comment_rate = votes / run_threads(args.threads, comment_voter)
+        controller.close()
+        assert controller.posts.score[post.post_id] == votes
+        print(f"{label:>10} {post_rate:>13,.0f} {comment_rate:>16,.0f}")
+
+
+def bench_ids(args):
+    """Id allocation and comment creation throughput of each id allocator"""
+    print(f"{'ids':>10} {'ids/s':>12} {'creates/s':>12}")
+    for kind in ids.KINDS:
+        allocator = ids.allocator(kind)
+        if allocator is None:
+            allocation_rate = None
+        else:
+            def allocate(t):
+                for _ in range(args.creates_per_thread):
+                    allocator.next_id()
+
+            allocation_rate = args.threads * args.creates_per_thread / \
+                run_threads(args.threads, allocate)
+        controller = RedditNativeController(ids=ids.allocator(kind))
+        post_ids = [controller.create_post(reddit_pb2.Post()).post_id
+                    for _ in range(args.threads)]
+
+        def create(t):
+            for _ in range(args.creates_per_thread):
+                controller.create_comment(
+                    reddit_pb2.Comment(parent_post_id=post_ids[t]))
+
+        create_rate = args.threads * args.creates_per_thread / \
+            run_threads(args.threads, create)
+        allocation = '-' if allocation_rate is None \
+            else f"{allocation_rate:,.0f}"
+        print(f"{kind:>10} {allocation:>12} {create_rate:>12,.0f}")
+
+
+def bench_batch(args):
+    """Votes/s over gRPC one call per vote, in batches and streamed"""
+    with tempfile.TemporaryDirectory() as directory:
+        controller = RedditNativeController()
+        controller.log = wal.WriteAheadLog(
+            os.path.join(directory, 'bench.wal'), 'batch')
+        controller.log.open()
+        for i in range(100):
+            controller.create_post(reddit_pb2.Post(title=f'post {i}'))
+        server, port = make_server('localhost', 0, controller)
+        try:
+            with grpc.insecure_channel(f'localhost:{port}') as channel:
+                client = RedditClient(reddit_pb2_grpc.RedditServiceStub(channel))
+                for label, send in (
+                        ('unary', lambda votes: [client.vote_post(*vote)
+                                                 for vote in votes]),
+                        ('batch', lambda votes: [
+                            client.vote_batch(batch) for batch in
+                            batched(votes, args.batch)]),
+                        ('stream', lambda votes: client.stream_votes(
+                            votes, batch_size=args.batch))):
+                    votes = [(i % 100, f'{label}{i}', True)
+                             for i in range(args.votes)]
+                    fsyncs = controller.log.fsyncs
+                    start = time.perf_counter()
+                    send(votes)
+                    elapsed = time.perf_counter() - start
+                    fsyncs = controller.log.fsyncs - fsyncs
+                    print(f"{label:>6}: {args.votes / elapsed:>9,.0f} votes/s, "
+                          f"{fsyncs} fsyncs")
+        finally:
+            server.stop(None)
+            controller.log.close()
+
+
+def process_peak_rss(pid: int):
+    """Peak resident set size of a process in bytes (Linux only)"""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+async def async_calls(port, concurrency, duration, post_ids=(0,)):
+    """
+    Latencies of concurrency callers looping for duration seconds,
+    caller i asks for the top comments of post_ids[i % len(post_ids)].
+    """
+    channels = [grpc.aio.insecure_channel(
+        f'localhost:{port}', options=[('grpc.use_local_subchannel_pool', 1)])
+        for _ in range(max(1, concurrency // 100))]
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def caller(i):
+        stub = reddit_pb2_grpc.RedditServiceStub(channels[i % len(channels)])
+        request = reddit_pb2.GetMostUpvotedCommentsRequest(
+            post_id=post_ids[i % len(post_ids)], limit=10)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await stub.GetMostUpvotedComments(request)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*map(caller, range(concurrency)))
+    for channel in channels:
+        await channel.close()
+    return latencies
+
+
+def client_process(port, concurrency, duration, post_ids=(0,)):
+    return asyncio.run(async_calls(port, concurrency, duration, post_ids))
+
+
+def run_clients(args, port, post_ids=(0,)):
+    """Sorted latencies of args.concurrency callers in client processes"""
+    per_process = args.concurrency // args.client_processes
+    with multiprocessing.Pool(args.client_processes) as pool:
+        results = pool.starmap(
+            client_process, [(port, per_process, args.duration, post_ids)] *
+            args.client_processes)
+    return sorted(latency for result in results for latency in result)
+
+
+def print_latencies(label, latencies, duration):
+    print(f"{label:>16} {len(latencies) / duration:>9,.0f} "
+          f"{latencies[len(latencies) // 2] * 1000:>8.1f} "
+          f"{latencies[int(len(latencies) * 0.99)] * 1000:>8.1f}", end='')
+
+
+def bench_async(args):
+    """Throughput and latency of the threaded and the asyncio server"""
+    print(f"{'server':>16} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'peak MiB':>9}")
+    for label, flags in (('threads', []), ('async', ['--async']),
+                         ('async offload', ['--async', '--offload-ranking'])):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, 'server.py', '--port', str(port),
+             '--cache-size', '0'] + flags,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            launcher.wait_ready(f'localhost:{port}')
+            latencies = run_clients(args, port)
+            peak_rss = process_peak_rss(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        print_latencies(label, latencies, args.duration)
+        print(f" {peak_rss / 2 ** 20:>9.1f}")
+
+
+async def deadline_calls(port, concurrency, duration, timeout):
+    """
+    Latencies of the successful calls and number of failures by status
+    code of concurrency callers with a deadline of timeout seconds.
+    """
+    channel = grpc.aio.insecure_channel(f'localhost:{port}')
+    stub = reddit_pb2_grpc.RedditServiceStub(channel)
+    request = reddit_pb2.GetMostUpvotedCommentsRequest(post_id=0, limit=10)
+    latencies = []
+    failures = {}
+    deadline = time.perf_counter() + duration
+
+    async def caller():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await stub.GetMostUpvotedComments(request, timeout=timeout)
+                latencies.append(time.perf_counter() - start)
+            except grpc.aio.AioRpcError as error:
+                failures[error.code()] = failures.get(error.code(), 0) + 1
+                if error.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+                    # back off as a client would
+                    await asyncio.sleep(0.2)
+
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    await channel.close()
+    return sorted(latencies), failures
+
+
+def bench_overload(args):
+    """Answers, rejections and timeouts of an overloaded server"""
+    print(f"{'server':>16} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'rejected/s':>11} {'timed out/s':>12}")
+    for label, flags in (
+            ('queue', []),
+            (f'{args.target_queue_delay}s delay',
+             ['--target-queue-delay', str(args.target_queue_delay)])):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, 'server.py', '--port', str(port),
+             '--cache-size', '0', '--max-workers', str(args.max_workers)] +
+            flags, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            launcher.wait_ready(f'localhost:{port}')
+            latencies, failures = asyncio.run(deadline_calls(
+                port, args.concurrency, args.duration, args.timeout))
+        finally:
+            server.terminate()
+            server.wait()
+        if latencies:
+            print_latencies(label, latencies, args.duration)
+        else:
+            print(f"{label:>16} {0:>9} {'-':>8} {'-':>8}", end='')
+        rejected = failures.get(grpc.StatusCode.RESOURCE_EXHAUSTED, 0)
+        timed_out = failures.get(grpc.StatusCode.DEADLINE_EXCEEDED, 0)
+        print(f" {rejected / args.duration:>11,.0f} "
+              f"{timed_out / args.duration:>12,.0f}")
+
+
+def bench_shards(args):
+    """Throughput of a sharded deployment by number of shards"""
+    print(f"{'shards':>16} {'calls/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'shard{shard}.data')
+            for shard in range(shards):
+                dataset.write_records(
+                    path.format(shard=shard),
+                    dataset.split(dataset.generate(
+                        args.posts, args.comments, args.votes, seed=1),
+                        shard, shards))
+            port = free_port()
+            processes = launcher.launch(
+                shards, args.routers or shards, port=port,
+                base_port=free_port(), server_args=['--dataset', path])
+            try:
+                # the posts with the most comments, one on every shard
+                latencies = run_clients(args, port, list(range(shards)))
+            finally:
+                launcher.stop(processes)
+        print_latencies(str(shards), latencies, args.duration)
+        print()
+
+
+def bench_votes(args):
+    """Memory used by the vote store at a given number of votes"""
+    rng = random.Random(args.seed)
+    users = UserInterner()
+    store = VoteStore()
+    legacy = {} if args.compare else None
+    start = time.perf_counter()
+    for _ in range(args.votes):
+        item_id = skewed_index(rng, args.items, args.skew)
+        user_id = f"user{rng.randrange(args.users)}"
+        vote = UPVOTE if rng.random() < 0.8 else DOWNVOTE
+        store.set(item_id, users.intern(user_id), vote)
+        if legacy is not None:
+            votes = legacy.setdefault(
+                item_id, {"upvote": set(), "downvote": set()})
+            if vote == UPVOTE:
+                votes["downvote"].discard(user_id)
+                votes["upvote"].add(user_id)
+            else:
+                votes["upvote"].discard(user_id)
+                votes["downvote"].add(user_id)
+    elapsed = time.perf_counter() - start
+
+    voted_items = len(store.items)
+    store_bytes = store.memory_usage()
+    users_bytes = users.memory_usage()
+    bitmaps = sum(isinstance(v, bytearray) for v in store.items.values())
+    print(f"votes: {args.votes}, items voted on: {voted_items}/{args.items}, "
+          f"users: {len(users)}, bitmap items: {bitmaps}")
+    print(f"insert time: {elapsed:.1f}s "
+          f"({args.votes / elapsed:,.0f} votes/s)")
+    print(f"vote store: {store_bytes:,} bytes, "
+          f"{store_bytes / args.votes:.1f} bytes/vote, "
+          f"{store_bytes / voted_items:.1f} bytes/voted item, "
+          f"0 bytes/item without votes")
+    print(f"user interner: {users_bytes:,} bytes, "
+          f"{users_bytes / len(users):.1f} bytes/user")
+    if legacy is not None:
+        legacy_bytes = sys.getsizeof(legacy) + sum(
+            sys.getsizeof(v) + sys.getsizeof(v["upvote"]) +
+            sys.getsizeof(v["downvote"]) for v in legacy.values())
+        # the legacy layout also allocated an empty dict and two sets for
+        # every item, voted or not
+        empty = sys.getsizeof({"upvote": set(), "downvote": set()}) + \
+            2 * sys.getsizeof(set())
+        legacy_bytes += empty * (args.items - len(legacy))
+        print(f"dict of sets: {legacy_bytes:,} bytes, "
+              f"{legacy_bytes / args.votes:.1f} bytes/vote, "
+              f"{empty} bytes/item without votes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='reddit benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    votes_parser = subparsers.add_parser(
+        'votes', help='memory per vote and per item of the vote store')
+    votes_parser.add_argument('--votes', type=int, default=10_000_000)
+    votes_parser.add_argument('--items', type=int, default=1_000_000)
+    votes_parser.add_argument('--users', type=int, default=1_000_000)
+    votes_parser.add_argument('--skew', type=float, default=3.0,
+                              help='higher values concentrate votes '
+                              'on fewer items')
+    votes_parser.add_argument('--compare', action='store_true',
+                              help='also measure the dict of sets layout')
+    votes_parser.set_defaults(run=bench_votes)
+
+    storage_parser = subparsers.add_parser(
+        'storage', help='memory per comment of the column store '
+        'against retained protobuf messages')
+    storage_parser.add_argument('--comments', type=int, default=1_000_000)
+    storage_parser.add_argument('--updates', type=int, default=1_000_000)
+    storage_parser.set_defaults(run=bench_storage)
+
+    ranking_parser = subparsers.add_parser(
+        'ranking', help='top-n read and vote cost of the sorted and numpy '
+        'child indexes, to find the crossover point')
+    ranking_parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[10, 100, 1000, 10_000, 100_000, 1_000_000])
+    ranking_parser.add_argument('--limit', type=int, default=10)
+    ranking_parser.set_defaults(run=bench_ranking)
+
+    wal_parser = subparsers.add_parser(
+        'wal', help='vote throughput and fsyncs per vote of the '
+        'write-ahead log durability modes')
+    wal_parser.add_argument('--threads', type=int, default=10)
+    wal_parser.add_argument('--votes-per-thread', type=int, default=2000)
+    wal_parser.set_defaults(run=bench_wal)
+
+    cache_parser = subparsers.add_parser(
+        'cache', help='read throughput and hit rate of the response cache '
+        'on a hot thread that keeps being voted on')
+    cache_parser.add_argument('--comments', type=int, default=1000)
+    cache_parser.add_argument('--threads', type=int, default=8)
+    cache_parser.add_argument('--seconds', type=float, default=2.0)
+    cache_parser.add_argument('--reads-per-vote', type=int, default=100)
+    cache_parser.add_argument('--max-staleness', type=float, default=0.2)
+    cache_parser.set_defaults(run=bench_cache)
+
+    wire_parser = subparsers.add_parser(
+        'wire', help='time to answer and serialize the comment RPCs, from '
+        'messages and from serialized comments')
+    wire_parser.add_argument('--limit', type=int, default=20)
+    wire_parser.add_argument('--repeat', type=int, default=2000)
+    wire_parser.set_defaults(run=bench_wire)
+
+    metrics_parser = subparsers.add_parser(
+        'metrics', help='cost of the comment RPCs with and without the '
+        'metrics interceptor and stage timings')
+    metrics_parser.add_argument('--limit', type=int, default=10)
+    metrics_parser.add_argument('--repeat', type=int, default=20_000)
+    metrics_parser.add_argument('--seed', type=int, default=0)
+    metrics_parser.set_defaults(run=bench_metrics)
+
+    hot_parser = subparsers.add_parser(
+        'hotvotes', help='vote throughput on a single hot post and thread, '
+        'applying every vote alone or in coalesced batches')
+    hot_parser.add_argument('--threads', type=int, default=8)
+    hot_parser.add_argument('--votes-per-thread', type=int, default=20_000)
+    hot_parser.add_argument('--comments', type=int, default=100)
+    hot_parser.add_argument('--batch', type=int, default=256)
+    hot_parser.add_argument('--flush-interval', type=float, default=0.05)
+    hot_parser.set_defaults(run=bench_hot_votes)
+
+    ids_parser = subparsers.add_parser(
+        'ids', help='id allocation and comment creation throughput with '
+        'row ids, blocks and snowflake ids')
+    ids_parser.add_argument('--threads', type=int, default=8)
+    ids_parser.add_argument('--creates-per-thread', type=int, default=20_000)
+    ids_parser.set_defaults(run=bench_ids)
+
+    batch_parser = subparsers.add_parser(
+        'batch', help='vote throughput over gRPC with one call per vote, '
+        'BatchVote and StreamVotes')
+    batch_parser.add_argument('--votes', type=int, default=20_000)
+    batch_parser.add_argument('--batch', type=int, default=500)
+    batch_parser.set_defaults(run=bench_batch)
+
+    async_parser = subparsers.add_parser(
+        'async', help='throughput and latency of the threaded and the '
+        'asyncio server with many concurrent callers')
+    async_parser.add_argument('--concurrency', type=int, default=1000)
+    async_parser.add_argument('--client-processes', type=int, default=4)
+    async_parser.add_argument('--duration', type=float, default=5.0)
+    async_parser.set_defaults(run=bench_async)
+
+    overload_parser = subparsers.add_parser(
+        'overload', help='answers, rejections and timeouts of a server '
+        'given more calls than it can answer, queueing them against '
+        '--target-queue-delay')
+    overload_parser.add_argument('--concurrency', type=int, default=1000)
+    overload_parser.add_argument('--duration', type=float, default=5.0)
+    overload_parser.add_argument('--timeout', type=float, default=0.25,
+                                 help='deadline of every call in seconds')
+    overload_parser.add_argument('--max-workers', type=int, default=10)
+    overload_parser.add_argument('--target-queue-delay', type=float,
+                                 default=0.05)
+    overload_parser.set_defaults(run=bench_overload)
+
+    shards_parser = subparsers.add_parser(
+        'shards', help='throughput of launcher.py deployments with a '
+        'growing number of shards')
+    shards_parser.add_argument('--shards', type=int, nargs='+',
+                               default=[1, 2, 4])
+    shards_parser.add_argument('--routers', type=int, default=0,
+                               help='router processes, 0: one per shard')
+    shards_parser.add_argument('--posts', type=int, default=1_000)
+    shards_parser.add_argument('--comments', type=int, default=100_000)
+    shards_parser.add_argument('--votes', type=int, default=100_000)
+    shards_parser.add_argument('--concurrency', type=int, default=200)
+    shards_parser.add_argument('--client-processes', type=int, default=2)
+    shards_parser.add_argument('--duration', type=float, default=5.0)
+    shards_parser.set_defaults(run=bench_shards)
+
+    startup_parser = subparsers.add_parser(
+        'startup', help='time to first RPC when rebuilding the data '
+        'against loading a snapshot')
+    startup_parser.add_argument('--posts', type=int, default=10_000)
+    startup_parser.add_argument('--comments', type=int, default=500_000)
+    startup_parser.add_argument('--votes', type=int, default=1_000_000)
+    startup_parser.set_defaults(run=bench_startup)
+
+    args = parser.parse_args()
+    args.run(args)
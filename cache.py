@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of responses. Every entry remembers the version of
+    the data it was computed from, and is only served while that version
+    is still current. With max_staleness > 0 an entry is also served for
+    up to max_staleness seconds after it was computed, whatever changed
+    since, so a hot thread is recomputed at most once per period.
+    """
+
+    def __init__(self, capacity: int = 10_000, max_staleness: float = 0.0,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.max_staleness = max_staleness
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, version: int):
+        """Return the cached response of key, or None"""
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None:
+                entry_version, computed_at, response = entry
+                if entry_version == version or (
+                        self.max_staleness > 0 and
+                        self.clock() - computed_at <= self.max_staleness):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+            self.misses += 1
+            return None
+
+    def put(self, key, version: int, response):
+        """
+        Cache the response of key, version must have been read before the
+        response was computed.
+        """
+        with self.lock:
+            self.entries[key] = (version, self.clock(), response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'size': len(self.entries)}
@@ -1,7 +1,21 @@
 import reddit_pb2
 import reddit_pb2_grpc
 import argparse
+import asyncio
+import functools
 import grpc
+import grpc.aio
+import itertools
+
+
+def batched(items, size):
+    """Yield lists of up to size items"""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
 
 class RedditClient:
@@ -37,6 +51,8 @@ class RedditClient:
                 result['post_state'] = 'hidden'
         if post.HasField('publication_date'):
             result['publication_date'] = post.publication_date
+        if post.HasField('comment_count'):
+            result['comment_count'] = post.comment_count
         return result
 
     def comment_to_dict(self, comment: reddit_pb2.Comment):
@@ -62,9 +78,20 @@ class RedditClient:
                 result['comment_state'] = 'hidden'
         if comment.HasField('publication_date'):
             result['publication_date'] = comment.publication_date
+        if comment.HasField('comment_count'):
+            result['comment_count'] = comment.comment_count
         return result
 
     def create_post(self, title, text, video_url=None, image_url=None, author=None, post_state=None):
+        request = self.post_request(
+            title, text, video_url, image_url, author, post_state)
+        response = self.stub.CreatePost(request)
+        if response.success:
+            return response.post_id
+        else:
+            return None
+
+    def post_request(self, title, text, video_url=None, image_url=None, author=None, post_state=None):
         post_dict = {}
         post_dict['title'] = title
         post_dict['text'] = text
@@ -82,24 +109,22 @@ class RedditClient:
             elif post_state.lower() == 'hidden':
                 post_dict['post_state'] = reddit_pb2.PostState.POST_STATE_HIDDEN
         post = reddit_pb2.Post(**post_dict)
-        request = reddit_pb2.CreatePostRequest(post=post)
-        response = self.stub.CreatePost(request)
+        return reddit_pb2.CreatePostRequest(post=post)
+
+    def vote_post(self, post_id, user_id, is_upvote):
+        request = self.vote_post_request(post_id, user_id, is_upvote)
+        response = self.stub.VotePost(request)
         if response.success:
-            return response.post_id
+            return response.score
         else:
             return None
 
-    def vote_post(self, post_id, user_id, is_upvote):
-        request = reddit_pb2.VotePostRequest(
+    def vote_post_request(self, post_id, user_id, is_upvote):
+        return reddit_pb2.VotePostRequest(
             post_id=post_id,
             user=reddit_pb2.User(user_id=user_id),
             is_upvote=is_upvote,
         )
-        response = self.stub.VotePost(request)
-        if response.success:
-            return response.score
-        else:
-            return None
 
     def get_post_content(self, post_id):
         request = reddit_pb2.GetPostContentRequest(post_id=post_id)
@@ -111,9 +136,38 @@ class RedditClient:
         else:
             return None
 
+    def get_posts(self, post_ids, batch_size=100):
+        """
+        Fetch posts by id, return a post dict for each, or None if the
+        post does not exist or is hidden. The ids are sent batch_size at
+        a time, all the batches at once.
+        """
+        calls = [self.stub.BatchGetPosts.future(
+            reddit_pb2.BatchGetPostsRequest(post_ids=batch))
+            for batch in batched(post_ids, batch_size)]
+        return [post for call in calls
+                for post in self.post_results(call.result())]
+
+    def post_results(self, response):
+        return [self.post_to_dict(result.post)
+                if result.status == reddit_pb2.ItemStatus.ITEM_STATUS_FOUND
+                else None
+                for result in response.posts]
+
     def create_comment(self, author_id, parent_post_id=None,
                        parent_comment_id=None, text=None,
                        comment_state=None):
+        request = self.comment_request(author_id, parent_post_id,
+                                       parent_comment_id, text, comment_state)
+        response = self.stub.CreateComment(request)
+        if response.success:
+            return response.comment_id
+        else:
+            return None
+
+    def comment_request(self, author_id, parent_post_id=None,
+                        parent_comment_id=None, text=None,
+                        comment_state=None):
         comment_dict = {}
         author = reddit_pb2.User(user_id=author_id)
         comment_dict['author'] = author
@@ -131,27 +185,104 @@ class RedditClient:
             elif comment_state.lower() == 'hidden':
                 comment_dict['comment_state'] = reddit_pb2.CommentState.COMMENT_STATE_HIDDEN
         comment = reddit_pb2.Comment(**comment_dict)
-        request = reddit_pb2.CreateCommentRequest(
+        return reddit_pb2.CreateCommentRequest(
             author=author,
             comment=comment,
         )
-        response = self.stub.CreateComment(request)
+
+    def vote_comment(self, comment_id, user_id, is_upvote):
+        request = self.vote_comment_request(comment_id, user_id, is_upvote)
+        response = self.stub.VoteComment(request)
         if response.success:
-            return response.comment_id
+            return response.score
         else:
             return None
 
-    def vote_comment(self, comment_id, user_id, is_upvote):
-        request = reddit_pb2.VoteCommentRequest(
+    def vote_comment_request(self, comment_id, user_id, is_upvote):
+        return reddit_pb2.VoteCommentRequest(
             comment_id=comment_id,
             user=reddit_pb2.User(user_id=user_id),
             is_upvote=is_upvote,
         )
-        response = self.stub.VoteComment(request)
-        if response.success:
-            return response.score
-        else:
-            return None
+
+    def vote_batch_request(self, post_votes=(), comment_votes=()):
+        return reddit_pb2.BatchVoteRequest(
+            post_votes=[self.vote_post_request(*vote) for vote in post_votes],
+            comment_votes=[self.vote_comment_request(*vote)
+                           for vote in comment_votes],
+        )
+
+    def vote_results(self, response):
+        """
+        Return the scores of the post votes and of the comment votes of a
+        BatchVoteResponse, None for the votes that failed
+        """
+        return tuple([result.score if result.success else None
+                      for result in results]
+                     for results in (response.post_votes,
+                                     response.comment_votes))
+
+    def vote_batch(self, post_votes=(), comment_votes=()):
+        """
+        Send (post_id or comment_id, user_id, is_upvote) votes in one call,
+        return the lists of the post and comment scores (None if failed).
+        """
+        response = self.stub.BatchVote(
+            self.vote_batch_request(post_votes, comment_votes))
+        return self.vote_results(response)
+
+    def stream_votes(self, post_votes=(), comment_votes=(), batch_size=1000):
+        """
+        vote_batch for batches too large for one message: the votes are
+        read lazily and streamed batch_size at a time.
+        """
+        response = self.stub.StreamVotes(self.vote_batch_requests(
+            post_votes, comment_votes, batch_size))
+        return self.vote_results(response)
+
+    def vote_batch_requests(self, post_votes, comment_votes, batch_size):
+        for batch in batched(post_votes, batch_size):
+            yield self.vote_batch_request(post_votes=batch)
+        for batch in batched(comment_votes, batch_size):
+            yield self.vote_batch_request(comment_votes=batch)
+
+    def create_comments(self, comments):
+        """
+        Create comments given as dicts of create_comment arguments in one
+        call, return their ids (None if failed).
+        """
+        response = self.stub.BatchCreateComment(
+            self.create_comments_request(comments))
+        return self.comment_ids(response)
+
+    def create_comments_request(self, comments):
+        return reddit_pb2.BatchCreateCommentRequest(comments=[
+            self.comment_request(**comment) for comment in comments])
+
+    def comment_ids(self, response):
+        return [result.comment_id if result.success else None
+                for result in response.comments]
+
+    def stream_create_comments(self, comments, batch_size=1000):
+        """create_comments, streamed batch_size comments at a time"""
+        response = self.stub.StreamCreateComments(
+            self.create_comments_request(batch)
+            for batch in batched(comments, batch_size))
+        return self.comment_ids(response)
+
+    def get_comments(self, comment_ids, batch_size=100):
+        """get_posts for comments"""
+        calls = [self.stub.BatchGetComments.future(
+            reddit_pb2.BatchGetCommentsRequest(comment_ids=batch))
+            for batch in batched(comment_ids, batch_size)]
+        return [comment for call in calls
+                for comment in self.comment_results(call.result())]
+
+    def comment_results(self, response):
+        return [self.comment_to_dict(result.comment)
+                if result.status == reddit_pb2.ItemStatus.ITEM_STATUS_FOUND
+                else None
+                for result in response.comments]
 
     def get_most_upvoted_comments(self, post_id, n):
         request = reddit_pb2.GetMostUpvotedCommentsRequest(
@@ -159,6 +290,9 @@ class RedditClient:
             limit=n,
         )
         response = self.stub.GetMostUpvotedComments(request)
+        return self.most_upvoted_to_dicts(response)
+
+    def most_upvoted_to_dicts(self, response):
         result = []
         for comment in response.comments:
             has_subcomment = comment.HasField(
@@ -174,6 +308,9 @@ class RedditClient:
             limit=n,
         )
         response = self.stub.ExpandCommentBranch(request)
+        return self.branch_to_dicts(response)
+
+    def branch_to_dicts(self, response):
         result = []
         for sub_subsub in response.subcomments:
             sub = self.comment_to_dict(sub_subsub.comment)
@@ -183,6 +320,244 @@ class RedditClient:
             result.append({'sub_comment': sub, 'sub_sub_comments': subsub})
         return result
 
+    def expand_comment_tree(self, comment_id, max_depth, n=None,
+                            level_limits=None, max_nodes=None):
+        """
+        Expand up to max_depth levels below a comment in one call, keeping
+        level_limits[i] (or n) sub comments per comment at level i.
+        Returns a list of comment dicts with 'has_subcomment' and 'replies'.
+        """
+        request = self.tree_request(
+            comment_id, max_depth, n, level_limits, max_nodes)
+        response = self.stub.ExpandCommentBranch(request)
+        return self.trees_to_dicts(response.tree)
+
+    def tree_request(self, comment_id, max_depth, n=None, level_limits=None,
+                     max_nodes=None):
+        return reddit_pb2.ExpandCommentBranchRequest(
+            comment_id=comment_id,
+            limit=n,
+            max_depth=max_depth,
+            level_limits=level_limits,
+            max_nodes=max_nodes,
+        )
+
+    def trees_to_dicts(self, trees):
+        """CommentTrees as comment dicts with 'has_subcomment' and 'replies'"""
+        result = []
+        pending = [(tree, result) for tree in reversed(trees)]
+        while pending:
+            tree, siblings = pending.pop()
+            comment_dict = self.comment_to_dict(tree.comment)
+            comment_dict['has_subcomment'] = tree.has_subcomment
+            comment_dict['replies'] = []
+            siblings.append(comment_dict)
+            pending.extend((reply, comment_dict['replies'])
+                           for reply in reversed(tree.replies))
+        return result
+
+    def stream_comment_tree(self, comment_id, max_depth, n=None,
+                            level_limits=None, max_nodes=None):
+        """
+        Generator over the comments below a comment, breadth first and
+        best first as in expand_comment_tree, yielded as the server sends
+        them. Each is a comment dict with 'has_subcomment' and 'depth'.
+        """
+        request = self.tree_request(
+            comment_id, max_depth, n, level_limits, max_nodes)
+        for node in self.stub.StreamCommentTree(request):
+            yield self.node_to_dict(node)
+
+    def node_to_dict(self, node):
+        comment_dict = self.comment_to_dict(node.comment)
+        comment_dict['has_subcomment'] = node.has_subcomment
+        comment_dict['depth'] = node.depth
+        return comment_dict
+
+    def get_post_thread(self, post_id, n, m):
+        """
+        Get a post, its n most upvoted comments and the m most upvoted
+        replies of each of them in one call. Returns a dict with 'post' and
+        'comments' (comment dicts with 'has_subcomment' and 'replies'),
+        or None if the post does not exist.
+        """
+        request = reddit_pb2.GetPostThreadRequest(
+            post_id=post_id,
+            limit=n,
+            reply_limit=m,
+        )
+        response = self.stub.GetPostThread(request)
+        return self.post_thread_to_dict(response)
+
+    def post_thread_to_dict(self, response):
+        if not response.success:
+            return None
+        return {
+            'post': self.post_to_dict(response.post),
+            'comments': self.trees_to_dicts(response.comments),
+        }
+
+
+class AsyncRedditClient(RedditClient):
+    """
+    RedditClient on a grpc.aio channel. Every RPC method is a coroutine
+    (stream_comment_tree an async generator) with the arguments and
+    results of the RedditClient method, so many calls can be in flight
+    on the one channel. Create it in the event loop that uses it, and
+    close it, or use it as an async context manager.
+    """
+
+    def __init__(self, stub=None, host=None, port=None):
+        self.channel = None
+        if stub is None:
+            self.channel = grpc.aio.insecure_channel(f'{host}:{port}')
+            stub = reddit_pb2_grpc.RedditServiceStub(self.channel)
+        self.stub = stub
+
+    async def close(self):
+        if self.channel is not None:
+            await self.channel.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def gather(self, calls, concurrency=100):
+        """
+        Await call() for every call, at most concurrency at a time, and
+        return the results in order. Calls are only started as earlier
+        ones finish, so a long list does not queue up on the channel.
+        """
+        calls = list(calls)
+        results = [None] * len(calls)
+        indexes = iter(range(len(calls)))
+
+        async def worker():
+            for i in indexes:
+                results[i] = await calls[i]()
+
+        await asyncio.gather(*(worker() for _ in
+                               range(min(concurrency, len(calls)))))
+        return results
+
+    async def gather_posts(self, post_ids, concurrency=100):
+        """get_post_content of every id, concurrency calls in flight"""
+        return await self.gather(
+            [functools.partial(self.get_post_content, post_id)
+             for post_id in post_ids], concurrency)
+
+    async def create_post(self, title, text, video_url=None, image_url=None, author=None, post_state=None):
+        response = await self.stub.CreatePost(self.post_request(
+            title, text, video_url, image_url, author, post_state))
+        if response.success:
+            return response.post_id
+        else:
+            return None
+
+    async def vote_post(self, post_id, user_id, is_upvote):
+        response = await self.stub.VotePost(
+            self.vote_post_request(post_id, user_id, is_upvote))
+        if response.success:
+            return response.score
+        else:
+            return None
+
+    async def get_post_content(self, post_id):
+        response = await self.stub.GetPostContent(
+            reddit_pb2.GetPostContentRequest(post_id=post_id))
+        if response.success:
+            return self.post_to_dict(response.post)
+        else:
+            return None
+
+    async def get_posts(self, post_ids, batch_size=100):
+        responses = await asyncio.gather(*(
+            self.stub.BatchGetPosts(
+                reddit_pb2.BatchGetPostsRequest(post_ids=batch))
+            for batch in batched(post_ids, batch_size)))
+        return [post for response in responses
+                for post in self.post_results(response)]
+
+    async def get_comments(self, comment_ids, batch_size=100):
+        responses = await asyncio.gather(*(
+            self.stub.BatchGetComments(
+                reddit_pb2.BatchGetCommentsRequest(comment_ids=batch))
+            for batch in batched(comment_ids, batch_size)))
+        return [comment for response in responses
+                for comment in self.comment_results(response)]
+
+    async def create_comment(self, author_id, parent_post_id=None,
+                             parent_comment_id=None, text=None,
+                             comment_state=None):
+        response = await self.stub.CreateComment(self.comment_request(
+            author_id, parent_post_id, parent_comment_id, text,
+            comment_state))
+        if response.success:
+            return response.comment_id
+        else:
+            return None
+
+    async def vote_comment(self, comment_id, user_id, is_upvote):
+        response = await self.stub.VoteComment(
+            self.vote_comment_request(comment_id, user_id, is_upvote))
+        if response.success:
+            return response.score
+        else:
+            return None
+
+    async def vote_batch(self, post_votes=(), comment_votes=()):
+        response = await self.stub.BatchVote(
+            self.vote_batch_request(post_votes, comment_votes))
+        return self.vote_results(response)
+
+    async def stream_votes(self, post_votes=(), comment_votes=(),
+                           batch_size=1000):
+        response = await self.stub.StreamVotes(self.vote_batch_requests(
+            post_votes, comment_votes, batch_size))
+        return self.vote_results(response)
+
+    async def create_comments(self, comments):
+        response = await self.stub.BatchCreateComment(
+            self.create_comments_request(comments))
+        return self.comment_ids(response)
+
+    async def stream_create_comments(self, comments, batch_size=1000):
+        response = await self.stub.StreamCreateComments(
+            self.create_comments_request(batch)
+            for batch in batched(comments, batch_size))
+        return self.comment_ids(response)
+
+    async def get_most_upvoted_comments(self, post_id, n):
+        response = await self.stub.GetMostUpvotedComments(
+            reddit_pb2.GetMostUpvotedCommentsRequest(post_id=post_id, limit=n))
+        return self.most_upvoted_to_dicts(response)
+
+    async def expand_comment_branch(self, comment_id, n):
+        response = await self.stub.ExpandCommentBranch(
+            reddit_pb2.ExpandCommentBranchRequest(comment_id=comment_id,
+                                                  limit=n))
+        return self.branch_to_dicts(response)
+
+    async def expand_comment_tree(self, comment_id, max_depth, n=None,
+                                  level_limits=None, max_nodes=None):
+        response = await self.stub.ExpandCommentBranch(self.tree_request(
+            comment_id, max_depth, n, level_limits, max_nodes))
+        return self.trees_to_dicts(response.tree)
+
+    async def stream_comment_tree(self, comment_id, max_depth, n=None,
+                                  level_limits=None, max_nodes=None):
+        async for node in self.stub.StreamCommentTree(self.tree_request(
+                comment_id, max_depth, n, level_limits, max_nodes)):
+            yield self.node_to_dict(node)
+
+    async def get_post_thread(self, post_id, n, m):
+        response = await self.stub.GetPostThread(
+            reddit_pb2.GetPostThreadRequest(
+                post_id=post_id, limit=n, reply_limit=m))
+        return self.post_thread_to_dict(response)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='reddit client')
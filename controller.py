@@ -1,113 +1,798 @@
 import reddit_pb2
 import reddit_pb2_grpc
-from datetime import datetime
+import itertools
+import threading
+import time
+from array import array
+from votes import UserInterner, VoteStore, VoteBuffer, UPVOTE, DOWNVOTE
+from storage import PostStore, CommentStore, NO_ID, format_date, parse_date
+from ranking import ChildIndexFactory, ChildMap
+
+HIDDEN = reddit_pb2.CommentState.COMMENT_STATE_HIDDEN
+HIDDEN_POST = reddit_pb2.PostState.POST_STATE_HIDDEN
+
+
+class StripedLock:
+    """
+    A fixed pool of locks, an id is guarded by the lock of its stripe.
+    Operations on ids of different stripes never contend.
+    """
+
+    def __init__(self, stripes: int):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    def __getitem__(self, key: int):
+        return self.locks[key % len(self.locks)]
+
+    def group(self, keys):
+        """
+        Return (lock, [indexes in keys of the keys it guards]) for each
+        lock guarding one of the keys, in stripe order.
+        """
+        stripes = {}
+        for i, key in enumerate(keys):
+            stripes.setdefault(key % len(self.locks), []).append(i)
+        return [(self.locks[stripe], stripes[stripe])
+                for stripe in sorted(stripes)]
+
 
 class RedditNativeController:
+    """
+    In memory reddit storage, safe to share between server threads.
+
+    Posts and comments live in column stores (storage.py) and are only
+    turned into protobuf messages when they are returned. The children of
+    each post and comment are ranked by a child index (ranking.py),
+    ranking is "sorted" or "numpy".
+
+    Locking: post_locks guard a post's votes, score, comment_count and its
+    child index. comment_locks guard a comment's votes, score and
+    state. comment_children_locks guard a comment's child index and
+    comment_count. A thread holding a comment lock may take a post lock or
+    a comment_children lock, never the other way around, so the stripes
+    cannot deadlock.
+
+    Ids are the rows of the posts and comments in their stores, handed
+    out under the store's append lock, unless `ids` is an id allocator
+    (ids.py). Methods take and return ids; inside, everything (locks,
+    votes, child indexes, versions) is keyed by row. The *_ids() methods
+    return comment rows, for comment_bytes() and comments.to_message().
+
+    If self.log is set (a wal.WriteAheadLog), every change is appended to
+    it while the lock that orders it is held, and the call waits for the
+    log to be durable after releasing that lock.
+
+    With vote_flush_interval > 0, comment votes are coalesced: a vote is
+    recorded (and logged) at once, so double votes are still rejected
+    exactly, but its score change is buffered and applied to the score
+    and the child indexes together with the other votes on the comment,
+    once vote_batch votes are pending or at the latest after
+    vote_flush_interval seconds. The voter gets the score including the
+    pending votes; comments are returned and ranked by their applied
+    score. Post votes are applied at once: a post's score is a single
+    array entry, so there is nothing to save. close() stops the
+    background flusher.
+
+    With wire_cache, comment_bytes() keeps the serialized message of each
+    comment it returned until the comment changes.
+
+    post_version() and comment_version() change whenever the top comments
+    of a post, or the comment branch of a comment, may have changed, so
+    answers can be cached against them. Versions are striped like locks:
+    a change may also bump unrelated parents of the same stripe, which
+    only costs them a cache miss.
+    """
+
+    def __init__(self, lock_stripes: int = 64, ranking: str = 'sorted',
+                 numpy_threshold: int = 100_000, log=None,
+                 version_stripes: int = 1 << 16, wire_cache: bool = False,
+                 vote_flush_interval: float = 0.0, vote_batch: int = 256,
+                 ids=None):
+        self.ids = ids
+        self.users = UserInterner()
+        self.posts = PostStore(self.users, ids is None)
+        self.posts_votes = VoteStore()
+        self.comments = CommentStore(self.users, self.posts, ids is None)
+        self.comments_votes = VoteStore()
+        # parent -> index of its child comments ranked by score (ranking.py)
+        self.child_index = ChildIndexFactory(ranking, numpy_threshold)
+        self.post_children = ChildMap(
+            self.child_index, self.comments.score, self.comments.comment_state)
+        self.comment_children = ChildMap(
+            self.child_index, self.comments.score, self.comments.comment_state)
+        self.post_locks = StripedLock(lock_stripes)
+        self.comment_locks = StripedLock(lock_stripes)
+        self.comment_children_locks = StripedLock(lock_stripes)
+        self.log = log
+        # every bump stores a fresh value, so versions never repeat
+        self.version_clock = itertools.count(1)
+        self.post_versions = array('Q', bytes(8 * version_stripes))
+        self.comment_versions = array('Q', bytes(8 * version_stripes))
+        # comment row -> serialized Comment, if wire_cache
+        self.comment_wire = {} if wire_cache else None
+        self.comment_vote_buffer = None
+        self.closed = threading.Event()
+        self.vote_flusher = None
+        if vote_flush_interval > 0:
+            self.comment_vote_buffer = VoteBuffer(vote_batch)
+            self.comments.pending_votes = self.comment_vote_buffer
+            self.vote_flusher = threading.Thread(
+                target=self.flush_votes_periodically,
+                args=(vote_flush_interval,), daemon=True)
+            self.vote_flusher.start()
 
-    def __init__(self):
-        self.posts = {}
-        self.posts_votes = {}
-        self.comments = {}
-        self.comments_votes = {}
-        self.users = set()
-        self.post_count = 0
-        self.comment_count = 0
-
-    def create_post(self, post: reddit_pb2.Post):
-        post.post_id = self.post_count
+    def instrument(self, metrics):
+        """
+        Time the stages of answering calls in metrics (a metrics.Metrics):
+        'lookup' (post_row, comment_row), 'ranking' (top_children),
+        'message' (building Post and Comment messages from the columns)
+        and 'serialize' (comment_bytes). Stages may nest, comment_bytes
+        builds the message it serializes.
+        """
+        self.post_row = metrics.timed('lookup', self.post_row)
+        self.comment_row = metrics.timed('lookup', self.comment_row)
+        self.top_children = metrics.timed('ranking', self.top_children)
+        self.posts.to_message = metrics.timed(
+            'message', self.posts.to_message)
+        self.comments.to_message = metrics.timed(
+            'message', self.comments.to_message)
+        self.comment_bytes = metrics.timed('serialize', self.comment_bytes)
+
+    def post_version(self, post_id: int):
+        row = self.posts.row(post_id)
+        return self.post_versions[row % len(self.post_versions)]
+
+    def comment_version(self, comment_id: int):
+        row = self.comments.row(comment_id)
+        return self.comment_versions[row % len(self.comment_versions)]
+
+    def bump(self, versions: array, key: int):
+        versions[key % len(versions)] = next(self.version_clock)
+
+    def bump_versions(self, row: int, levels: int):
+        """
+        Bump the versions of the parents of a comment row, up to `levels`
+        levels above it. Called after the change is made.
+
+        A comment shows up in the answers of its parent and grandparent
+        (retrieve_comment_branch is two levels deep), so a change to the
+        comment itself needs 2 levels; a change to its visibility also
+        changes its parent's comment_count, which needs 3.
+        """
+        post_row = self.comments.parent_post_id[row]
+        if post_row != NO_ID:
+            self.bump(self.post_versions, post_row)
+        parent_row = self.comments.parent_comment_id[row]
+        if parent_row != NO_ID:
+            self.bump(self.comment_versions, parent_row)
+            if levels > 1:
+                self.bump_versions(parent_row, levels - 1)
+
+    def log_change(self, **change):
+        """Append a LogRecord to the log, return its sequence or 0"""
+        if self.log is None:
+            return 0
+        return self.log.append(reddit_pb2.LogRecord(**change))
+
+    def wait_durable(self, sequence: int):
+        if sequence:
+            self.log.sync(sequence)
+
+    def next_id(self):
+        """A new id from the allocator, None if ids are rows"""
+        if self.ids is None:
+            return None
+        return self.ids.next_id()
+
+    def create_post(self, post: reddit_pb2.Post, publication_time: float = None,
+                    post_id: int = None):
+        """
+        Create a post, with a new id unless post_id is given (when a
+        logged create is redone).
+        """
+        if publication_time is None:
+            publication_time = time.time()
+        if post_id is None:
+            post_id = self.next_id()
         post.score = 0
         if not post.HasField('post_state'):
             post.post_state = reddit_pb2.PostState.POST_STATE_NORMAL
-        post.publication_date = datetime.now().isoformat()
-        self.posts[self.post_count] = post
-        self.post_count += 1
-        self.posts_votes[post.post_id] = {
-            "upvote": set(), "downvote": set()
-        }
+        post.publication_date = format_date(publication_time)
+        post.comment_count = 0
+        with self.posts.lock:
+            post.post_id = self.posts.append(post, publication_time, post_id)
+            sequence = self.log_change(create_post=post)
+        self.wait_durable(sequence)
         return post
 
-    def create_comment(self, comment: reddit_pb2.Comment):
-        comment.comment_id = self.comment_count
+    def create_comment(self, comment: reddit_pb2.Comment,
+                       publication_time: float = None, comment_id: int = None):
+        """
+        Create a comment, with a new id unless comment_id is given (when
+        a logged create is redone). Return None, creating and logging
+        nothing, if a parent it names does not exist.
+        """
+        if publication_time is None:
+            publication_time = time.time()
+        if comment_id is None:
+            comment_id = self.next_id()
+        self.prepare_comment(comment, format_date(publication_time))
+        with self.comments.lock:
+            if not self.parents_exist(comment):
+                return None
+            # the new row's lock is taken before append() makes the row
+            # visible, so voters of this comment wait until it is in its
+            # parents' lists, and their votes are logged after its create
+            row = len(self.comments)
+            lock = self.comment_locks[row]
+            lock.acquire()
+            try:
+                comment.comment_id = self.comments.append(
+                    comment, publication_time, comment_id)
+                sequence = self.log_change(create_comment=comment)
+            except BaseException:
+                lock.release()
+                raise
+        try:
+            visible = comment.comment_state != HIDDEN
+            for parent_lock, children_map, store, parent_row in \
+                    self.parent_lists(row):
+                with parent_lock:
+                    self.add_child(children_map, parent_row, row, visible)
+                    if visible:
+                        self.update_comment_count(store, parent_row, 1)
+            self.bump_versions(row, 3)
+        finally:
+            lock.release()
+        self.wait_durable(sequence)
+        return comment
+
+    def create_comments(self, comments, publication_time: float = None):
+        """
+        Create comments as create_comment would, return them (None for
+        those whose parent does not exist). Their ids are assigned under
+        one hold of the append lock, the locks of the new comments are
+        taken once per stripe before any is appended, and each parent
+        list lock once for all the comments it receives; the call waits
+        once for the log.
+        """
+        if publication_time is None:
+            publication_time = time.time()
+        date = format_date(publication_time)
+        comment_ids = [self.next_id() for _ in comments]
+        for comment in comments:
+            self.prepare_comment(comment, date)
+        results = [None] * len(comments)
+        with self.comments.lock:
+            # the locks of every row the batch may take are held before
+            # the first is appended, as in create_comment; several stripes
+            # are held at once, so they are taken in order
+            first = len(self.comments)
+            locks = [lock for lock, _ in self.comment_locks.group(
+                range(first, first + len(comments)))]
+            for lock in locks:
+                lock.acquire()
+            try:
+                sequence = 0
+                created = []
+                rows = []
+                # a parent may be created earlier in the batch
+                for i, (comment, comment_id) in enumerate(
+                        zip(comments, comment_ids)):
+                    if not self.parents_exist(comment):
+                        continue
+                    comment.comment_id = self.comments.append(
+                        comment, publication_time, comment_id)
+                    results[i] = comment
+                    created.append(comment)
+                    rows.append(len(self.comments) - 1)
+                    sequence = self.log_change(create_comment=comment)
+            except BaseException:
+                for lock in locks:
+                    lock.release()
+                raise
+        try:
+            additions = {}
+            for comment, row in zip(created, rows):
+                for parent_lock, children_map, store, parent_row in \
+                        self.parent_lists(row):
+                    additions.setdefault(parent_lock, []).append(
+                        (children_map, store, parent_row, comment, row))
+            for parent_lock, children in additions.items():
+                with parent_lock:
+                    for children_map, store, parent_row, comment, row in \
+                            children:
+                        visible = comment.comment_state != HIDDEN
+                        self.add_child(children_map, parent_row, row, visible)
+                        if visible:
+                            self.update_comment_count(store, parent_row, 1)
+            for row in rows:
+                self.bump_versions(row, 3)
+        finally:
+            for lock in locks:
+                lock.release()
+        self.wait_durable(sequence)
+        return results
+
+    def parents_exist(self, comment: reddit_pb2.Comment):
+        """Whether the parents a new comment names exist"""
+        try:
+            self.comments.parent_rows(comment)
+        except ValueError:
+            return False
+        return True
+
+    def prepare_comment(self, comment: reddit_pb2.Comment, date: str):
+        """Set the fields of a new comment that are not given by its author"""
         if not comment.HasField('comment_state'):
             comment.comment_state = reddit_pb2.CommentState.COMMENT_STATE_NORMAL
-        comment.publication_date = datetime.now().isoformat()
-        self.comments[self.comment_count] = comment
-        self.comment_count += 1
-        self.comments_votes[comment.comment_id] = {
-            "upvote": set(), "downvote": set()
-        }
-        return comment
+        comment.publication_date = date
+        comment.comment_count = 0
+
+    def add_child(self, children_map, parent_row: int, row: int,
+                  visible: bool):
+        """
+        Rank a new comment under its parent.
+        The caller holds the lock of the parent's child list.
+        """
+        children = children_map.get(parent_row, None)
+        if children is None:
+            children = self.child_index.new()
+        children.add(row, self.comments.score[row], visible)
+        children_map[parent_row] = self.child_index.grow(
+            children, self.comments.comment_state)
+
+    def parent_lists(self, row: int):
+        """
+        Return (lock, parent row -> child index, parent store, parent row)
+        for each parent of a comment row. The child index must be looked
+        up while holding the lock, as add_child may replace it.
+        """
+        result = []
+        post_row = self.comments.parent_post_id[row]
+        if post_row != NO_ID:
+            result.append((self.post_locks[post_row],
+                           self.post_children, self.posts, post_row))
+        parent_row = self.comments.parent_comment_id[row]
+        if parent_row != NO_ID:
+            result.append((self.comment_children_locks[parent_row],
+                           self.comment_children, self.comments, parent_row))
+        return result
+
+    def update_comment_count(self, store, parent_row: int, delta: int):
+        """
+        Add delta to the comment_count of a parent post or comment.
+        comment_count is the number of visible direct sub comments.
+        The caller holds the lock of the parent's child list.
+        """
+        store.comment_count[parent_row] += delta
+        if store is self.comments:
+            self.forget_comment_bytes(parent_row)
+
+    def set_comment_state(self, comment_id: int, state: reddit_pb2.CommentState):
+        """
+        Change the state of a comment (e.g. hide or unhide it),
+        return False if comment_id not exists
+        """
+        row = self.comments.row(comment_id)
+        if row == NO_ID:
+            return False
+        with self.comment_locks[row]:
+            was_hidden = self.comments.comment_state[row] == HIDDEN
+            is_hidden = state == HIDDEN
+            self.comments.comment_state[row] = state
+            self.forget_comment_bytes(row)
+            sequence = self.log_change(update_comment=reddit_pb2.Comment(
+                comment_id=comment_id, comment_state=state))
+            if was_hidden != is_hidden:
+                for lock, children_map, store, parent_row in \
+                        self.parent_lists(row):
+                    with lock:
+                        children_map[parent_row].set_visible(
+                            row, not is_hidden)
+                        self.update_comment_count(
+                            store, parent_row, -1 if is_hidden else 1)
+            # the comment's own branch appears or disappears too
+            self.bump(self.comment_versions, row)
+            self.bump_versions(row, 3)
+        self.wait_durable(sequence)
+        return True
+
+    def set_comment_score(self, comment_id: int, score: int):
+        """
+        Update the score of a comment and reposition it among its siblings,
+        return False if comment_id not exists
+        """
+        row = self.comments.row(comment_id)
+        if row == NO_ID:
+            return False
+        with self.comment_locks[row]:
+            if self.comment_vote_buffer is not None:
+                # the new score replaces the pending votes too
+                self.comment_vote_buffer.take(row)
+            self.reposition_comment(row, score)
+            self.bump_versions(row, 2)
+            sequence = self.log_change(update_comment=reddit_pb2.Comment(
+                comment_id=comment_id, score=score))
+        self.wait_durable(sequence)
+        return True
+
+    def reposition_comment(self, row: int, score: int):
+        """
+        Set the score of a comment row and move it in its parents' child
+        lists. The caller holds the comment's lock.
+        """
+        old_score = self.comments.score[row]
+        for lock, children_map, _, parent_row in self.parent_lists(row):
+            with lock:
+                children_map[parent_row].move(row, old_score, score)
+        self.comments.score[row] = score
+        self.forget_comment_bytes(row)
+
+    def top_children(self, lock, children_map, parent_row: int, n: int):
+        """Return the rows of the n best visible child comments of a parent"""
+        with lock:
+            children = children_map.get(parent_row, None)
+            if children is None:
+                return []
+            return children.top(n, self.comments.comment_state)
+
+    def has_sub_comment(self, row: int):
+        """Return True if the comment has at least one visible sub comment"""
+        return self.comments.comment_count[row] > 0
+
+    def post_row(self, post_id: int):
+        """Row of a visible post, NO_ID if it is hidden or does not exist"""
+        row = self.posts.row(post_id)
+        if row == NO_ID or self.posts.post_state[row] == HIDDEN_POST:
+            return NO_ID
+        return row
+
+    def comment_row(self, comment_id: int):
+        """Row of a visible comment, NO_ID if it is hidden or does not exist"""
+        row = self.comments.row(comment_id)
+        if row == NO_ID or self.comments.comment_state[row] == HIDDEN:
+            return NO_ID
+        return row
+
+    def post_visible(self, post_id: int):
+        return self.post_row(post_id) != NO_ID
+
+    def comment_visible(self, comment_id: int):
+        return self.comment_row(comment_id) != NO_ID
 
     def get_post(self, post_id: int):
         """Return the post object if post_id exists, otherwise return None"""
-        post = self.posts.get(post_id, None)
-        if post is None:
+        row = self.post_row(post_id)
+        if row == NO_ID:
             return None
-        if post.post_state == reddit_pb2.PostState.POST_STATE_HIDDEN:
-            return None
-        return post
+        return self.posts.to_message(row)
 
     def get_comment(self, comment_id: int):
         """Return the comment object if comment_id exists, otherwise return None"""
-
-        comment = self.comments.get(comment_id, None)
-        if comment is None:
-            return None
-        if comment.comment_state == reddit_pb2.CommentState.COMMENT_STATE_HIDDEN:
+        row = self.comment_row(comment_id)
+        if row == NO_ID:
             return None
-        return comment
+        return self.comments.to_message(row)
+
+    def comment_bytes(self, row: int):
+        """Return the serialized Comment message of a comment row"""
+        cache = self.comment_wire
+        if cache is None:
+            return self.comments.to_message(row).SerializeToString()
+        data = cache.get(row, None)
+        if data is None:
+            # the locks guarding the score, state and comment_count, so the
+            # bytes cannot be cached after a change already forgot them
+            with self.comment_locks[row], self.comment_children_locks[row]:
+                data = self.comments.to_message(row).SerializeToString()
+                cache[row] = data
+        return data
+
+    def forget_comment_bytes(self, row: int):
+        """
+        Drop the cached bytes of a changed comment.
+        The caller holds the lock guarding the changed field.
+        """
+        if self.comment_wire is not None:
+            self.comment_wire.pop(row, None)
 
     def vote_post(self, post_id: int, user_id: str, is_upvote: bool):
         """
         Vote a post, return True if success, 
         False if user_id already voted or post_id not exists
         """
-        post = self.get_post(post_id)
-        if post is None:
+        row = self.post_row(post_id)
+        if row == NO_ID:
             return False, 0
-        if is_upvote:
-            if user_id in self.posts_votes[post_id]["upvote"]:
-                return False, 0
-            if user_id in self.posts_votes[post_id]["downvote"]:
-                self.posts_votes[post_id]["downvote"].remove(user_id)
-                post.score += 1
-            self.posts_votes[post_id]["upvote"].add(user_id)
-            post.score += 1
-        else:
-            if user_id in self.posts_votes[post_id]["downvote"]:
-                return False, 0
-            if user_id in self.posts_votes[post_id]["upvote"]:
-                self.posts_votes[post_id]["upvote"].remove(user_id)
-                post.score -= 1
-            self.posts_votes[post_id]["downvote"].add(user_id)
-            post.score -= 1
-        return True, post.score
+        with self.post_locks[row]:
+            success, score, sequence = self.record_post_vote(
+                row, user_id, is_upvote)
+        self.wait_durable(sequence)
+        return success, score
+
+    def record_post_vote(self, row: int, user_id: str, is_upvote: bool):
+        """
+        Record a vote on a post row, return (success, score, log
+        sequence). The caller holds the post's lock; the post is checked
+        to be visible again under it, so no vote is logged after a hide.
+        """
+        if self.posts.post_state[row] == HIDDEN_POST:
+            return False, 0, 0
+        handle = self.users.intern(user_id)
+        vote = UPVOTE if is_upvote else DOWNVOTE
+        previous = self.posts_votes.get(row, handle)
+        if previous == vote:
+            return False, 0, 0
+        self.posts_votes.set(row, handle, vote)
+        score = self.posts.score[row] + vote - previous
+        self.posts.score[row] = score
+        sequence = self.log_change(vote_post=reddit_pb2.VotePostRequest(
+            post_id=self.posts.id_of(row),
+            user=reddit_pb2.User(user_id=user_id), is_upvote=is_upvote))
+        return True, score, sequence
 
     def vote_comment(self, comment_id: int, user_id: str, is_upvote: bool):
         """
         Vote a comment, return True if success,
         False if user_id already voted or comment_id not exists
         """
-        comment = self.get_comment(comment_id)
-        if comment is None:
+        row = self.comment_row(comment_id)
+        if row == NO_ID:
             return False, 0
-        if is_upvote:
-            if user_id in self.comments_votes[comment_id]["upvote"]:
-                return False, 0
-            if user_id in self.comments_votes[comment_id]["downvote"]:
-                self.comments_votes[comment_id]["downvote"].remove(user_id)
-                comment.score += 1
-            self.comments_votes[comment_id]["upvote"].add(user_id)
-            comment.score += 1
+        with self.comment_locks[row]:
+            success, score, sequence = self.record_comment_vote(
+                row, user_id, is_upvote)
+        self.wait_durable(sequence)
+        return success, score
+
+    def record_comment_vote(self, row: int, user_id: str, is_upvote: bool):
+        """
+        Record a vote on a comment row, return (success, score, log
+        sequence). The caller holds the comment's lock, which also guards
+        its state: a comment hidden since the caller looked it up gets no
+        vote, as replaying the log would not apply one either.
+        """
+        if self.comments.comment_state[row] == HIDDEN:
+            return False, 0, 0
+        handle = self.users.intern(user_id)
+        vote = UPVOTE if is_upvote else DOWNVOTE
+        previous = self.comments_votes.get(row, handle)
+        if previous == vote:
+            return False, 0, 0
+        self.comments_votes.set(row, handle, vote)
+        if self.comment_vote_buffer is None:
+            score = self.comments.score[row] + vote - previous
+            self.reposition_comment(row, score)
+            self.bump_versions(row, 2)
         else:
-            if user_id in self.comments_votes[comment_id]["downvote"]:
-                return False, 0
-            if user_id in self.comments_votes[comment_id]["upvote"]:
-                self.comments_votes[comment_id]["upvote"].remove(user_id)
-                comment.score -= 1
-            self.comments_votes[comment_id]["downvote"].add(user_id)
-            comment.score -= 1
-        return True, comment.score
+            pending, full = self.comment_vote_buffer.add(row, vote - previous)
+            score = self.comments.score[row] + pending
+            if full:
+                self.apply_comment_votes(row)
+            else:
+                # messages show the pending score, rankings wait for it
+                self.forget_comment_bytes(row)
+                self.bump_versions(row, 2)
+        sequence = self.log_change(
+            vote_comment=reddit_pb2.VoteCommentRequest(
+                comment_id=self.comments.id_of(row),
+                user=reddit_pb2.User(user_id=user_id),
+                is_upvote=is_upvote))
+        return True, score, sequence
+
+    def vote_posts(self, votes):
+        """
+        Apply (post_id, user_id, is_upvote) votes in order, return the
+        (success, score) of each as vote_post would.
+        """
+        return self.record_votes(votes, self.post_locks, self.post_row,
+                                 self.record_post_vote)
+
+    def vote_comments(self, votes):
+        """
+        Apply (comment_id, user_id, is_upvote) votes in order, return the
+        (success, score) of each as vote_comment would.
+        """
+        return self.record_votes(votes, self.comment_locks, self.comment_row,
+                                 self.record_comment_vote)
+
+    def record_votes(self, votes, locks: StripedLock, visible_row, record):
+        """
+        Record a batch of votes taking each lock stripe once, for all the
+        votes on the items it guards, and wait once for the log. Votes on
+        one item keep their order.
+        """
+        votes = list(votes)
+        rows = [visible_row(vote[0]) for vote in votes]
+        results = [(False, 0)] * len(votes)
+        last_sequence = 0
+        for lock, indexes in locks.group(rows):
+            with lock:
+                for i in indexes:
+                    if rows[i] != NO_ID:
+                        _, user_id, is_upvote = votes[i]
+                        success, score, sequence = record(
+                            rows[i], user_id, is_upvote)
+                        results[i] = success, score
+                        last_sequence = max(last_sequence, sequence)
+        self.wait_durable(last_sequence)
+        return results
+
+    def apply_comment_votes(self, row: int):
+        """
+        Apply the buffered votes of a comment row to its score and rank.
+        The caller holds the comment's lock.
+        """
+        delta = self.comment_vote_buffer.take(row)
+        if delta:
+            self.reposition_comment(row, self.comments.score[row] + delta)
+            self.bump_versions(row, 2)
+
+    def flush_votes(self):
+        """Apply every buffered vote"""
+        if self.comment_vote_buffer is None:
+            return
+        for row in self.comment_vote_buffer.item_ids():
+            with self.comment_locks[row]:
+                self.apply_comment_votes(row)
+
+    def flush_votes_periodically(self, interval: float):
+        while not self.closed.wait(interval):
+            self.flush_votes()
+
+    def close(self):
+        """Stop the vote flusher and apply the votes it left behind"""
+        self.closed.set()
+        if self.vote_flusher is not None:
+            self.vote_flusher.join()
+        self.flush_votes()
+
+    def apply_record(self, record: reddit_pb2.LogRecord):
+        """Redo a change read back from the log"""
+        change = record.WhichOneof('mutation')
+        if change == 'create_post':
+            post = reddit_pb2.Post()
+            post.CopyFrom(record.create_post)
+            self.redo_create(record, post.post_id, lambda: self.create_post(
+                post, parse_date(post.publication_date), post.post_id))
+        elif change == 'create_comment':
+            comment = reddit_pb2.Comment()
+            comment.CopyFrom(record.create_comment)
+            self.redo_create(record, comment.comment_id,
+                             lambda: self.create_comment(
+                                 comment, parse_date(comment.publication_date),
+                                 comment.comment_id))
+        elif change == 'vote_post':
+            vote = record.vote_post
+            self.vote_post(vote.post_id, vote.user.user_id, vote.is_upvote)
+        elif change == 'vote_comment':
+            vote = record.vote_comment
+            self.vote_comment(
+                vote.comment_id, vote.user.user_id, vote.is_upvote)
+        elif change == 'update_comment':
+            update = record.update_comment
+            if update.HasField('comment_state'):
+                self.set_comment_state(update.comment_id, update.comment_state)
+            if update.HasField('score'):
+                self.set_comment_score(update.comment_id, update.score)
+
+    def redo_create(self, record: reddit_pb2.LogRecord, item_id: int,
+                    create):
+        """
+        Run create() for a logged create of item_id, raise ValueError if
+        the id or a parent does not fit the data (the log does not follow
+        it).
+        """
+        try:
+            if create() is None:
+                raise ValueError(f"parent of {item_id} does not exist")
+        except ValueError:
+            raise ValueError(
+                f"log record {record.sequence} is out of order") from None
+        if self.ids is not None:
+            self.ids.advance(item_id)
+
+    def reserve_ids(self):
+        """
+        Make the id allocator hand out ids after every id in the stores,
+        e.g. after loading them from a snapshot or dataset.
+        """
+        if self.ids is not None:
+            self.ids.advance(max(self.posts.max_id(), self.comments.max_id()))
+
+    def top_comment_ids(self, post_id: int, n: int):
+        """
+        Rows of the n most upvoted visible comments under a post,
+        return a list of (comment row, has_sub_comment)
+        """
+        post_row = self.post_row(post_id)
+        if post_row == NO_ID:
+            return []
+        rows = self.top_children(
+            self.post_locks[post_row], self.post_children, post_row, n)
+        return [(row, self.has_sub_comment(row)) for row in rows]
+
+    def comment_branch_ids(self, comment_id: int, n: int):
+        """
+        Rows of the top n sub comments of a comment and of their top n
+        sub comments, return a list of (sub row, [sub sub row])
+        """
+        row = self.comment_row(comment_id)
+        if row == NO_ID:
+            return []
+        sub_rows = self.top_children(
+            self.comment_children_locks[row], self.comment_children, row, n)
+        return [(sub_row, self.top_children(
+                    self.comment_children_locks[sub_row],
+                    self.comment_children, sub_row, n))
+                for sub_row in sub_rows]
+
+    def comment_tree_ids(self, comment_id: int, max_depth: int,
+                         level_limits=(), default_limit: int = 0,
+                         max_nodes: int = None):
+        """
+        Yield (parent row, comment row, has_sub_comment, depth) for the
+        sub comments of a comment, breadth first, up to max_depth levels
+        below it (the direct sub comments are at depth 1).
+        Level i keeps the level_limits[i] (or default_limit) best sub
+        comments of each comment of level i - 1, best parents first, and
+        the walk stops after max_nodes comments. The parent row is None
+        for the comment's direct sub comments.
+        """
+        row = self.comment_row(comment_id)
+        if row == NO_ID:
+            return iter(())
+        return self.walk_tree(
+            self.comment_children_locks[row], self.comment_children,
+            row, max_depth, level_limits, default_limit, max_nodes)
+
+    def post_tree_ids(self, post_id: int, max_depth: int, level_limits=(),
+                      default_limit: int = 0, max_nodes: int = None):
+        """comment_tree_ids() for the comments under a post"""
+        row = self.post_row(post_id)
+        if row == NO_ID:
+            return iter(())
+        return self.walk_tree(
+            self.post_locks[row], self.post_children, row,
+            max_depth, level_limits, default_limit, max_nodes)
+
+    def walk_tree(self, lock, children_map, root_row: int, max_depth: int,
+                  level_limits, default_limit: int, max_nodes: int):
+        """
+        Generator behind comment_tree_ids() and post_tree_ids(). Besides the
+        rows being walked it only keeps the rows of the comments of the
+        current and next level that have sub comments.
+        """
+        remaining = max_nodes
+        level = None
+        depth = 0
+        while depth < max_depth:
+            limit = level_limits[depth] if depth < len(level_limits) \
+                else default_limit
+            depth += 1
+            if level is None:
+                parents = [(None, lock, children_map, root_row)]
+            else:
+                parents = ((parent_id, self.comment_children_locks[parent_id],
+                            self.comment_children, parent_id)
+                           for parent_id in level)
+            level = array('q')
+            for parent_id, lock, children_map, key in parents:
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    limit = min(limit, remaining)
+                for child_id in self.top_children(
+                        lock, children_map, key, limit):
+                    has_sub_comment = self.has_sub_comment(child_id)
+                    yield parent_id, child_id, has_sub_comment, depth
+                    if has_sub_comment:
+                        level.append(child_id)
+                    if remaining is not None:
+                        remaining -= 1
+            if not level:
+                return
 
     def retrieve_n_most_upvoted_comment(self, post_id: int, n: int):
         """
@@ -115,27 +800,8 @@ class RedditNativeController:
         hidden comments are ignored,
         return a list of (comment, has_sub_comment)
         """
-        post = self.get_post(post_id)
-        if post is None:
-            return []
-        comments = []
-        for comment in self.comments.values():
-            if comment.HasField("parent_post_id") and comment.parent_post_id == post_id:
-                if comment.comment_state == reddit_pb2.CommentState.COMMENT_STATE_HIDDEN:
-                    continue
-                comments.append(comment)
-        comments = sorted(comments, key=lambda x: x.score, reverse=True)[:n]
-        result = []
-        for comment in comments:
-            has_sub_comment = False
-            for sub_comment in self.comments.values():
-                if sub_comment.HasField("parent_post_id") and sub_comment.parent_comment_id == comment.comment_id:
-                    if sub_comment.comment_state == reddit_pb2.CommentState.COMMENT_STATE_HIDDEN:
-                        continue
-                    has_sub_comment = True
-                    break
-            result.append((comment, has_sub_comment))
-        return result
+        return [(self.comments.to_message(row), has_sub_comment)
+                for row, has_sub_comment in self.top_comment_ids(post_id, n)]
 
     def retrieve_comment_branch(self, comment_id: int, n: int):
         """
@@ -149,30 +815,12 @@ class RedditNativeController:
 
         The result is a 2-level comment tree.
         """
-        comment = self.get_comment(comment_id)
-        if comment is None:
-            return []
-        sub_comments = []
-        for comment in self.comments.values():
-            if comment.HasField('parent_comment_id') and comment.parent_comment_id == comment_id:
-                if comment.comment_state == reddit_pb2.CommentState.COMMENT_STATE_HIDDEN:
-                    continue
-                sub_comments.append(comment)
-        sub_comments = sorted(
-            sub_comments, key=lambda x: x.score, reverse=True)[:n]
         result = []
-        for sub in sub_comments:
-            sub_sub_comments = []
-            for subsub in self.comments.values():
-                if subsub.HasField('parent_comment_id') and subsub.parent_comment_id == sub.comment_id:
-                    if subsub.comment_state == reddit_pb2.CommentState.COMMENT_STATE_HIDDEN:
-                        continue
-                    sub_sub_comments.append(subsub)
-            sub_sub_comments.sort(key=lambda x: x.score, reverse=True)
-            sub_sub_comments = sub_sub_comments[:n]
+        for sub_row, sub_sub_rows in self.comment_branch_ids(comment_id, n):
             result.append({
-                "sub_comment": sub,
-                "sub_sub_comments": sub_sub_comments
+                "sub_comment": self.comments.to_message(sub_row),
+                "sub_sub_comments": [self.comments.to_message(subsub_row)
+                                     for subsub_row in sub_sub_rows]
             })
         return result
 
@@ -268,7 +916,7 @@ class RedditNativeController:
             parent_post_id=p0.post_id,
             comment_state=reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
         self.create_comment(hidden_comment)
-        hidden_comment.score = 100
+        self.set_comment_score(hidden_comment.comment_id, 100)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,366 @@
+import argparse
+import bisect
+import itertools
+import json
+import random
+import time
+from array import array
+
+from google.protobuf import json_format
+
+import reddit_pb2
+from storage import NO_ID, format_date, parse_date
+from votes import UPVOTE, DOWNVOTE
+from wire import encode_varint
+
+HIDDEN = reddit_pb2.CommentState.COMMENT_STATE_HIDDEN
+
+# Datasets are streams of LogRecords (create_post, create_comment,
+# vote_post, vote_comment, update_comment), either one JSON object per line
+# (a .jsonl file) or each record prefixed with its varint length.
+
+
+def read_records(path: str):
+    """Yield the LogRecords of a dataset file"""
+    if path.endswith('.jsonl'):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json_format.Parse(line, reddit_pb2.LogRecord())
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        length = shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            length |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        yield reddit_pb2.LogRecord.FromString(data[offset:offset + length])
+        offset += length
+
+
+def write_records(path: str, records):
+    """Write LogRecords to a dataset file, return the number written"""
+    count = 0
+    if path.endswith('.jsonl'):
+        with open(path, 'w') as f:
+            for count, record in enumerate(records, 1):
+                f.write(json.dumps(json_format.MessageToDict(
+                    record, preserving_proto_field_name=True)))
+                f.write('\n')
+        return count
+    with open(path, 'wb') as f:
+        for count, record in enumerate(records, 1):
+            data = record.SerializeToString()
+            f.write(encode_varint(len(data)))
+            f.write(data)
+    return count
+
+
+class BulkLoader:
+    """
+    Fill an empty controller straight from records, without the locks,
+    logging and per-comment ranking of create_*/vote_*. Rows and votes are
+    appended as they come; comment counts and the child lists of every
+    parent are computed once by finish(), and a parent's child index is
+    only built when it is first read (ranking.ChildMap).
+
+    Unlike create_*, scores in the records are kept, votes are added to
+    them. So are the ids in the records, which must be the next row of
+    their table when the controller has no id allocator; records without
+    one get a new id.
+    """
+
+    def __init__(self, reddit_controller):
+        if len(reddit_controller.posts) or len(reddit_controller.comments):
+            raise ValueError("bulk loading needs an empty controller")
+        self.controller = reddit_controller
+        self.count = 0
+
+    def add(self, record: reddit_pb2.LogRecord):
+        self.count += 1
+        change = record.WhichOneof('mutation')
+        controller = self.controller
+        if change == 'create_post':
+            post = record.create_post
+            if not post.HasField('post_state'):
+                post.post_state = reddit_pb2.PostState.POST_STATE_NORMAL
+            self.append(controller.posts, post, 'post_id')
+        elif change == 'create_comment':
+            comment = record.create_comment
+            if not comment.HasField('comment_state'):
+                comment.comment_state = \
+                    reddit_pb2.CommentState.COMMENT_STATE_NORMAL
+            self.append(controller.comments, comment, 'comment_id')
+        elif change == 'vote_post':
+            vote = record.vote_post
+            self.vote(controller.posts, controller.posts_votes,
+                      vote.post_id, vote.user.user_id, vote.is_upvote)
+        elif change == 'vote_comment':
+            vote = record.vote_comment
+            self.vote(controller.comments, controller.comments_votes,
+                      vote.comment_id, vote.user.user_id, vote.is_upvote)
+        elif change == 'update_comment':
+            update = record.update_comment
+            row = self.row(controller.comments, update.comment_id)
+            if update.HasField('comment_state'):
+                controller.comments.comment_state[row] = update.comment_state
+            if update.HasField('score'):
+                controller.comments.score[row] = update.score
+
+    def append(self, store, message, field: str):
+        item_id = getattr(message, field) if message.HasField(field) \
+            else self.controller.next_id()
+        try:
+            store.append(message, self.publication_time(message), item_id)
+        except ValueError as error:
+            raise ValueError(f"record {self.count}: {error}") from None
+
+    def row(self, store, item_id: int):
+        row = store.row(item_id)
+        if row == NO_ID:
+            raise ValueError(f"record {self.count}: no id {item_id}")
+        return row
+
+    def publication_time(self, message):
+        if message.publication_date:
+            return parse_date(message.publication_date)
+        return time.time()
+
+    def vote(self, store, votes, item_id: int, user_id: str, is_upvote: bool):
+        row = self.row(store, item_id)
+        handle = self.controller.users.intern(user_id)
+        vote = UPVOTE if is_upvote else DOWNVOTE
+        previous = votes.get(row, handle)
+        if previous != vote:
+            votes.set(row, handle, vote)
+            store.score[row] += vote - previous
+
+    def finish(self):
+        """
+        Count the visible children of every parent and rank them, and
+        make the id allocator (if any) hand out ids after the loaded ones.
+        """
+        controller = self.controller
+        comments = controller.comments
+        for column, store, children_map in (
+                (comments.parent_post_id, controller.posts,
+                 controller.post_children),
+                (comments.parent_comment_id, comments,
+                 controller.comment_children)):
+            counts = store.comment_count
+            # comment rows grouped by parent, in rank order within a parent
+            order = sorted((row for row in range(len(comments))
+                            if column[row] != NO_ID),
+                           key=lambda row: (column[row], -comments.score[row],
+                                            row))
+            parents = array('q')
+            offsets = array('Q', [0])
+            children = array('q', order)
+            for offset, row in enumerate(order):
+                parent_row = column[row]
+                if not parents or parents[-1] != parent_row:
+                    if parents:
+                        offsets.append(offset)
+                    parents.append(parent_row)
+                if comments.comment_state[row] != HIDDEN:
+                    counts[parent_row] += 1
+            if parents:
+                offsets.append(len(order))
+            children_map.load_base(parents, offsets, children)
+        controller.reserve_ids()
+        return controller
+
+
+def load(reddit_controller, records):
+    """Bulk load records into an empty controller, return the controller"""
+    loader = BulkLoader(reddit_controller)
+    for record in records:
+        loader.add(record)
+    return loader.finish()
+
+
+def split(records, shard: int, shards: int):
+    """
+    Yield the records of one shard of a router.py deployment of `shards`
+    shards with row ids: posts are dealt to the shards in turn, as the
+    router deals new posts, and comments, votes and updates go to the
+    shard of their post. Ids are rewritten to the rows of the shard, so
+    through the router the item of row `local` of shard s has the id
+    local * shards + s (the posts of generate() keep theirs). Every
+    shard needs a pass over all the records.
+    """
+    # dataset id -> global id of the post or comment
+    post_ids = {}
+    comment_ids = {}
+    # the item a vote or update is about
+    targets = {'vote_post': (post_ids, 'post_id'),
+               'vote_comment': (comment_ids, 'comment_id'),
+               'update_comment': (comment_ids, 'comment_id')}
+    rows = {'post': [0] * shards, 'comment': [0] * shards}
+    dealt = itertools.count()
+
+    def global_id(ids, item_id, count):
+        try:
+            return ids[item_id]
+        except KeyError:
+            raise ValueError(f"record {count}: no id {item_id}") from None
+
+    def add(kind, ids, message, field, owner):
+        local = rows[kind][owner]
+        rows[kind][owner] += 1
+        if message.HasField(field):
+            ids[getattr(message, field)] = local * shards + owner
+        if owner == shard:
+            setattr(message, field, local)
+            return True
+        return False
+
+    for count, record in enumerate(records, 1):
+        change = record.WhichOneof('mutation')
+        if change == 'create_post':
+            if add('post', post_ids, record.create_post, 'post_id',
+                   next(dealt) % shards):
+                yield record
+        elif change == 'create_comment':
+            comment = record.create_comment
+            # on the shard of its parent comment, else of its post, as
+            # the router places it; without either it is dealt like a post
+            owner = None
+            for field, ids in (('parent_comment_id', comment_ids),
+                               ('parent_post_id', post_ids)):
+                if comment.HasField(field):
+                    parent = global_id(ids, getattr(comment, field), count)
+                    setattr(comment, field, parent // shards)
+                    if owner is None:
+                        owner = parent % shards
+            if owner is None:
+                owner = next(dealt) % shards
+            if add('comment', comment_ids, comment, 'comment_id', owner):
+                yield record
+        elif change in targets:
+            ids, field = targets[change]
+            message = getattr(record, change)
+            item_id = global_id(ids, getattr(message, field), count)
+            if item_id % shards == shard:
+                setattr(message, field, item_id // shards)
+                yield record
+
+
+class Zipf:
+    """Draw ranks in [0, n) with P(rank k) proportional to 1 / (k + 1) ** s"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(
+            1 / (k + 1) ** s for k in range(n)))
+
+    def __call__(self):
+        return bisect.bisect_left(self.cumulative,
+                                  self.rng.random() * self.cumulative[-1])
+
+
+def generate(posts: int, comments: int, votes: int, users: int = 100_000,
+             seed: int = 0, reply_ratio: float = 0.7, post_skew: float = 1.1,
+             vote_skew: float = 1.0, start_time: float = 1_672_531_200.0):
+    """
+    Yield the records of a synthetic dataset: post popularity follows a
+    Zipf law, comments reply to recent comments of the same post (so
+    popular posts grow deep trees), and votes per post and comment follow
+    a power law.
+    """
+    rng = random.Random(seed)
+    user_rank = Zipf(users, 1.0, rng)
+    date = start_time
+    for post_id in range(posts):
+        date += rng.expovariate(1.0)
+        yield reddit_pb2.LogRecord(create_post=reddit_pb2.Post(
+            post_id=post_id, title=f"post {post_id}",
+            text=f"post {post_id} " + "x" * rng.randrange(200),
+            author=reddit_pb2.User(user_id=f"user{user_rank()}"),
+            publication_date=format_date(date)))
+    post_rank = Zipf(posts, post_skew, rng)
+    thread = [[] for _ in range(posts)]
+    for comment_id in range(comments):
+        date += rng.expovariate(10.0)
+        post_id = post_rank()
+        comment = reddit_pb2.Comment(
+            comment_id=comment_id,
+            text=f"comment {comment_id} " + "x" * rng.randrange(20, 120),
+            author=reddit_pb2.User(user_id=f"user{user_rank()}"),
+            publication_date=format_date(date))
+        siblings = thread[post_id]
+        if siblings and rng.random() < reply_ratio:
+            # mostly answer one of the latest comments, which makes chains
+            back = min(int(rng.expovariate(0.3)), len(siblings) - 1)
+            comment.parent_comment_id = siblings[-1 - back]
+        else:
+            comment.parent_post_id = post_id
+        siblings.append(comment_id)
+        if rng.random() < 0.002:
+            comment.comment_state = HIDDEN
+        yield reddit_pb2.LogRecord(create_comment=comment)
+    del thread
+    # a random permutation of ids, so the most voted items are spread out
+    post_order = list(range(posts))
+    comment_order = list(range(comments))
+    rng.shuffle(post_order)
+    rng.shuffle(comment_order)
+    post_votes = Zipf(posts, vote_skew, rng)
+    comment_votes = Zipf(comments, vote_skew, rng) if comments else None
+    for _ in range(votes):
+        user = reddit_pb2.User(user_id=f"user{rng.randrange(users)}")
+        is_upvote = rng.random() < 0.8
+        if comment_votes is None or rng.random() < 0.2:
+            yield reddit_pb2.LogRecord(vote_post=reddit_pb2.VotePostRequest(
+                post_id=post_order[post_votes()], user=user,
+                is_upvote=is_upvote))
+        else:
+            yield reddit_pb2.LogRecord(
+                vote_comment=reddit_pb2.VoteCommentRequest(
+                    comment_id=comment_order[comment_votes()], user=user,
+                    is_upvote=is_upvote))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='write a synthetic dataset, or the part of one shard, as '
+        'JSON lines if the output ends with .jsonl and as length-delimited '
+        'LogRecords otherwise')
+    parser.add_argument('output', type=str)
+    parser.add_argument('--posts', type=int, default=10_000)
+    parser.add_argument('--comments', type=int, default=1_000_000)
+    parser.add_argument('--votes', type=int, default=5_000_000)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reply-ratio', type=float, default=0.7,
+                        help='share of comments answering another comment')
+    parser.add_argument('--post-skew', type=float, default=1.1,
+                        help='Zipf exponent of comments per post')
+    parser.add_argument('--vote-skew', type=float, default=1.0,
+                        help='Zipf exponent of votes per post and comment')
+    parser.add_argument('--input', type=str, default=None,
+                        help='split this dataset file instead of writing a '
+                        'synthetic one')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='write only the records of --shard of a '
+                        'launcher.py deployment of this many shards, with '
+                        'the ids of its rows')
+    parser.add_argument('--shard', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.input is not None:
+        records = read_records(args.input)
+    else:
+        records = generate(
+            args.posts, args.comments, args.votes, args.users, args.seed,
+            args.reply_ratio, args.post_skew, args.vote_skew)
+    if args.shards > 1:
+        records = split(records, args.shard, args.shards)
+    count = write_records(args.output, records)
+    print(f"wrote {count} records to {args.output}")
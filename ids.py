@@ -0,0 +1,189 @@
+import threading
+import time
+
+# Allocators of post and comment ids, for RedditNativeController(ids=...).
+# Without one an id is the row of the post or comment in its column store,
+# handed out under the store's append lock, and ids only mean something to
+# one controller. An allocator hands ids out on each thread without a
+# shared lock, and its ids are unique across the shards of a deployment;
+# the stores then map ids to rows (storage.ColumnStore.row).
+
+KINDS = ('rows', 'blocks', 'snowflake')
+
+# 2023-11-14T22:13:20Z in milliseconds, time 0 of SnowflakeIds
+EPOCH = 1_700_000_000_000
+# the layout of SnowflakeIds: 41 bits of milliseconds, then up to 16
+# shards, 64 threads allocating at once per shard and 4096 ids per
+# millisecond and thread. Every server and router of a deployment must
+# agree on it, so it is not a server option.
+SHARD_BITS = 4
+THREAD_BITS = 6
+SEQUENCE_BITS = 12
+
+
+class BlockIds:
+    """
+    Hands each thread a block of block_size consecutive ids at a time,
+    so the shared lock is taken once per block. Blocks are numbered in
+    the order they are taken and dealt to the shards in turn (block b of
+    shard s starts at id (b * shards + s) * block_size), so ids are
+    unique across shards and follow creation order up to the
+    interleaving of the blocks held by different threads.
+    """
+
+    def __init__(self, block_size: int = 1024, shard: int = 0,
+                 shards: int = 1):
+        if not 0 <= shard < shards:
+            raise ValueError(f"shard {shard} is not in 0..{shards - 1}")
+        self.block_size = block_size
+        self.shard = shard
+        self.shards = shards
+        self.next_block = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def next_id(self):
+        local = self.local
+        item_id = getattr(local, 'next', 0)
+        if item_id == getattr(local, 'end', 0):
+            with self.lock:
+                block = self.next_block
+                self.next_block += 1
+            item_id = (block * self.shards + self.shard) * self.block_size
+            local.end = item_id + self.block_size
+        local.next = item_id + 1
+        return item_id
+
+    def advance(self, item_id: int):
+        """Only hand out ids of later blocks than item_id's from now on"""
+        block = item_id // self.block_size // self.shards + 1
+        with self.lock:
+            self.next_block = max(self.next_block, block)
+
+    def shard_of(self, item_id: int):
+        return item_id // self.block_size % self.shards
+
+
+class SnowflakeIds:
+    """
+    Time ordered 63-bit ids: the milliseconds since EPOCH (41 bits, some
+    69 years), the shard (shard_bits), the slot of the allocating thread
+    (thread_bits) and a sequence number (sequence_bits). A thread takes a
+    free slot the first time it allocates and gives it back when it ends;
+    the slot's own last millisecond and sequence number are all it ever
+    touches afterwards, so threads never wait on each other. A slot that
+    used up the sequence numbers of a millisecond, or sees the clock go
+    back, goes on with the next millisecond of its own.
+
+    Ids sort by creation time to the millisecond, so the ids created
+    between two times form the range [first_id(start), first_id(end)).
+    """
+
+    def __init__(self, shard: int = 0, shard_bits: int = SHARD_BITS,
+                 thread_bits: int = THREAD_BITS,
+                 sequence_bits: int = SEQUENCE_BITS, epoch: int = EPOCH):
+        if not 0 <= shard < 1 << shard_bits:
+            raise ValueError(f"shard {shard} does not fit {shard_bits} bits")
+        self.shard = shard
+        self.epoch = epoch
+        self.shard_bits = shard_bits
+        self.sequence_bits = sequence_bits
+        self.slot_shift = sequence_bits
+        self.shard_shift = sequence_bits + thread_bits
+        self.time_shift = sequence_bits + thread_bits + shard_bits
+        self.max_sequence = (1 << sequence_bits) - 1
+        slots = 1 << thread_bits
+        # last millisecond and sequence number of each slot
+        self.millisecond = [0] * slots
+        self.sequence = [0] * slots
+        self.free = list(reversed(range(slots)))
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # no id of this millisecond or earlier is handed out
+        self.floor = -1
+
+    def slot(self):
+        slot = getattr(self.local, 'slot', None)
+        if slot is None:
+            with self.lock:
+                if not self.free:
+                    raise RuntimeError(
+                        f"more than {len(self.sequence)} threads allocate ids")
+                slot = self.local.slot = Slot(self.free, self.free.pop())
+        return slot.number
+
+    def next_id(self):
+        slot = self.slot()
+        now = max(int(time.time() * 1000) - self.epoch, self.floor + 1)
+        if now > self.millisecond[slot]:
+            self.millisecond[slot] = now
+            self.sequence[slot] = 0
+        elif self.sequence[slot] < self.max_sequence:
+            self.sequence[slot] += 1
+        else:
+            self.millisecond[slot] += 1
+            self.sequence[slot] = 0
+        return self.millisecond[slot] << self.time_shift | \
+            self.shard << self.shard_shift | slot << self.slot_shift | \
+            self.sequence[slot]
+
+    def advance(self, item_id: int):
+        """Only hand out ids of later milliseconds than item_id's from now on"""
+        self.floor = max(self.floor, item_id >> self.time_shift)
+
+    def shard_of(self, item_id: int):
+        return item_id >> self.shard_shift & (1 << self.shard_bits) - 1
+
+    def timestamp(self, item_id: int):
+        """Creation time of an id, in seconds since the Unix epoch"""
+        return ((item_id >> self.time_shift) + self.epoch) / 1000
+
+    def first_id(self, timestamp: float):
+        """The smallest id that can be created at or after timestamp"""
+        return max(0, int(timestamp * 1000) - self.epoch) << self.time_shift
+
+
+class Slot:
+    """A SnowflakeIds slot owned by a thread, freed with its thread locals"""
+
+    __slots__ = ('free', 'number')
+
+    def __init__(self, free: list, number: int):
+        self.free = free
+        self.number = number
+
+    def __del__(self):
+        self.free.append(self.number)
+
+
+def check(kind: str, shards: int = 1, threads: int = 1):
+    """
+    Raise ValueError if ids of a kind in KINDS cannot tell `shards`
+    shards apart, or give `threads` threads allocating at once a slot of
+    their own.
+    """
+    if kind != 'snowflake':
+        return
+    if shards > 1 << SHARD_BITS:
+        raise ValueError(f"snowflake ids have room for {1 << SHARD_BITS} "
+                         f"shards, not {shards}")
+    if threads > 1 << THREAD_BITS:
+        raise ValueError(f"snowflake ids have room for {1 << THREAD_BITS} "
+                         f"threads per shard, not {threads}")
+
+
+def allocator(kind: str = 'rows', shard: int = 0, shards: int = 1,
+              block_size: int = 1024):
+    """
+    The allocator of a kind in KINDS for shard `shard` of `shards`, None
+    for 'rows' (ids are rows). Raises ValueError if the kind has no room
+    for `shards` shards.
+    """
+    check(kind, shards)
+    if kind == 'rows':
+        return None
+    if kind == 'blocks':
+        return BlockIds(block_size, shard, shards)
+    if kind == 'snowflake':
+        return SnowflakeIds(shard)
+    raise ValueError(f"unknown id allocator {kind}")
@@ -0,0 +1,104 @@
+import argparse
+import os
+import signal
+import subprocess
+import sys
+
+import grpc
+
+import ids
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_ready(address: str, timeout: float = 30.0):
+    with grpc.insecure_channel(address) as channel:
+        grpc.channel_ready_future(channel).result(timeout=timeout)
+
+
+def launch(shards: int, routers: int = 1, host: str = 'localhost',
+           port: int = 50051, base_port: int = 50100, server_args=(),
+           ids: str = 'rows'):
+    """
+    Start `shards` server.py processes on base_port, base_port + 1, ...
+    and `routers` router.py processes sharing port (gRPC listens with
+    SO_REUSEPORT, so the kernel spreads connections over them). Every
+    "{shard}" in server_args is replaced by the shard's number, e.g.
+    --wal shard{shard}.wal. The shards start empty rather than each with
+    the sample data; give each its part of a dataset with --dataset
+    shard{shard}.data, written by dataset.py --shard S --shards N. The
+    shards allocate ids of kind `ids` (ids.KINDS). Returns the
+    processes, shards first, once they all accept connections.
+    """
+    processes = []
+    try:
+        addresses = []
+        id_args = ['--ids', ids]
+        for shard in range(shards):
+            address = f'{host}:{base_port + shard}'
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(HERE, 'server.py'),
+                 '--host', host, '--port', str(base_port + shard),
+                 '--id-shard', str(shard), '--id-shards', str(shards),
+                 '--empty'] +
+                id_args +
+                [arg.replace('{shard}', str(shard)) for arg in server_args]))
+            addresses.append(address)
+        for address in addresses:
+            wait_ready(address)
+        for _ in range(routers):
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(HERE, 'router.py'),
+                 '--host', host, '--port', str(port)] + id_args +
+                ['--shards'] + addresses))
+        wait_ready(f'{host}:{port}')
+    except BaseException:
+        stop(processes)
+        raise
+    return processes
+
+
+def stop(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='run a sharded deployment locally: one server.py per '
+        'shard behind router.py; arguments after -- go to every server, '
+        'with {shard} replaced by its number, e.g. -- --dataset '
+        'shard{shard}.data for data split by dataset.py --shard S --shards N')
+    parser.add_argument('--shards', type=int, default=os.cpu_count())
+    parser.add_argument('--routers', type=int, default=1)
+    parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--port', type=int, default=50051)
+    parser.add_argument('--base-port', type=int, default=50100,
+                        help='port of shard 0, shard i listens on base + i')
+    parser.add_argument('--ids', type=str, default='rows', choices=ids.KINDS,
+                        help='id allocator of the shards, see server.py')
+    parser.add_argument('server_args', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    try:
+        ids.check(args.ids, args.shards)
+    except ValueError as e:
+        parser.error(f'{e}, pass a smaller --shards')
+    server_args = args.server_args
+    if server_args[:1] == ['--']:
+        server_args = server_args[1:]
+
+    processes = launch(args.shards, args.routers, args.host, args.port,
+                       args.base_port, server_args, args.ids)
+    print(f"{args.shards} shards behind {args.routers} router(s) on "
+          f"{args.host}:{args.port}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
@@ -0,0 +1,376 @@
+import bisect
+import http.server
+import itertools
+import threading
+import time
+
+import grpc
+import grpc.aio
+
+import reddit_pb2
+
+# Upper bounds of the latency buckets in seconds, fixed so observing a
+# value is a bisection and an increment
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+           5.0, 10.0)
+
+
+class Histogram:
+    """
+    Counts of observed latencies per bucket of BUCKETS: counts[i] holds
+    the values of at most BUCKETS[i] (and more than BUCKETS[i - 1]),
+    the last count those above every bound.
+    """
+
+    __slots__ = ('counts', 'sum', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        """Return (counts, sum) as of now"""
+        with self.lock:
+            return list(self.counts), self.sum
+
+    def to_message(self):
+        counts, total = self.snapshot()
+        return reddit_pb2.LatencyHistogram(
+            bounds=BUCKETS, counts=counts, sum=total, count=sum(counts))
+
+
+class MethodStats:
+    """Requests, errors, calls in flight and latency of one RPC method"""
+
+    __slots__ = ('requests', 'errors', 'in_flight', 'latency', 'lock')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.lock = threading.Lock()
+
+    def started(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finished(self, seconds: float, failed: bool):
+        latency = self.latency
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.in_flight -= 1
+            self.errors += failed
+            latency.counts[i] += 1
+            latency.sum += seconds
+
+
+class Metrics:
+    """
+    Statistics of a server: a MethodStats per RPC method, filled by a
+    MetricsInterceptor, and a latency Histogram per stage of answering
+    calls, filled by functions wrapped with timed() (see
+    RedditNativeController.instrument). A stage is entered many times
+    per call, so only one in stage_sample (a power of two) of its
+    entries is timed. The counters of the caches given to add_cache()
+    are read with the rest. Read as a ServerStats message or in the
+    Prometheus text format.
+    """
+
+    def __init__(self, stage_sample: int = 16):
+        self.stage_mask = stage_sample - 1
+        self.methods = {}
+        self.stages = {}
+        self.caches = {}
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def method(self, name: str):
+        stats = self.methods.get(name, None)
+        if stats is None:
+            with self.lock:
+                stats = self.methods.setdefault(name, MethodStats())
+        return stats
+
+    def stage(self, name: str):
+        histogram = self.stages.get(name, None)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(name, Histogram())
+        return histogram
+
+    def add_cache(self, name: str, cache):
+        """Report the stats() of a cache (a cache.ResponseCache) as name"""
+        with self.lock:
+            self.caches[name] = cache
+
+    def timed(self, stage: str, function):
+        """
+        Return function with the time of one in stage_sample of its
+        calls observed in stage
+        """
+        observe = self.stage(stage).observe
+        perf_counter = time.perf_counter
+        calls = itertools.count()
+        mask = self.stage_mask
+
+        def call(*args):
+            if next(calls) & mask:
+                return function(*args)
+            start = perf_counter()
+            try:
+                return function(*args)
+            finally:
+                observe(perf_counter() - start)
+        return call
+
+    def to_message(self):
+        methods = []
+        for name, stats in sorted(self.methods.items()):
+            with stats.lock:
+                requests, errors, in_flight = \
+                    stats.requests, stats.errors, stats.in_flight
+            methods.append(reddit_pb2.MethodStats(
+                method=name, requests=requests, errors=errors,
+                in_flight=in_flight, latency=stats.latency.to_message()))
+        return reddit_pb2.ServerStats(
+            methods=methods,
+            stages=[reddit_pb2.StageStats(stage=name,
+                                          latency=histogram.to_message())
+                    for name, histogram in sorted(self.stages.items())],
+            uptime_seconds=time.monotonic() - self.start,
+            caches=[reddit_pb2.CacheStats(cache=name, **cache.stats())
+                    for name, cache in sorted(self.caches.items())])
+
+    def prometheus_text(self):
+        """All statistics in the Prometheus text exposition format"""
+        stats = self.to_message()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, labels, latency):
+            cumulative = 0
+            for bound, count in zip(list(latency.bounds) + ['+Inf'],
+                                    latency.counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {latency.sum!r}')
+            lines.append(f'{name}_count{{{labels}}} {latency.count}')
+
+        for field, kind, help_text in (
+                ('requests', 'counter', 'RPCs started'),
+                ('errors', 'counter', 'RPCs that failed'),
+                ('in_flight', 'gauge', 'RPCs being answered')):
+            name = f'reddit_rpc_{field}' + ('_total' if kind == 'counter'
+                                            else '')
+            family(name, kind, help_text)
+            for method in stats.methods:
+                lines.append(f'{name}{{method="{method.method}"}} '
+                             f'{getattr(method, field)}')
+        family('reddit_rpc_latency_seconds', 'histogram',
+               'time to answer RPCs')
+        for method in stats.methods:
+            histogram('reddit_rpc_latency_seconds',
+                      f'method="{method.method}"', method.latency)
+        family('reddit_stage_seconds', 'histogram',
+               'time spent in a stage of answering RPCs')
+        for stage in stats.stages:
+            histogram('reddit_stage_seconds', f'stage="{stage.stage}"',
+                      stage.latency)
+        for field, kind, help_text in (
+                ('hits', 'counter', 'cache lookups answered from the cache'),
+                ('misses', 'counter', 'cache lookups that found nothing '
+                 'current'),
+                ('evictions', 'counter', 'cache entries dropped for room'),
+                ('size', 'gauge', 'entries in the cache')):
+            name = f'reddit_cache_{field}' + ('_total' if kind == 'counter'
+                                              else '')
+            family(name, kind, help_text)
+            for cache in stats.caches:
+                lines.append(f'{name}{{cache="{cache.cache}"}} '
+                             f'{getattr(cache, field)}')
+        family('reddit_uptime_seconds', 'gauge',
+               'seconds since the metrics were created')
+        lines.append(f'reddit_uptime_seconds {stats.uptime_seconds!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def timed_serializer(serializer, observe):
+    perf_counter = time.perf_counter
+
+    def serialize(response):
+        start = perf_counter()
+        try:
+            return serializer(response)
+        finally:
+            observe(perf_counter() - start)
+    return serialize
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """
+    Counts every call of a method in its MethodStats, as an error if its
+    behavior raised (as context.abort does), and observes its latency
+    from the behavior's start to its return (or the end of its response
+    stream). Response serialization is timed as the 'serialize' stage.
+    Wrapped handlers are cached, so a call only costs two clock reads
+    and two uncontended locks.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.handlers = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return handler
+        wrapped = self.handlers.get(handler, None)
+        if wrapped is None:
+            wrapped = self.handlers[handler] = self.wrap(
+                handler, handler_call_details.method.rsplit('/', 1)[-1])
+        return wrapped
+
+    def wrap(self, handler, method: str):
+        stats = self.metrics.method(method)
+        kind = ('stream' if handler.request_streaming else 'unary') + '_' + \
+            ('stream' if handler.response_streaming else 'unary')
+        behavior = getattr(handler, kind)
+        if handler.response_streaming:
+            timed = self.timed_stream(behavior, stats)
+        else:
+            timed = self.timed_unary(behavior, stats)
+        # e.g. the rejections of server.LimitInterceptor
+        pool = getattr(behavior, 'experimental_thread_pool', None)
+        if pool is not None:
+            timed.experimental_thread_pool = pool
+        changes = {kind: timed}
+        if handler.response_serializer is not None:
+            changes['response_serializer'] = timed_serializer(
+                handler.response_serializer,
+                self.metrics.stage('serialize').observe)
+        return handler._replace(**changes)
+
+    @staticmethod
+    def timed_unary(behavior, stats: MethodStats):
+        perf_counter = time.perf_counter
+
+        def call(request, context):
+            stats.started()
+            start = perf_counter()
+            failed = True
+            try:
+                response = behavior(request, context)
+                failed = False
+                return response
+            finally:
+                stats.finished(perf_counter() - start, failed)
+        return call
+
+    @staticmethod
+    def timed_stream(behavior, stats: MethodStats):
+        perf_counter = time.perf_counter
+
+        def call(request, context):
+            stats.started()
+            start = perf_counter()
+            failed = True
+            try:
+                yield from behavior(request, context)
+                failed = False
+            finally:
+                stats.finished(perf_counter() - start, failed)
+        return call
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """MetricsInterceptor for a grpc.aio server"""
+
+    def __init__(self, metrics: Metrics):
+        self.interceptor = AsyncBehaviorTimer(metrics)
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        return self.interceptor.intercept_service(
+            lambda details: handler, handler_call_details)
+
+
+class AsyncBehaviorTimer(MetricsInterceptor):
+    """MetricsInterceptor's wrapping, for coroutine behaviors"""
+
+    @staticmethod
+    def timed_unary(behavior, stats: MethodStats):
+        perf_counter = time.perf_counter
+
+        async def call(request, context):
+            stats.started()
+            start = perf_counter()
+            failed = True
+            try:
+                response = await behavior(request, context)
+                failed = False
+                return response
+            finally:
+                stats.finished(perf_counter() - start, failed)
+        return call
+
+    @staticmethod
+    def timed_stream(behavior, stats: MethodStats):
+        perf_counter = time.perf_counter
+
+        async def call(request, context):
+            stats.started()
+            start = perf_counter()
+            failed = True
+            try:
+                async for response in behavior(request, context):
+                    yield response
+                failed = False
+            finally:
+                stats.finished(perf_counter() - start, failed)
+        return call
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_http(metrics: Metrics, host: str = 'localhost', port: int = 9090):
+    """
+    Serve metrics.prometheus_text() at http://host:port/metrics from a
+    daemon thread. Returns the HTTP server (server_address has the port,
+    shutdown() stops it).
+    """
+    handler = type('Handler', (MetricsHandler,), {'metrics': metrics})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
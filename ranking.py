@@ -0,0 +1,233 @@
+import bisect
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import reddit_pb2
+
+HIDDEN = reddit_pb2.CommentState.COMMENT_STATE_HIDDEN
+
+
+class SortedChildren:
+    """
+    Child comments of one parent as a list of (-score, comment_id) kept
+    sorted, so the top n are the first visible entries. A vote moves one
+    entry; hidden children stay in the list and are skipped when read.
+    """
+
+    __slots__ = ('keys',)
+
+    def __init__(self):
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        """Yield (comment_id, score) in rank order"""
+        for neg_score, comment_id in self.keys:
+            yield comment_id, -neg_score
+
+    def add(self, comment_id: int, score: int, visible: bool):
+        bisect.insort(self.keys, (-score, comment_id))
+
+    def move(self, comment_id: int, old_score: int, new_score: int):
+        """Re-rank a child, KeyError if it is not at old_score here"""
+        keys = self.keys
+        key = (-old_score, comment_id)
+        i = bisect.bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            raise KeyError(comment_id)
+        del keys[i]
+        bisect.insort(keys, (-new_score, comment_id))
+
+    def set_visible(self, comment_id: int, visible: bool):
+        pass
+
+    def top(self, n: int, comment_state):
+        """Return the ids of the n best visible children"""
+        result = []
+        for _, child_id in self.keys:
+            if len(result) >= n:
+                break
+            if comment_state[child_id] == HIDDEN:
+                continue
+            result.append(child_id)
+        return result
+
+
+class NumpyChildren:
+    """
+    Child comments of one parent as NumPy arrays of ids, scores and
+    visibility in creation order. A vote is a single array store; a read
+    ranks the visible children with argpartition, so it costs a few
+    vectorized passes over the children instead of Python comparisons.
+    """
+
+    __slots__ = ('ids', 'scores', 'visible', 'slots', 'size')
+
+    def __init__(self, capacity: int = 64):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.scores = np.empty(capacity, dtype=np.int64)
+        self.visible = np.empty(capacity, dtype=np.bool_)
+        self.slots = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """Yield (comment_id, score) in rank order"""
+        size = self.size
+        order = np.lexsort((self.ids[:size], -self.scores[:size]))
+        for slot in order.tolist():
+            yield int(self.ids[slot]), int(self.scores[slot])
+
+    def add(self, comment_id: int, score: int, visible: bool):
+        if self.size == len(self.ids):
+            capacity = 2 * len(self.ids)
+            self.ids = np.resize(self.ids, capacity)
+            self.scores = np.resize(self.scores, capacity)
+            self.visible = np.resize(self.visible, capacity)
+        slot = self.size
+        self.ids[slot] = comment_id
+        self.scores[slot] = score
+        self.visible[slot] = visible
+        self.slots[comment_id] = slot
+        self.size += 1
+
+    def move(self, comment_id: int, old_score: int, new_score: int):
+        self.scores[self.slots[comment_id]] = new_score
+
+    def set_visible(self, comment_id: int, visible: bool):
+        self.visible[self.slots[comment_id]] = visible
+
+    def top(self, n: int, comment_state):
+        """Return the ids of the n best visible children"""
+        if n <= 0:
+            return []
+        size = self.size
+        candidates = np.flatnonzero(self.visible[:size])
+        neg_scores = -self.scores[candidates]
+        if n < len(candidates):
+            # keep everything tied with the n-th best so ids break ties
+            kth = neg_scores[np.argpartition(neg_scores, n - 1)[n - 1]]
+            keep = neg_scores <= kth
+            candidates = candidates[keep]
+            neg_scores = neg_scores[keep]
+        ids = self.ids[candidates]
+        order = np.lexsort((ids, neg_scores))[:n]
+        return ids[order].tolist()
+
+    @classmethod
+    def from_children(cls, children, comment_state):
+        """Copy another child index, e.g. when a parent outgrows it"""
+        result = cls(max(64, 2 * len(children)))
+        for comment_id, score in children:
+            result.add(comment_id, score, comment_state[comment_id] != HIDDEN)
+        return result
+
+
+class ChildIndexFactory:
+    """
+    Chooses the child index of each parent. With ranking "sorted" every
+    parent uses SortedChildren. With ranking "numpy" a parent switches to
+    NumpyChildren once it has more than numpy_threshold children. Reads
+    are always cheaper on the sorted list, votes on the arrays, so "numpy"
+    only pays off for huge, vote heavy threads (see benchmark.py ranking).
+    Without NumPy, "numpy" falls back to "sorted".
+    """
+
+    RANKINGS = ('sorted', 'numpy')
+
+    def __init__(self, ranking: str = 'sorted', numpy_threshold: int = 100_000):
+        if ranking not in self.RANKINGS:
+            raise ValueError(f"unknown ranking {ranking!r}")
+        self.use_numpy = ranking == 'numpy' and np is not None
+        self.numpy_threshold = numpy_threshold
+
+    def new(self):
+        if self.use_numpy and self.numpy_threshold <= 0:
+            return NumpyChildren()
+        return SortedChildren()
+
+    def build(self, child_ids, scores, comment_state):
+        """Return an index of existing children with their current scores"""
+        if self.use_numpy and len(child_ids) > self.numpy_threshold:
+            children = NumpyChildren(max(64, 2 * len(child_ids)))
+            for comment_id in child_ids:
+                children.add(comment_id, scores[comment_id],
+                             comment_state[comment_id] != HIDDEN)
+            return children
+        children = SortedChildren()
+        # child_ids usually come in rank order, so this sort is linear
+        children.keys = sorted((-scores[comment_id], comment_id)
+                               for comment_id in child_ids)
+        return children
+
+    def grow(self, children, comment_state):
+        """Return the index to use for children after an insertion"""
+        if self.use_numpy and isinstance(children, SortedChildren) and \
+                len(children) > self.numpy_threshold:
+            return NumpyChildren.from_children(children, comment_state)
+        return children
+
+
+class ChildMap(dict):
+    """
+    Parent id -> child index. Parents loaded from a snapshot are kept as
+    plain child ids in rank order (sorted base_parents, and base_children
+    from base_offsets[i] to base_offsets[i + 1] for base_parents[i]), and
+    only get a child index the first time they are looked up. Like the
+    indexes themselves, a parent is looked up under its parent's lock.
+    """
+
+    def __init__(self, factory: ChildIndexFactory, scores, comment_state):
+        super().__init__()
+        self.factory = factory
+        self.scores = scores
+        self.comment_state = comment_state
+        self.base_parents = ()
+        self.base_offsets = (0,)
+        self.base_children = ()
+
+    def load_base(self, parents, offsets, children):
+        self.base_parents = parents
+        self.base_offsets = offsets
+        self.base_children = children
+
+    def base_slice(self, parent_id: int):
+        """Return the loaded child ids of a parent, or None"""
+        i = bisect.bisect_left(self.base_parents, parent_id)
+        if i < len(self.base_parents) and self.base_parents[i] == parent_id:
+            return self.base_children[
+                self.base_offsets[i]:self.base_offsets[i + 1]]
+        return None
+
+    def __missing__(self, parent_id: int):
+        child_ids = self.base_slice(parent_id)
+        if child_ids is None:
+            raise KeyError(parent_id)
+        children = self[parent_id] = self.factory.build(
+            child_ids, self.scores, self.comment_state)
+        return children
+
+    def get(self, parent_id: int, default=None):
+        try:
+            return self[parent_id]
+        except KeyError:
+            return default
+
+    def parent_ids(self):
+        """Return the sorted ids of every parent with children"""
+        return sorted(set(self).union(self.base_parents))
+
+    def ranked_ids(self, parent_id: int):
+        """Return the child ids of a parent in rank order, without indexing"""
+        children = dict.get(self, parent_id, None)
+        if children is not None:
+            return [comment_id for comment_id, _ in children]
+        child_ids = self.base_slice(parent_id)
+        return [] if child_ids is None else child_ids
@@ -13,55 +13,107 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0creddit.proto\"(\n\x04User\x12\x14\n\x07user_id\x18\x01 \x01(\tH\x00\x88\x01\x01\x42\n\n\x08_user_id\"\xc8\x02\n\x04Post\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x01\x88\x01\x01\x12\x12\n\x05title\x18\x02 \x01(\tH\x02\x88\x01\x01\x12\x11\n\x04text\x18\x03 \x01(\tH\x03\x88\x01\x01\x12\x13\n\tvideo_url\x18\x04 \x01(\tH\x00\x12\x13\n\timage_url\x18\x05 \x01(\tH\x00\x12\x1a\n\x06\x61uthor\x18\x06 \x01(\x0b\x32\x05.UserH\x04\x88\x01\x01\x12\x12\n\x05score\x18\x07 \x01(\x03H\x05\x88\x01\x01\x12#\n\npost_state\x18\x08 \x01(\x0e\x32\n.PostStateH\x06\x88\x01\x01\x12\x1d\n\x10publication_date\x18\t \x01(\tH\x07\x88\x01\x01\x42\r\n\x0b\x63ontent_urlB\n\n\x08_post_idB\x08\n\x06_titleB\x07\n\x05_textB\t\n\x07_authorB\x08\n\x06_scoreB\r\n\x0b_post_stateB\x13\n\x11_publication_date\"\xe9\x02\n\x07\x43omment\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x1b\n\x0eparent_post_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x1e\n\x11parent_comment_id\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x1a\n\x06\x61uthor\x18\x04 \x01(\x0b\x32\x05.UserH\x03\x88\x01\x01\x12\x11\n\x04text\x18\x05 \x01(\tH\x04\x88\x01\x01\x12\x12\n\x05score\x18\x06 \x01(\x03H\x05\x88\x01\x01\x12)\n\rcomment_state\x18\x07 \x01(\x0e\x32\r.CommentStateH\x06\x88\x01\x01\x12\x1d\n\x10publication_date\x18\x08 \x01(\tH\x07\x88\x01\x01\x42\r\n\x0b_comment_idB\x11\n\x0f_parent_post_idB\x14\n\x12_parent_comment_idB\t\n\x07_authorB\x07\n\x05_textB\x08\n\x06_scoreB\x10\n\x0e_comment_stateB\x13\n\x11_publication_date\"6\n\x11\x43reatePostRequest\x12\x18\n\x04post\x18\x01 \x01(\x0b\x32\x05.PostH\x00\x88\x01\x01\x42\x07\n\x05_post\"X\n\x12\x43reatePostResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x14\n\x07post_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\n\n\x08_post_id\"|\n\x0fVotePostRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x18\n\x04user\x18\x02 \x01(\x0b\x32\x05.UserH\x01\x88\x01\x01\x12\x16\n\tis_upvote\x18\x03 \x01(\x08H\x02\x88\x01\x01\x42\n\n\x08_post_idB\x07\n\x05_userB\x0c\n\n_is_upvote\"R\n\x10VotePostResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x12\n\x05score\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\x08\n\x06_score\"9\n\x15GetPostContentRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x42\n\n\x08_post_id\"]\n\x16GetPostContentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x18\n\x04post\x18\x02 \x01(\x0b\x32\x05.PostH\x01\x88\x01\x01\x42\n\n\x08_successB\x07\n\x05_post\"i\n\x14\x43reateCommentRequest\x12\x1a\n\x06\x61uthor\x18\x01 \x01(\x0b\x32\x05.UserH\x00\x88\x01\x01\x12\x1e\n\x07\x63omment\x18\x02 \x01(\x0b\x32\x08.CommentH\x01\x88\x01\x01\x42\t\n\x07_authorB\n\n\x08_comment\"a\n\x15\x43reateCommentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x17\n\ncomment_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\r\n\x0b_comment_id\"\x85\x01\n\x12VoteCommentRequest\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x18\n\x04user\x18\x02 \x01(\x0b\x32\x05.UserH\x01\x88\x01\x01\x12\x16\n\tis_upvote\x18\x03 \x01(\x08H\x02\x88\x01\x01\x42\r\n\x0b_comment_idB\x07\n\x05_userB\x0c\n\n_is_upvote\"U\n\x13VoteCommentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x12\n\x05score\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\x08\n\x06_score\"_\n\x1dGetMostUpvotedCommentsRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05limit\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_post_idB\x08\n\x06_limit\"~\n CommentAndWetherSubcommentsExist\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1b\n\x0ehas_subcomment\x18\x02 \x01(\x08H\x01\x88\x01\x01\x42\n\n\x08_commentB\x11\n\x0f_has_subcomment\"U\n\x1eGetMostUpvotedCommentsResponse\x12\x33\n\x08\x63omments\x18\x01 \x03(\x0b\x32!.CommentAndWetherSubcommentsExist\"b\n\x1a\x45xpandCommentBranchRequest\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05limit\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\r\n\x0b_comment_idB\x08\n\x06_limit\"b\n\x15\x43ommentAndSubcomments\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1d\n\x0bsubcomments\x18\x02 \x03(\x0b\x32\x08.CommentB\n\n\x08_comment\"J\n\x1b\x45xpandCommentBranchResponse\x12+\n\x0bsubcomments\x18\x01 \x03(\x0b\x32\x16.CommentAndSubcomments*P\n\tPostState\x12\x15\n\x11POST_STATE_NORMAL\x10\x00\x12\x15\n\x11POST_STATE_LOCKED\x10\x01\x12\x15\n\x11POST_STATE_HIDDEN\x10\x02*B\n\x0c\x43ommentState\x12\x18\n\x14\x43OMMENT_STATE_NORMAL\x10\x00\x12\x18\n\x14\x43OMMENT_STATE_HIDDEN\x10\x01\x32\xe1\x03\n\rRedditService\x12\x35\n\nCreatePost\x12\x12.CreatePostRequest\x1a\x13.CreatePostResponse\x12/\n\x08VotePost\x12\x10.VotePostRequest\x1a\x11.VotePostResponse\x12\x41\n\x0eGetPostContent\x12\x16.GetPostContentRequest\x1a\x17.GetPostContentResponse\x12>\n\rCreateComment\x12\x15.CreateCommentRequest\x1a\x16.CreateCommentResponse\x12\x38\n\x0bVoteComment\x12\x13.VoteCommentRequest\x1a\x14.VoteCommentResponse\x12Y\n\x16GetMostUpvotedComments\x12\x1e.GetMostUpvotedCommentsRequest\x1a\x1f.GetMostUpvotedCommentsResponse\x12P\n\x13\x45xpandCommentBranch\x12\x1b.ExpandCommentBranchRequest\x1a\x1c.ExpandCommentBranchResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0creddit.proto\"(\n\x04User\x12\x14\n\x07user_id\x18\x01 \x01(\tH\x00\x88\x01\x01\x42\n\n\x08_user_id\"\xf6\x02\n\x04Post\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x01\x88\x01\x01\x12\x12\n\x05title\x18\x02 \x01(\tH\x02\x88\x01\x01\x12\x11\n\x04text\x18\x03 \x01(\tH\x03\x88\x01\x01\x12\x13\n\tvideo_url\x18\x04 \x01(\tH\x00\x12\x13\n\timage_url\x18\x05 \x01(\tH\x00\x12\x1a\n\x06\x61uthor\x18\x06 \x01(\x0b\x32\x05.UserH\x04\x88\x01\x01\x12\x12\n\x05score\x18\x07 \x01(\x03H\x05\x88\x01\x01\x12#\n\npost_state\x18\x08 \x01(\x0e\x32\n.PostStateH\x06\x88\x01\x01\x12\x1d\n\x10publication_date\x18\t \x01(\tH\x07\x88\x01\x01\x12\x1a\n\rcomment_count\x18\n \x01(\x03H\x08\x88\x01\x01\x42\r\n\x0b\x63ontent_urlB\n\n\x08_post_idB\x08\n\x06_titleB\x07\n\x05_textB\t\n\x07_authorB\x08\n\x06_scoreB\r\n\x0b_post_stateB\x13\n\x11_publication_dateB\x10\n\x0e_comment_count\"\x97\x03\n\x07\x43omment\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x1b\n\x0eparent_post_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x1e\n\x11parent_comment_id\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x1a\n\x06\x61uthor\x18\x04 \x01(\x0b\x32\x05.UserH\x03\x88\x01\x01\x12\x11\n\x04text\x18\x05 \x01(\tH\x04\x88\x01\x01\x12\x12\n\x05score\x18\x06 \x01(\x03H\x05\x88\x01\x01\x12)\n\rcomment_state\x18\x07 \x01(\x0e\x32\r.CommentStateH\x06\x88\x01\x01\x12\x1d\n\x10publication_date\x18\x08 \x01(\tH\x07\x88\x01\x01\x12\x1a\n\rcomment_count\x18\t \x01(\x03H\x08\x88\x01\x01\x42\r\n\x0b_comment_idB\x11\n\x0f_parent_post_idB\x14\n\x12_parent_comment_idB\t\n\x07_authorB\x07\n\x05_textB\x08\n\x06_scoreB\x10\n\x0e_comment_stateB\x13\n\x11_publication_dateB\x10\n\x0e_comment_count\"6\n\x11\x43reatePostRequest\x12\x18\n\x04post\x18\x01 \x01(\x0b\x32\x05.PostH\x00\x88\x01\x01\x42\x07\n\x05_post\"X\n\x12\x43reatePostResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x14\n\x07post_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\n\n\x08_post_id\"|\n\x0fVotePostRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x18\n\x04user\x18\x02 \x01(\x0b\x32\x05.UserH\x01\x88\x01\x01\x12\x16\n\tis_upvote\x18\x03 \x01(\x08H\x02\x88\x01\x01\x42\n\n\x08_post_idB\x07\n\x05_userB\x0c\n\n_is_upvote\"R\n\x10VotePostResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x12\n\x05score\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\x08\n\x06_score\"9\n\x15GetPostContentRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x42\n\n\x08_post_id\"]\n\x16GetPostContentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x18\n\x04post\x18\x02 \x01(\x0b\x32\x05.PostH\x01\x88\x01\x01\x42\n\n\x08_successB\x07\n\x05_post\"i\n\x14\x43reateCommentRequest\x12\x1a\n\x06\x61uthor\x18\x01 \x01(\x0b\x32\x05.UserH\x00\x88\x01\x01\x12\x1e\n\x07\x63omment\x18\x02 \x01(\x0b\x32\x08.CommentH\x01\x88\x01\x01\x42\t\n\x07_authorB\n\n\x08_comment\"a\n\x15\x43reateCommentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x17\n\ncomment_id\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\r\n\x0b_comment_id\"\x85\x01\n\x12VoteCommentRequest\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x18\n\x04user\x18\x02 \x01(\x0b\x32\x05.UserH\x01\x88\x01\x01\x12\x16\n\tis_upvote\x18\x03 \x01(\x08H\x02\x88\x01\x01\x42\r\n\x0b_comment_idB\x07\n\x05_userB\x0c\n\n_is_upvote\"U\n\x13VoteCommentResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x12\n\x05score\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_successB\x08\n\x06_score\"_\n\x1dGetMostUpvotedCommentsRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05limit\x18\x02 \x01(\x03H\x01\x88\x01\x01\x42\n\n\x08_post_idB\x08\n\x06_limit\"~\n CommentAndWetherSubcommentsExist\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1b\n\x0ehas_subcomment\x18\x02 \x01(\x08H\x01\x88\x01\x01\x42\n\n\x08_commentB\x11\n\x0f_has_subcomment\"U\n\x1eGetMostUpvotedCommentsResponse\x12\x33\n\x08\x63omments\x18\x01 \x03(\x0b\x32!.CommentAndWetherSubcommentsExist\"\xc4\x01\n\x1a\x45xpandCommentBranchRequest\x12\x17\n\ncomment_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05limit\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x16\n\tmax_depth\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x14\n\x0clevel_limits\x18\x04 \x03(\x03\x12\x16\n\tmax_nodes\x18\x05 \x01(\x03H\x03\x88\x01\x01\x42\r\n\x0b_comment_idB\x08\n\x06_limitB\x0c\n\n_max_depthB\x0c\n\n_max_nodes\"b\n\x15\x43ommentAndSubcomments\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1d\n\x0bsubcomments\x18\x02 \x03(\x0b\x32\x08.CommentB\n\n\x08_comment\"\x88\x01\n\x0b\x43ommentTree\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1b\n\x0ehas_subcomment\x18\x02 \x01(\x08H\x01\x88\x01\x01\x12\x1d\n\x07replies\x18\x03 \x03(\x0b\x32\x0c.CommentTreeB\n\n\x08_commentB\x11\n\x0f_has_subcomment\"f\n\x1b\x45xpandCommentBranchResponse\x12+\n\x0bsubcomments\x18\x01 \x03(\x0b\x32\x16.CommentAndSubcomments\x12\x1a\n\x04tree\x18\x02 \x03(\x0b\x32\x0c.CommentTree\"\x80\x01\n\x14GetPostThreadRequest\x12\x14\n\x07post_id\x18\x01 \x01(\x03H\x00\x88\x01\x01\x12\x12\n\x05limit\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x18\n\x0breply_limit\x18\x03 \x01(\x03H\x02\x88\x01\x01\x42\n\n\x08_post_idB\x08\n\x06_limitB\x0e\n\x0c_reply_limit\"|\n\x15GetPostThreadResponse\x12\x14\n\x07success\x18\x01 \x01(\x08H\x00\x88\x01\x01\x12\x18\n\x04post\x18\x02 \x01(\x0b\x32\x05.PostH\x01\x88\x01\x01\x12\x1e\n\x08\x63omments\x18\x03 \x03(\x0b\x32\x0c.CommentTreeB\n\n\x08_successB\x07\n\x05_post\"\x8b\x01\n\x0f\x43ommentTreeNode\x12\x1e\n\x07\x63omment\x18\x01 \x01(\x0b\x32\x08.CommentH\x00\x88\x01\x01\x12\x1b\n\x0ehas_subcomment\x18\x02 \x01(\x08H\x01\x88\x01\x01\x12\x12\n\x05\x64\x65pth\x18\x03 \x01(\x03H\x02\x88\x01\x01\x42\n\n\x08_commentB\x11\n\x0f_has_subcommentB\x08\n\x06_depth\"d\n\x10\x42\x61tchVoteRequest\x12$\n\npost_votes\x18\x01 \x03(\x0b\x32\x10.VotePostRequest\x12*\n\rcomment_votes\x18\x02 \x03(\x0b\x32\x13.VoteCommentRequest\"g\n\x11\x42\x61tchVoteResponse\x12%\n\npost_votes\x18\x01 \x03(\x0b\x32\x11.VotePostResponse\x12+\n\rcomment_votes\x18\x02 \x03(\x0b\x32\x14.VoteCommentResponse\"D\n\x19\x42\x61tchCreateCommentRequest\x12\'\n\x08\x63omments\x18\x01 \x03(\x0b\x32\x15.CreateCommentRequest\"F\n\x1a\x42\x61tchCreateCommentResponse\x12(\n\x08\x63omments\x18\x01 \x03(\x0b\x32\x16.CreateCommentResponse\"(\n\x14\x42\x61tchGetPostsRequest\x12\x10\n\x08post_ids\x18\x01 \x03(\x03\"\\\n\nPostResult\x12 \n\x06status\x18\x01 \x01(\x0e\x32\x0b.ItemStatusH\x00\x88\x01\x01\x12\x18\n\x04post\x18\x02 \x01(\x0b\x32\x05.PostH\x01\x88\x01\x01\x42\t\n\x07_statusB\x07\n\x05_post\"3\n\x15\x42\x61tchGetPostsResponse\x12\x1a\n\x05posts\x18\x01 \x03(\x0b\x32\x0b.PostResult\".\n\x17\x42\x61tchGetCommentsRequest\x12\x13\n\x0b\x63omment_ids\x18\x01 \x03(\x03\"h\n\rCommentResult\x12 \n\x06status\x18\x01 \x01(\x0e\x32\x0b.ItemStatusH\x00\x88\x01\x01\x12\x1e\n\x07\x63omment\x18\x02 \x01(\x0b\x32\x08.CommentH\x01\x88\x01\x01\x42\t\n\x07_statusB\n\n\x08_comment\"<\n\x18\x42\x61tchGetCommentsResponse\x12 \n\x08\x63omments\x18\x01 \x03(\x0b\x32\x0e.CommentResult\"B\n\x10ReplicateRequest\x12\x1b\n\x0e\x61\x66ter_sequence\x18\x01 \x01(\x03H\x00\x88\x01\x01\x42\x11\n\x0f_after_sequence\"\x1a\n\x18ReplicationStatusRequest\"\xff\x01\n\x11ReplicationStatus\x12#\n\x04role\x18\x01 \x01(\x0e\x32\x10.ReplicationRoleH\x00\x88\x01\x01\x12\x1d\n\x10\x61pplied_sequence\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x1c\n\x0fleader_sequence\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x10\n\x03lag\x18\x04 \x01(\x03H\x03\x88\x01\x01\x12\"\n\x15seconds_since_contact\x18\x05 \x01(\x01H\x04\x88\x01\x01\x42\x07\n\x05_roleB\x13\n\x11_applied_sequenceB\x12\n\x10_leader_sequenceB\x06\n\x04_lagB\x18\n\x16_seconds_since_contact\"\x14\n\x12ServerStatsRequest\"j\n\x10LatencyHistogram\x12\x0e\n\x06\x62ounds\x18\x01 \x03(\x01\x12\x0e\n\x06\x63ounts\x18\x02 \x03(\x03\x12\x10\n\x03sum\x18\x03 \x01(\x01H\x00\x88\x01\x01\x12\x12\n\x05\x63ount\x18\x04 \x01(\x03H\x01\x88\x01\x01\x42\x06\n\x04_sumB\x08\n\x06_count\"\xcc\x01\n\x0bMethodStats\x12\x13\n\x06method\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x15\n\x08requests\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x13\n\x06\x65rrors\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x16\n\tin_flight\x18\x04 \x01(\x03H\x03\x88\x01\x01\x12\'\n\x07latency\x18\x05 \x01(\x0b\x32\x11.LatencyHistogramH\x04\x88\x01\x01\x42\t\n\x07_methodB\x0b\n\t_requestsB\t\n\x07_errorsB\x0c\n\n_in_flightB\n\n\x08_latency\"_\n\nStageStats\x12\x12\n\x05stage\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\'\n\x07latency\x18\x02 \x01(\x0b\x32\x11.LatencyHistogramH\x01\x88\x01\x01\x42\x08\n\x06_stageB\n\n\x08_latency\"\xa8\x01\n\nCacheStats\x12\x12\n\x05\x63\x61\x63he\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x11\n\x04hits\x18\x02 \x01(\x03H\x01\x88\x01\x01\x12\x13\n\x06misses\x18\x03 \x01(\x03H\x02\x88\x01\x01\x12\x16\n\tevictions\x18\x04 \x01(\x03H\x03\x88\x01\x01\x12\x11\n\x04size\x18\x05 \x01(\x03H\x04\x88\x01\x01\x42\x08\n\x06_cacheB\x07\n\x05_hitsB\t\n\x07_missesB\x0c\n\n_evictionsB\x07\n\x05_size\"\x96\x01\n\x0bServerStats\x12\x1d\n\x07methods\x18\x01 \x03(\x0b\x32\x0c.MethodStats\x12\x1b\n\x06stages\x18\x02 \x03(\x0b\x32\x0b.StageStats\x12\x1b\n\x0euptime_seconds\x18\x03 \x01(\x01H\x00\x88\x01\x01\x12\x1b\n\x06\x63\x61\x63hes\x18\x04 \x03(\x0b\x32\x0b.CacheStatsB\x11\n\x0f_uptime_seconds\"\xf5\x01\n\tLogRecord\x12\x15\n\x08sequence\x18\x01 \x01(\x03H\x01\x88\x01\x01\x12\x1c\n\x0b\x63reate_post\x18\x02 \x01(\x0b\x32\x05.PostH\x00\x12\"\n\x0e\x63reate_comment\x18\x03 \x01(\x0b\x32\x08.CommentH\x00\x12%\n\tvote_post\x18\x04 \x01(\x0b\x32\x10.VotePostRequestH\x00\x12+\n\x0cvote_comment\x18\x05 \x01(\x0b\x32\x13.VoteCommentRequestH\x00\x12\"\n\x0eupdate_comment\x18\x06 \x01(\x0b\x32\x08.CommentH\x00\x42\n\n\x08mutationB\x0b\n\t_sequence*P\n\tPostState\x12\x15\n\x11POST_STATE_NORMAL\x10\x00\x12\x15\n\x11POST_STATE_LOCKED\x10\x01\x12\x15\n\x11POST_STATE_HIDDEN\x10\x02*B\n\x0c\x43ommentState\x12\x18\n\x14\x43OMMENT_STATE_NORMAL\x10\x00\x12\x18\n\x14\x43OMMENT_STATE_HIDDEN\x10\x01*h\n\x0fReplicationRole\x12\x19\n\x15REPLICATION_ROLE_NONE\x10\x00\x12\x1b\n\x17REPLICATION_ROLE_LEADER\x10\x01\x12\x1d\n\x19REPLICATION_ROLE_FOLLOWER\x10\x02*V\n\nItemStatus\x12\x15\n\x11ITEM_STATUS_FOUND\x10\x00\x12\x19\n\x15ITEM_STATUS_NOT_FOUND\x10\x01\x12\x16\n\x12ITEM_STATUS_HIDDEN\x10\x02\x32\xa8\t\n\rRedditService\x12\x35\n\nCreatePost\x12\x12.CreatePostRequest\x1a\x13.CreatePostResponse\x12/\n\x08VotePost\x12\x10.VotePostRequest\x1a\x11.VotePostResponse\x12\x41\n\x0eGetPostContent\x12\x16.GetPostContentRequest\x1a\x17.GetPostContentResponse\x12>\n\rCreateComment\x12\x15.CreateCommentRequest\x1a\x16.CreateCommentResponse\x12\x38\n\x0bVoteComment\x12\x13.VoteCommentRequest\x1a\x14.VoteCommentResponse\x12Y\n\x16GetMostUpvotedComments\x12\x1e.GetMostUpvotedCommentsRequest\x1a\x1f.GetMostUpvotedCommentsResponse\x12P\n\x13\x45xpandCommentBranch\x12\x1b.ExpandCommentBranchRequest\x1a\x1c.ExpandCommentBranchResponse\x12>\n\rGetPostThread\x12\x15.GetPostThreadRequest\x1a\x16.GetPostThreadResponse\x12\x44\n\x11StreamCommentTree\x12\x1b.ExpandCommentBranchRequest\x1a\x10.CommentTreeNode0\x01\x12\x32\n\tBatchVote\x12\x11.BatchVoteRequest\x1a\x12.BatchVoteResponse\x12M\n\x12\x42\x61tchCreateComment\x12\x1a.BatchCreateCommentRequest\x1a\x1b.BatchCreateCommentResponse\x12\x36\n\x0bStreamVotes\x12\x11.BatchVoteRequest\x1a\x12.BatchVoteResponse(\x01\x12Q\n\x14StreamCreateComments\x12\x1a.BatchCreateCommentRequest\x1a\x1b.BatchCreateCommentResponse(\x01\x12>\n\rBatchGetPosts\x12\x15.BatchGetPostsRequest\x1a\x16.BatchGetPostsResponse\x12G\n\x10\x42\x61tchGetComments\x12\x18.BatchGetCommentsRequest\x1a\x19.BatchGetCommentsResponse\x12,\n\tReplicate\x12\x11.ReplicateRequest\x1a\n.LogRecord0\x01\x12\x45\n\x14GetReplicationStatus\x12\x19.ReplicationStatusRequest\x1a\x12.ReplicationStatus\x12\x33\n\x0eGetServerStats\x12\x13.ServerStatsRequest\x1a\x0c.ServerStatsb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'reddit_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
-  _globals['_POSTSTATE']._serialized_start=2280
-  _globals['_POSTSTATE']._serialized_end=2360
-  _globals['_COMMENTSTATE']._serialized_start=2362
-  _globals['_COMMENTSTATE']._serialized_end=2428
+  _globals['_POSTSTATE']._serialized_start=5151
+  _globals['_POSTSTATE']._serialized_end=5231
+  _globals['_COMMENTSTATE']._serialized_start=5233
+  _globals['_COMMENTSTATE']._serialized_end=5299
+  _globals['_REPLICATIONROLE']._serialized_start=5301
+  _globals['_REPLICATIONROLE']._serialized_end=5405
+  _globals['_ITEMSTATUS']._serialized_start=5407
+  _globals['_ITEMSTATUS']._serialized_end=5493
   _globals['_USER']._serialized_start=16
   _globals['_USER']._serialized_end=56
   _globals['_POST']._serialized_start=59
-  _globals['_POST']._serialized_end=387
-  _globals['_COMMENT']._serialized_start=390
-  _globals['_COMMENT']._serialized_end=751
-  _globals['_CREATEPOSTREQUEST']._serialized_start=753
-  _globals['_CREATEPOSTREQUEST']._serialized_end=807
-  _globals['_CREATEPOSTRESPONSE']._serialized_start=809
-  _globals['_CREATEPOSTRESPONSE']._serialized_end=897
-  _globals['_VOTEPOSTREQUEST']._serialized_start=899
-  _globals['_VOTEPOSTREQUEST']._serialized_end=1023
-  _globals['_VOTEPOSTRESPONSE']._serialized_start=1025
-  _globals['_VOTEPOSTRESPONSE']._serialized_end=1107
-  _globals['_GETPOSTCONTENTREQUEST']._serialized_start=1109
-  _globals['_GETPOSTCONTENTREQUEST']._serialized_end=1166
-  _globals['_GETPOSTCONTENTRESPONSE']._serialized_start=1168
-  _globals['_GETPOSTCONTENTRESPONSE']._serialized_end=1261
-  _globals['_CREATECOMMENTREQUEST']._serialized_start=1263
-  _globals['_CREATECOMMENTREQUEST']._serialized_end=1368
-  _globals['_CREATECOMMENTRESPONSE']._serialized_start=1370
-  _globals['_CREATECOMMENTRESPONSE']._serialized_end=1467
-  _globals['_VOTECOMMENTREQUEST']._serialized_start=1470
-  _globals['_VOTECOMMENTREQUEST']._serialized_end=1603
-  _globals['_VOTECOMMENTRESPONSE']._serialized_start=1605
-  _globals['_VOTECOMMENTRESPONSE']._serialized_end=1690
-  _globals['_GETMOSTUPVOTEDCOMMENTSREQUEST']._serialized_start=1692
-  _globals['_GETMOSTUPVOTEDCOMMENTSREQUEST']._serialized_end=1787
-  _globals['_COMMENTANDWETHERSUBCOMMENTSEXIST']._serialized_start=1789
-  _globals['_COMMENTANDWETHERSUBCOMMENTSEXIST']._serialized_end=1915
-  _globals['_GETMOSTUPVOTEDCOMMENTSRESPONSE']._serialized_start=1917
-  _globals['_GETMOSTUPVOTEDCOMMENTSRESPONSE']._serialized_end=2002
-  _globals['_EXPANDCOMMENTBRANCHREQUEST']._serialized_start=2004
-  _globals['_EXPANDCOMMENTBRANCHREQUEST']._serialized_end=2102
-  _globals['_COMMENTANDSUBCOMMENTS']._serialized_start=2104
-  _globals['_COMMENTANDSUBCOMMENTS']._serialized_end=2202
-  _globals['_EXPANDCOMMENTBRANCHRESPONSE']._serialized_start=2204
-  _globals['_EXPANDCOMMENTBRANCHRESPONSE']._serialized_end=2278
-  _globals['_REDDITSERVICE']._serialized_start=2431
-  _globals['_REDDITSERVICE']._serialized_end=2912
+  _globals['_POST']._serialized_end=433
+  _globals['_COMMENT']._serialized_start=436
+  _globals['_COMMENT']._serialized_end=843
+  _globals['_CREATEPOSTREQUEST']._serialized_start=845
+  _globals['_CREATEPOSTREQUEST']._serialized_end=899
+  _globals['_CREATEPOSTRESPONSE']._serialized_start=901
+  _globals['_CREATEPOSTRESPONSE']._serialized_end=989
+  _globals['_VOTEPOSTREQUEST']._serialized_start=991
+  _globals['_VOTEPOSTREQUEST']._serialized_end=1115
+  _globals['_VOTEPOSTRESPONSE']._serialized_start=1117
+  _globals['_VOTEPOSTRESPONSE']._serialized_end=1199
+  _globals['_GETPOSTCONTENTREQUEST']._serialized_start=1201
+  _globals['_GETPOSTCONTENTREQUEST']._serialized_end=1258
+  _globals['_GETPOSTCONTENTRESPONSE']._serialized_start=1260
+  _globals['_GETPOSTCONTENTRESPONSE']._serialized_end=1353
+  _globals['_CREATECOMMENTREQUEST']._serialized_start=1355
+  _globals['_CREATECOMMENTREQUEST']._serialized_end=1460
+  _globals['_CREATECOMMENTRESPONSE']._serialized_start=1462
+  _globals['_CREATECOMMENTRESPONSE']._serialized_end=1559
+  _globals['_VOTECOMMENTREQUEST']._serialized_start=1562
+  _globals['_VOTECOMMENTREQUEST']._serialized_end=1695
+  _globals['_VOTECOMMENTRESPONSE']._serialized_start=1697
+  _globals['_VOTECOMMENTRESPONSE']._serialized_end=1782
+  _globals['_GETMOSTUPVOTEDCOMMENTSREQUEST']._serialized_start=1784
+  _globals['_GETMOSTUPVOTEDCOMMENTSREQUEST']._serialized_end=1879
+  _globals['_COMMENTANDWETHERSUBCOMMENTSEXIST']._serialized_start=1881
+  _globals['_COMMENTANDWETHERSUBCOMMENTSEXIST']._serialized_end=2007
+  _globals['_GETMOSTUPVOTEDCOMMENTSRESPONSE']._serialized_start=2009
+  _globals['_GETMOSTUPVOTEDCOMMENTSRESPONSE']._serialized_end=2094
+  _globals['_EXPANDCOMMENTBRANCHREQUEST']._serialized_start=2097
+  _globals['_EXPANDCOMMENTBRANCHREQUEST']._serialized_end=2293
+  _globals['_COMMENTANDSUBCOMMENTS']._serialized_start=2295
+  _globals['_COMMENTANDSUBCOMMENTS']._serialized_end=2393
+  _globals['_COMMENTTREE']._serialized_start=2396
+  _globals['_COMMENTTREE']._serialized_end=2532
+  _globals['_EXPANDCOMMENTBRANCHRESPONSE']._serialized_start=2534
+  _globals['_EXPANDCOMMENTBRANCHRESPONSE']._serialized_end=2636
+  _globals['_GETPOSTTHREADREQUEST']._serialized_start=2639
+  _globals['_GETPOSTTHREADREQUEST']._serialized_end=2767
+  _globals['_GETPOSTTHREADRESPONSE']._serialized_start=2769
+  _globals['_GETPOSTTHREADRESPONSE']._serialized_end=2893
+  _globals['_COMMENTTREENODE']._serialized_start=2896
+  _globals['_COMMENTTREENODE']._serialized_end=3035
+  _globals['_BATCHVOTEREQUEST']._serialized_start=3037
+  _globals['_BATCHVOTEREQUEST']._serialized_end=3137
+  _globals['_BATCHVOTERESPONSE']._serialized_start=3139
+  _globals['_BATCHVOTERESPONSE']._serialized_end=3242
+  _globals['_BATCHCREATECOMMENTREQUEST']._serialized_start=3244
+  _globals['_BATCHCREATECOMMENTREQUEST']._serialized_end=3312
+  _globals['_BATCHCREATECOMMENTRESPONSE']._serialized_start=3314
+  _globals['_BATCHCREATECOMMENTRESPONSE']._serialized_end=3384
+  _globals['_BATCHGETPOSTSREQUEST']._serialized_start=3386
+  _globals['_BATCHGETPOSTSREQUEST']._serialized_end=3426
+  _globals['_POSTRESULT']._serialized_start=3428
+  _globals['_POSTRESULT']._serialized_end=3520
+  _globals['_BATCHGETPOSTSRESPONSE']._serialized_start=3522
+  _globals['_BATCHGETPOSTSRESPONSE']._serialized_end=3573
+  _globals['_BATCHGETCOMMENTSREQUEST']._serialized_start=3575
+  _globals['_BATCHGETCOMMENTSREQUEST']._serialized_end=3621
+  _globals['_COMMENTRESULT']._serialized_start=3623
+  _globals['_COMMENTRESULT']._serialized_end=3727
+  _globals['_BATCHGETCOMMENTSRESPONSE']._serialized_start=3729
+  _globals['_BATCHGETCOMMENTSRESPONSE']._serialized_end=3789
+  _globals['_REPLICATEREQUEST']._serialized_start=3791
+  _globals['_REPLICATEREQUEST']._serialized_end=3857
+  _globals['_REPLICATIONSTATUSREQUEST']._serialized_start=3859
+  _globals['_REPLICATIONSTATUSREQUEST']._serialized_end=3885
+  _globals['_REPLICATIONSTATUS']._serialized_start=3888
+  _globals['_REPLICATIONSTATUS']._serialized_end=4143
+  _globals['_SERVERSTATSREQUEST']._serialized_start=4145
+  _globals['_SERVERSTATSREQUEST']._serialized_end=4165
+  _globals['_LATENCYHISTOGRAM']._serialized_start=4167
+  _globals['_LATENCYHISTOGRAM']._serialized_end=4273
+  _globals['_METHODSTATS']._serialized_start=4276
+  _globals['_METHODSTATS']._serialized_end=4480
+  _globals['_STAGESTATS']._serialized_start=4482
+  _globals['_STAGESTATS']._serialized_end=4577
+  _globals['_CACHESTATS']._serialized_start=4580
+  _globals['_CACHESTATS']._serialized_end=4748
+  _globals['_SERVERSTATS']._serialized_start=4751
+  _globals['_SERVERSTATS']._serialized_end=4901
+  _globals['_LOGRECORD']._serialized_start=4904
+  _globals['_LOGRECORD']._serialized_end=5149
+  _globals['_REDDITSERVICE']._serialized_start=5496
+  _globals['_REDDITSERVICE']._serialized_end=6688
 # @@protoc_insertion_point(module_scope)
@@ -16,11 +16,29 @@ class CommentState(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
     __slots__ = []
     COMMENT_STATE_NORMAL: _ClassVar[CommentState]
     COMMENT_STATE_HIDDEN: _ClassVar[CommentState]
+
+class ReplicationRole(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = []
+    REPLICATION_ROLE_NONE: _ClassVar[ReplicationRole]
+    REPLICATION_ROLE_LEADER: _ClassVar[ReplicationRole]
+    REPLICATION_ROLE_FOLLOWER: _ClassVar[ReplicationRole]
+
+class ItemStatus(int, metaclass=_enum_type_wrapper.EnumTypeWrapper):
+    __slots__ = []
+    ITEM_STATUS_FOUND: _ClassVar[ItemStatus]
+    ITEM_STATUS_NOT_FOUND: _ClassVar[ItemStatus]
+    ITEM_STATUS_HIDDEN: _ClassVar[ItemStatus]
 POST_STATE_NORMAL: PostState
 POST_STATE_LOCKED: PostState
 POST_STATE_HIDDEN: PostState
 COMMENT_STATE_NORMAL: CommentState
 COMMENT_STATE_HIDDEN: CommentState
+REPLICATION_ROLE_NONE: ReplicationRole
+REPLICATION_ROLE_LEADER: ReplicationRole
+REPLICATION_ROLE_FOLLOWER: ReplicationRole
+ITEM_STATUS_FOUND: ItemStatus
+ITEM_STATUS_NOT_FOUND: ItemStatus
+ITEM_STATUS_HIDDEN: ItemStatus
 
 class User(_message.Message):
     __slots__ = ["user_id"]
@@ -29,7 +47,7 @@ class User(_message.Message):
     def __init__(self, user_id: _Optional[str] = ...) -> None: ...
 
 class Post(_message.Message):
-    __slots__ = ["post_id", "title", "text", "video_url", "image_url", "author", "score", "post_state", "publication_date"]
+    __slots__ = ["post_id", "title", "text", "video_url", "image_url", "author", "score", "post_state", "publication_date", "comment_count"]
     POST_ID_FIELD_NUMBER: _ClassVar[int]
     TITLE_FIELD_NUMBER: _ClassVar[int]
     TEXT_FIELD_NUMBER: _ClassVar[int]
@@ -39,6 +57,7 @@ class Post(_message.Message):
     SCORE_FIELD_NUMBER: _ClassVar[int]
     POST_STATE_FIELD_NUMBER: _ClassVar[int]
     PUBLICATION_DATE_FIELD_NUMBER: _ClassVar[int]
+    COMMENT_COUNT_FIELD_NUMBER: _ClassVar[int]
     post_id: int
     title: str
     text: str
@@ -48,10 +67,11 @@ class Post(_message.Message):
     score: int
     post_state: PostState
     publication_date: str
-    def __init__(self, post_id: _Optional[int] = ..., title: _Optional[str] = ..., text: _Optional[str] = ..., video_url: _Optional[str] = ..., image_url: _Optional[str] = ..., author: _Optional[_Union[User, _Mapping]] = ..., score: _Optional[int] = ..., post_state: _Optional[_Union[PostState, str]] = ..., publication_date: _Optional[str] = ...) -> None: ...
+    comment_count: int
+    def __init__(self, post_id: _Optional[int] = ..., title: _Optional[str] = ..., text: _Optional[str] = ..., video_url: _Optional[str] = ..., image_url: _Optional[str] = ..., author: _Optional[_Union[User, _Mapping]] = ..., score: _Optional[int] = ..., post_state: _Optional[_Union[PostState, str]] = ..., publication_date: _Optional[str] = ..., comment_count: _Optional[int] = ...) -> None: ...
 
 class Comment(_message.Message):
-    __slots__ = ["comment_id", "parent_post_id", "parent_comment_id", "author", "text", "score", "comment_state", "publication_date"]
+    __slots__ = ["comment_id", "parent_post_id", "parent_comment_id", "author", "text", "score", "comment_state", "publication_date", "comment_count"]
     COMMENT_ID_FIELD_NUMBER: _ClassVar[int]
     PARENT_POST_ID_FIELD_NUMBER: _ClassVar[int]
     PARENT_COMMENT_ID_FIELD_NUMBER: _ClassVar[int]
@@ -60,6 +80,7 @@ class Comment(_message.Message):
     SCORE_FIELD_NUMBER: _ClassVar[int]
     COMMENT_STATE_FIELD_NUMBER: _ClassVar[int]
     PUBLICATION_DATE_FIELD_NUMBER: _ClassVar[int]
+    COMMENT_COUNT_FIELD_NUMBER: _ClassVar[int]
     comment_id: int
     parent_post_id: int
     parent_comment_id: int
@@ -68,7 +89,8 @@ class Comment(_message.Message):
     score: int
     comment_state: CommentState
     publication_date: str
-    def __init__(self, comment_id: _Optional[int] = ..., parent_post_id: _Optional[int] = ..., parent_comment_id: _Optional[int] = ..., author: _Optional[_Union[User, _Mapping]] = ..., text: _Optional[str] = ..., score: _Optional[int] = ..., comment_state: _Optional[_Union[CommentState, str]] = ..., publication_date: _Optional[str] = ...) -> None: ...
+    comment_count: int
+    def __init__(self, comment_id: _Optional[int] = ..., parent_post_id: _Optional[int] = ..., parent_comment_id: _Optional[int] = ..., author: _Optional[_Union[User, _Mapping]] = ..., text: _Optional[str] = ..., score: _Optional[int] = ..., comment_state: _Optional[_Union[CommentState, str]] = ..., publication_date: _Optional[str] = ..., comment_count: _Optional[int] = ...) -> None: ...
 
 class CreatePostRequest(_message.Message):
     __slots__ = ["post"]
@@ -173,12 +195,18 @@ class GetMostUpvotedCommentsResponse(_message.Message):
     def __init__(self, comments: _Optional[_Iterable[_Union[CommentAndWetherSubcommentsExist, _Mapping]]] = ...) -> None: ...
 
 class ExpandCommentBranchRequest(_message.Message):
-    __slots__ = ["comment_id", "limit"]
+    __slots__ = ["comment_id", "limit", "max_depth", "level_limits", "max_nodes"]
     COMMENT_ID_FIELD_NUMBER: _ClassVar[int]
     LIMIT_FIELD_NUMBER: _ClassVar[int]
+    MAX_DEPTH_FIELD_NUMBER: _ClassVar[int]
+    LEVEL_LIMITS_FIELD_NUMBER: _ClassVar[int]
+    MAX_NODES_FIELD_NUMBER: _ClassVar[int]
     comment_id: int
     limit: int
-    def __init__(self, comment_id: _Optional[int] = ..., limit: _Optional[int] = ...) -> None: ...
+    max_depth: int
+    level_limits: _containers.RepeatedScalarFieldContainer[int]
+    max_nodes: int
+    def __init__(self, comment_id: _Optional[int] = ..., limit: _Optional[int] = ..., max_depth: _Optional[int] = ..., level_limits: _Optional[_Iterable[int]] = ..., max_nodes: _Optional[int] = ...) -> None: ...
 
 class CommentAndSubcomments(_message.Message):
     __slots__ = ["comment", "subcomments"]
@@ -188,8 +216,222 @@ class CommentAndSubcomments(_message.Message):
     subcomments: _containers.RepeatedCompositeFieldContainer[Comment]
     def __init__(self, comment: _Optional[_Union[Comment, _Mapping]] = ..., subcomments: _Optional[_Iterable[_Union[Comment, _Mapping]]] = ...) -> None: ...
 
+class CommentTree(_message.Message):
+    __slots__ = ["comment", "has_subcomment", "replies"]
+    COMMENT_FIELD_NUMBER: _ClassVar[int]
+    HAS_SUBCOMMENT_FIELD_NUMBER: _ClassVar[int]
+    REPLIES_FIELD_NUMBER: _ClassVar[int]
+    comment: Comment
+    has_subcomment: bool
+    replies: _containers.RepeatedCompositeFieldContainer[CommentTree]
+    def __init__(self, comment: _Optional[_Union[Comment, _Mapping]] = ..., has_subcomment: bool = ..., replies: _Optional[_Iterable[_Union[CommentTree, _Mapping]]] = ...) -> None: ...
+
 class ExpandCommentBranchResponse(_message.Message):
-    __slots__ = ["subcomments"]
+    __slots__ = ["subcomments", "tree"]
     SUBCOMMENTS_FIELD_NUMBER: _ClassVar[int]
+    TREE_FIELD_NUMBER: _ClassVar[int]
     subcomments: _containers.RepeatedCompositeFieldContainer[CommentAndSubcomments]
-    def __init__(self, subcomments: _Optional[_Iterable[_Union[CommentAndSubcomments, _Mapping]]] = ...) -> None: ...
+    tree: _containers.RepeatedCompositeFieldContainer[CommentTree]
+    def __init__(self, subcomments: _Optional[_Iterable[_Union[CommentAndSubcomments, _Mapping]]] = ..., tree: _Optional[_Iterable[_Union[CommentTree, _Mapping]]] = ...) -> None: ...
+
+class GetPostThreadRequest(_message.Message):
+    __slots__ = ["post_id", "limit", "reply_limit"]
+    POST_ID_FIELD_NUMBER: _ClassVar[int]
+    LIMIT_FIELD_NUMBER: _ClassVar[int]
+    REPLY_LIMIT_FIELD_NUMBER: _ClassVar[int]
+    post_id: int
+    limit: int
+    reply_limit: int
+    def __init__(self, post_id: _Optional[int] = ..., limit: _Optional[int] = ..., reply_limit: _Optional[int] = ...) -> None: ...
+
+class GetPostThreadResponse(_message.Message):
+    __slots__ = ["success", "post", "comments"]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    POST_FIELD_NUMBER: _ClassVar[int]
+    COMMENTS_FIELD_NUMBER: _ClassVar[int]
+    success: bool
+    post: Post
+    comments: _containers.RepeatedCompositeFieldContainer[CommentTree]
+    def __init__(self, success: bool = ..., post: _Optional[_Union[Post, _Mapping]] = ..., comments: _Optional[_Iterable[_Union[CommentTree, _Mapping]]] = ...) -> None: ...
+
+class CommentTreeNode(_message.Message):
+    __slots__ = ["comment", "has_subcomment", "depth"]
+    COMMENT_FIELD_NUMBER: _ClassVar[int]
+    HAS_SUBCOMMENT_FIELD_NUMBER: _ClassVar[int]
+    DEPTH_FIELD_NUMBER: _ClassVar[int]
+    comment: Comment
+    has_subcomment: bool
+    depth: int
+    def __init__(self, comment: _Optional[_Union[Comment, _Mapping]] = ..., has_subcomment: bool = ..., depth: _Optional[int] = ...) -> None: ...
+
+class BatchVoteRequest(_message.Message):
+    __slots__ = ["post_votes", "comment_votes"]
+    POST_VOTES_FIELD_NUMBER: _ClassVar[int]
+    COMMENT_VOTES_FIELD_NUMBER: _ClassVar[int]
+    post_votes: _containers.RepeatedCompositeFieldContainer[VotePostRequest]
+    comment_votes: _containers.RepeatedCompositeFieldContainer[VoteCommentRequest]
+    def __init__(self, post_votes: _Optional[_Iterable[_Union[VotePostRequest, _Mapping]]] = ..., comment_votes: _Optional[_Iterable[_Union[VoteCommentRequest, _Mapping]]] = ...) -> None: ...
+
+class BatchVoteResponse(_message.Message):
+    __slots__ = ["post_votes", "comment_votes"]
+    POST_VOTES_FIELD_NUMBER: _ClassVar[int]
+    COMMENT_VOTES_FIELD_NUMBER: _ClassVar[int]
+    post_votes: _containers.RepeatedCompositeFieldContainer[VotePostResponse]
+    comment_votes: _containers.RepeatedCompositeFieldContainer[VoteCommentResponse]
+    def __init__(self, post_votes: _Optional[_Iterable[_Union[VotePostResponse, _Mapping]]] = ..., comment_votes: _Optional[_Iterable[_Union[VoteCommentResponse, _Mapping]]] = ...) -> None: ...
+
+class BatchCreateCommentRequest(_message.Message):
+    __slots__ = ["comments"]
+    COMMENTS_FIELD_NUMBER: _ClassVar[int]
+    comments: _containers.RepeatedCompositeFieldContainer[CreateCommentRequest]
+    def __init__(self, comments: _Optional[_Iterable[_Union[CreateCommentRequest, _Mapping]]] = ...) -> None: ...
+
+class BatchCreateCommentResponse(_message.Message):
+    __slots__ = ["comments"]
+    COMMENTS_FIELD_NUMBER: _ClassVar[int]
+    comments: _containers.RepeatedCompositeFieldContainer[CreateCommentResponse]
+    def __init__(self, comments: _Optional[_Iterable[_Union[CreateCommentResponse, _Mapping]]] = ...) -> None: ...
+
+class BatchGetPostsRequest(_message.Message):
+    __slots__ = ["post_ids"]
+    POST_IDS_FIELD_NUMBER: _ClassVar[int]
+    post_ids: _containers.RepeatedScalarFieldContainer[int]
+    def __init__(self, post_ids: _Optional[_Iterable[int]] = ...) -> None: ...
+
+class PostResult(_message.Message):
+    __slots__ = ["status", "post"]
+    STATUS_FIELD_NUMBER: _ClassVar[int]
+    POST_FIELD_NUMBER: _ClassVar[int]
+    status: ItemStatus
+    post: Post
+    def __init__(self, status: _Optional[_Union[ItemStatus, str]] = ..., post: _Optional[_Union[Post, _Mapping]] = ...) -> None: ...
+
+class BatchGetPostsResponse(_message.Message):
+    __slots__ = ["posts"]
+    POSTS_FIELD_NUMBER: _ClassVar[int]
+    posts: _containers.RepeatedCompositeFieldContainer[PostResult]
+    def __init__(self, posts: _Optional[_Iterable[_Union[PostResult, _Mapping]]] = ...) -> None: ...
+
+class BatchGetCommentsRequest(_message.Message):
+    __slots__ = ["comment_ids"]
+    COMMENT_IDS_FIELD_NUMBER: _ClassVar[int]
+    comment_ids: _containers.RepeatedScalarFieldContainer[int]
+    def __init__(self, comment_ids: _Optional[_Iterable[int]] = ...) -> None: ...
+
+class CommentResult(_message.Message):
+    __slots__ = ["status", "comment"]
+    STATUS_FIELD_NUMBER: _ClassVar[int]
+    COMMENT_FIELD_NUMBER: _ClassVar[int]
+    status: ItemStatus
+    comment: Comment
+    def __init__(self, status: _Optional[_Union[ItemStatus, str]] = ..., comment: _Optional[_Union[Comment, _Mapping]] = ...) -> None: ...
+
+class BatchGetCommentsResponse(_message.Message):
+    __slots__ = ["comments"]
+    COMMENTS_FIELD_NUMBER: _ClassVar[int]
+    comments: _containers.RepeatedCompositeFieldContainer[CommentResult]
+    def __init__(self, comments: _Optional[_Iterable[_Union[CommentResult, _Mapping]]] = ...) -> None: ...
+
+class ReplicateRequest(_message.Message):
+    __slots__ = ["after_sequence"]
+    AFTER_SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    after_sequence: int
+    def __init__(self, after_sequence: _Optional[int] = ...) -> None: ...
+
+class ReplicationStatusRequest(_message.Message):
+    __slots__ = []
+    def __init__(self) -> None: ...
+
+class ReplicationStatus(_message.Message):
+    __slots__ = ["role", "applied_sequence", "leader_sequence", "lag", "seconds_since_contact"]
+    ROLE_FIELD_NUMBER: _ClassVar[int]
+    APPLIED_SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    LEADER_SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    LAG_FIELD_NUMBER: _ClassVar[int]
+    SECONDS_SINCE_CONTACT_FIELD_NUMBER: _ClassVar[int]
+    role: ReplicationRole
+    applied_sequence: int
+    leader_sequence: int
+    lag: int
+    seconds_since_contact: float
+    def __init__(self, role: _Optional[_Union[ReplicationRole, str]] = ..., applied_sequence: _Optional[int] = ..., leader_sequence: _Optional[int] = ..., lag: _Optional[int] = ..., seconds_since_contact: _Optional[float] = ...) -> None: ...
+
+class ServerStatsRequest(_message.Message):
+    __slots__ = []
+    def __init__(self) -> None: ...
+
+class LatencyHistogram(_message.Message):
+    __slots__ = ["bounds", "counts", "sum", "count"]
+    BOUNDS_FIELD_NUMBER: _ClassVar[int]
+    COUNTS_FIELD_NUMBER: _ClassVar[int]
+    SUM_FIELD_NUMBER: _ClassVar[int]
+    COUNT_FIELD_NUMBER: _ClassVar[int]
+    bounds: _containers.RepeatedScalarFieldContainer[float]
+    counts: _containers.RepeatedScalarFieldContainer[int]
+    sum: float
+    count: int
+    def __init__(self, bounds: _Optional[_Iterable[float]] = ..., counts: _Optional[_Iterable[int]] = ..., sum: _Optional[float] = ..., count: _Optional[int] = ...) -> None: ...
+
+class MethodStats(_message.Message):
+    __slots__ = ["method", "requests", "errors", "in_flight", "latency"]
+    METHOD_FIELD_NUMBER: _ClassVar[int]
+    REQUESTS_FIELD_NUMBER: _ClassVar[int]
+    ERRORS_FIELD_NUMBER: _ClassVar[int]
+    IN_FLIGHT_FIELD_NUMBER: _ClassVar[int]
+    LATENCY_FIELD_NUMBER: _ClassVar[int]
+    method: str
+    requests: int
+    errors: int
+    in_flight: int
+    latency: LatencyHistogram
+    def __init__(self, method: _Optional[str] = ..., requests: _Optional[int] = ..., errors: _Optional[int] = ..., in_flight: _Optional[int] = ..., latency: _Optional[_Union[LatencyHistogram, _Mapping]] = ...) -> None: ...
+
+class StageStats(_message.Message):
+    __slots__ = ["stage", "latency"]
+    STAGE_FIELD_NUMBER: _ClassVar[int]
+    LATENCY_FIELD_NUMBER: _ClassVar[int]
+    stage: str
+    latency: LatencyHistogram
+    def __init__(self, stage: _Optional[str] = ..., latency: _Optional[_Union[LatencyHistogram, _Mapping]] = ...) -> None: ...
+
+class CacheStats(_message.Message):
+    __slots__ = ["cache", "hits", "misses", "evictions", "size"]
+    CACHE_FIELD_NUMBER: _ClassVar[int]
+    HITS_FIELD_NUMBER: _ClassVar[int]
+    MISSES_FIELD_NUMBER: _ClassVar[int]
+    EVICTIONS_FIELD_NUMBER: _ClassVar[int]
+    SIZE_FIELD_NUMBER: _ClassVar[int]
+    cache: str
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    def __init__(self, cache: _Optional[str] = ..., hits: _Optional[int] = ..., misses: _Optional[int] = ..., evictions: _Optional[int] = ..., size: _Optional[int] = ...) -> None: ...
+
+class ServerStats(_message.Message):
+    __slots__ = ["methods", "stages", "uptime_seconds", "caches"]
+    METHODS_FIELD_NUMBER: _ClassVar[int]
+    STAGES_FIELD_NUMBER: _ClassVar[int]
+    UPTIME_SECONDS_FIELD_NUMBER: _ClassVar[int]
+    CACHES_FIELD_NUMBER: _ClassVar[int]
+    methods: _containers.RepeatedCompositeFieldContainer[MethodStats]
+    stages: _containers.RepeatedCompositeFieldContainer[StageStats]
+    uptime_seconds: float
+    caches: _containers.RepeatedCompositeFieldContainer[CacheStats]
+    def __init__(self, methods: _Optional[_Iterable[_Union[MethodStats, _Mapping]]] = ..., stages: _Optional[_Iterable[_Union[StageStats, _Mapping]]] = ..., uptime_seconds: _Optional[float] = ..., caches: _Optional[_Iterable[_Union[CacheStats, _Mapping]]] = ...) -> None: ...
+
+class LogRecord(_message.Message):
+    __slots__ = ["sequence", "create_post", "create_comment", "vote_post", "vote_comment", "update_comment"]
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    CREATE_POST_FIELD_NUMBER: _ClassVar[int]
+    CREATE_COMMENT_FIELD_NUMBER: _ClassVar[int]
+    VOTE_POST_FIELD_NUMBER: _ClassVar[int]
+    VOTE_COMMENT_FIELD_NUMBER: _ClassVar[int]
+    UPDATE_COMMENT_FIELD_NUMBER: _ClassVar[int]
+    sequence: int
+    create_post: Post
+    create_comment: Comment
+    vote_post: VotePostRequest
+    vote_comment: VoteCommentRequest
+    update_comment: Comment
+    def __init__(self, sequence: _Optional[int] = ..., create_post: _Optional[_Union[Post, _Mapping]] = ..., create_comment: _Optional[_Union[Comment, _Mapping]] = ..., vote_post: _Optional[_Union[VotePostRequest, _Mapping]] = ..., vote_comment: _Optional[_Union[VoteCommentRequest, _Mapping]] = ..., update_comment: _Optional[_Union[Comment, _Mapping]] = ...) -> None: ...
@@ -49,6 +49,61 @@ class RedditServiceStub(object):
                 request_serializer=reddit__pb2.ExpandCommentBranchRequest.SerializeToString,
                 response_deserializer=reddit__pb2.ExpandCommentBranchResponse.FromString,
                 )
+        self.GetPostThread = channel.unary_unary(
+                '/RedditService/GetPostThread',
+                request_serializer=reddit__pb2.GetPostThreadRequest.SerializeToString,
+                response_deserializer=reddit__pb2.GetPostThreadResponse.FromString,
+                )
+        self.StreamCommentTree = channel.unary_stream(
+                '/RedditService/StreamCommentTree',
+                request_serializer=reddit__pb2.ExpandCommentBranchRequest.SerializeToString,
+                response_deserializer=reddit__pb2.CommentTreeNode.FromString,
+                )
+        self.BatchVote = channel.unary_unary(
+                '/RedditService/BatchVote',
+                request_serializer=reddit__pb2.BatchVoteRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchVoteResponse.FromString,
+                )
+        self.BatchCreateComment = channel.unary_unary(
+                '/RedditService/BatchCreateComment',
+                request_serializer=reddit__pb2.BatchCreateCommentRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchCreateCommentResponse.FromString,
+                )
+        self.StreamVotes = channel.stream_unary(
+                '/RedditService/StreamVotes',
+                request_serializer=reddit__pb2.BatchVoteRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchVoteResponse.FromString,
+                )
+        self.StreamCreateComments = channel.stream_unary(
+                '/RedditService/StreamCreateComments',
+                request_serializer=reddit__pb2.BatchCreateCommentRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchCreateCommentResponse.FromString,
+                )
+        self.BatchGetPosts = channel.unary_unary(
+                '/RedditService/BatchGetPosts',
+                request_serializer=reddit__pb2.BatchGetPostsRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchGetPostsResponse.FromString,
+                )
+        self.BatchGetComments = channel.unary_unary(
+                '/RedditService/BatchGetComments',
+                request_serializer=reddit__pb2.BatchGetCommentsRequest.SerializeToString,
+                response_deserializer=reddit__pb2.BatchGetCommentsResponse.FromString,
+                )
+        self.Replicate = channel.unary_stream(
+                '/RedditService/Replicate',
+                request_serializer=reddit__pb2.ReplicateRequest.SerializeToString,
+                response_deserializer=reddit__pb2.LogRecord.FromString,
+                )
+        self.GetReplicationStatus = channel.unary_unary(
+                '/RedditService/GetReplicationStatus',
+                request_serializer=reddit__pb2.ReplicationStatusRequest.SerializeToString,
+                response_deserializer=reddit__pb2.ReplicationStatus.FromString,
+                )
+        self.GetServerStats = channel.unary_unary(
+                '/RedditService/GetServerStats',
+                request_serializer=reddit__pb2.ServerStatsRequest.SerializeToString,
+                response_deserializer=reddit__pb2.ServerStats.FromString,
+                )
 
 
 class RedditServiceServicer(object):
@@ -96,6 +151,72 @@ class RedditServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetPostThread(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamCommentTree(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchVote(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchCreateComment(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamVotes(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamCreateComments(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchGetPosts(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchGetComments(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Replicate(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetReplicationStatus(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetServerStats(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RedditServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -134,6 +255,61 @@ def add_RedditServiceServicer_to_server(servicer, server):
                     request_deserializer=reddit__pb2.ExpandCommentBranchRequest.FromString,
                     response_serializer=reddit__pb2.ExpandCommentBranchResponse.SerializeToString,
             ),
+            'GetPostThread': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetPostThread,
+                    request_deserializer=reddit__pb2.GetPostThreadRequest.FromString,
+                    response_serializer=reddit__pb2.GetPostThreadResponse.SerializeToString,
+            ),
+            'StreamCommentTree': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamCommentTree,
+                    request_deserializer=reddit__pb2.ExpandCommentBranchRequest.FromString,
+                    response_serializer=reddit__pb2.CommentTreeNode.SerializeToString,
+            ),
+            'BatchVote': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchVote,
+                    request_deserializer=reddit__pb2.BatchVoteRequest.FromString,
+                    response_serializer=reddit__pb2.BatchVoteResponse.SerializeToString,
+            ),
+            'BatchCreateComment': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchCreateComment,
+                    request_deserializer=reddit__pb2.BatchCreateCommentRequest.FromString,
+                    response_serializer=reddit__pb2.BatchCreateCommentResponse.SerializeToString,
+            ),
+            'StreamVotes': grpc.stream_unary_rpc_method_handler(
+                    servicer.StreamVotes,
+                    request_deserializer=reddit__pb2.BatchVoteRequest.FromString,
+                    response_serializer=reddit__pb2.BatchVoteResponse.SerializeToString,
+            ),
+            'StreamCreateComments': grpc.stream_unary_rpc_method_handler(
+                    servicer.StreamCreateComments,
+                    request_deserializer=reddit__pb2.BatchCreateCommentRequest.FromString,
+                    response_serializer=reddit__pb2.BatchCreateCommentResponse.SerializeToString,
+            ),
+            'BatchGetPosts': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchGetPosts,
+                    request_deserializer=reddit__pb2.BatchGetPostsRequest.FromString,
+                    response_serializer=reddit__pb2.BatchGetPostsResponse.SerializeToString,
+            ),
+            'BatchGetComments': grpc.unary_unary_rpc_method_handler(
+                    servicer.BatchGetComments,
+                    request_deserializer=reddit__pb2.BatchGetCommentsRequest.FromString,
+                    response_serializer=reddit__pb2.BatchGetCommentsResponse.SerializeToString,
+            ),
+            'Replicate': grpc.unary_stream_rpc_method_handler(
+                    servicer.Replicate,
+                    request_deserializer=reddit__pb2.ReplicateRequest.FromString,
+                    response_serializer=reddit__pb2.LogRecord.SerializeToString,
+            ),
+            'GetReplicationStatus': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetReplicationStatus,
+                    request_deserializer=reddit__pb2.ReplicationStatusRequest.FromString,
+                    response_serializer=reddit__pb2.ReplicationStatus.SerializeToString,
+            ),
+            'GetServerStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetServerStats,
+                    request_deserializer=reddit__pb2.ServerStatsRequest.FromString,
+                    response_serializer=reddit__pb2.ServerStats.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'RedditService', rpc_method_handlers)
@@ -262,3 +438,190 @@ class RedditService(object):
             reddit__pb2.ExpandCommentBranchResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetPostThread(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/GetPostThread',
+            reddit__pb2.GetPostThreadRequest.SerializeToString,
+            reddit__pb2.GetPostThreadResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamCommentTree(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/RedditService/StreamCommentTree',
+            reddit__pb2.ExpandCommentBranchRequest.SerializeToString,
+            reddit__pb2.CommentTreeNode.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchVote(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/BatchVote',
+            reddit__pb2.BatchVoteRequest.SerializeToString,
+            reddit__pb2.BatchVoteResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchCreateComment(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/BatchCreateComment',
+            reddit__pb2.BatchCreateCommentRequest.SerializeToString,
+            reddit__pb2.BatchCreateCommentResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamVotes(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/RedditService/StreamVotes',
+            reddit__pb2.BatchVoteRequest.SerializeToString,
+            reddit__pb2.BatchVoteResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamCreateComments(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/RedditService/StreamCreateComments',
+            reddit__pb2.BatchCreateCommentRequest.SerializeToString,
+            reddit__pb2.BatchCreateCommentResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchGetPosts(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/BatchGetPosts',
+            reddit__pb2.BatchGetPostsRequest.SerializeToString,
+            reddit__pb2.BatchGetPostsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def BatchGetComments(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/BatchGetComments',
+            reddit__pb2.BatchGetCommentsRequest.SerializeToString,
+            reddit__pb2.BatchGetCommentsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def Replicate(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/RedditService/Replicate',
+            reddit__pb2.ReplicateRequest.SerializeToString,
+            reddit__pb2.LogRecord.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetReplicationStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/GetReplicationStatus',
+            reddit__pb2.ReplicationStatusRequest.SerializeToString,
+            reddit__pb2.ReplicationStatus.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetServerStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/RedditService/GetServerStats',
+            reddit__pb2.ServerStatsRequest.SerializeToString,
+            reddit__pb2.ServerStats.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
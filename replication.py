@@ -0,0 +1,405 @@
+import collections
+from concurrent import futures
+import itertools
+import threading
+import time
+
+import grpc
+
+import reddit_pb2
+import reddit_pb2_grpc
+
+# RPCs changing the data, which followers refuse
+WRITE_METHODS = frozenset((
+    'CreatePost', 'VotePost', 'CreateComment', 'VoteComment', 'BatchVote',
+    'StreamVotes', 'BatchCreateComment', 'StreamCreateComments'))
+
+# metadata keys: the log position a server's answer reflects (trailing
+# metadata of unary answers), and the position a read must reflect
+LOG_POSITION = 'log-position'
+MIN_LOG_POSITION = 'min-log-position'
+
+
+class ReplicationLog:
+    """
+    The log of a replication leader, used as the controller's log. It
+    keeps the last `capacity` records, serialized, for followers to
+    stream, and passes every record on to a write-ahead log if one is
+    given (which then numbers the records). Without one, numbering goes
+    on from `sequence`, the position of the data the leader started with.
+    `records` are records already applied before, e.g. replayed from the
+    write-ahead log, that followers may still need.
+    """
+
+    def __init__(self, log=None, capacity: int = 1_000_000,
+                 sequence: int = 0, records=()):
+        self.log = log
+        self.records = collections.deque(
+            (record.SerializeToString() for record in records),
+            maxlen=capacity)
+        self.appended = log.appended if log is not None else sequence
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def append(self, record: reddit_pb2.LogRecord):
+        """Number and keep a record, return its sequence"""
+        with self.lock:
+            if self.log is None:
+                record.sequence = self.appended + 1
+            else:
+                self.log.append(record)
+            self.records.append(record.SerializeToString())
+            self.appended = record.sequence
+            self.changed.notify_all()
+            return record.sequence
+
+    def sync(self, sequence: int):
+        if self.log is not None:
+            self.log.sync(sequence)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+
+    def read(self, after: int, timeout: float):
+        """
+        Return the serialized records after sequence `after` and the last
+        sequence, waiting up to timeout for one if there is none yet.
+        Raises LookupError if some of them are no longer kept.
+        """
+        with self.lock:
+            if self.appended <= after:
+                self.changed.wait(timeout)
+            missing = self.appended - after
+            if missing > len(self.records):
+                raise LookupError(f"records after {after} are no longer kept")
+            records = list(itertools.islice(reversed(self.records), missing))
+            records.reverse()
+            return records, self.appended
+
+    def position(self):
+        return self.appended
+
+    def status(self):
+        return reddit_pb2.ReplicationStatus(
+            role=reddit_pb2.ReplicationRole.REPLICATION_ROLE_LEADER,
+            applied_sequence=self.appended, leader_sequence=self.appended,
+            lag=0, seconds_since_contact=0.0)
+
+
+class Follower:
+    """
+    Keeps a controller up to date with the log of a leader: a thread
+    streams the leader's records from position `applied` on and applies
+    them in order, reconnecting every retry_interval seconds if the
+    stream breaks. The controller must not be changed otherwise.
+    """
+
+    def __init__(self, reddit_controller, leader: str, applied: int = 0,
+                 retry_interval: float = 1.0):
+        self.controller = reddit_controller
+        self.leader = leader
+        self.retry_interval = retry_interval
+        self.applied = applied
+        self.leader_sequence = applied
+        self.last_contact = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.closed = threading.Event()
+        self.call = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def run(self):
+        with grpc.insecure_channel(self.leader) as channel:
+            stub = reddit_pb2_grpc.RedditServiceStub(channel)
+            while True:
+                with self.lock:
+                    # close() cancels the call, or this sees it closed
+                    if self.closed.is_set():
+                        return
+                    self.call = stub.Replicate(reddit_pb2.ReplicateRequest(
+                        after_sequence=self.applied))
+                try:
+                    for record in self.call:
+                        self.receive(record)
+                except ValueError as error:
+                    # the log does not fit the data this follower started with
+                    self.error = error
+                    return
+                except grpc.RpcError as error:
+                    self.error = error
+                    if error.code() in (grpc.StatusCode.OUT_OF_RANGE,
+                                        grpc.StatusCode.FAILED_PRECONDITION):
+                        # the leader cannot bring this follower up to date
+                        return
+                self.closed.wait(self.retry_interval)
+
+    def receive(self, record: reddit_pb2.LogRecord):
+        # a record without a change only tells the leader's position
+        if record.WhichOneof('mutation') is not None and \
+                record.sequence > self.applied:
+            self.controller.apply_record(record)
+            applied = record.sequence
+        else:
+            applied = self.applied
+        with self.lock:
+            self.applied = applied
+            self.leader_sequence = max(self.leader_sequence, record.sequence)
+            self.last_contact = time.monotonic()
+            self.changed.notify_all()
+
+    def wait_for(self, sequence: int, timeout: float):
+        """Wait until record `sequence` is applied, return False on timeout"""
+        with self.lock:
+            return self.changed.wait_for(
+                lambda: self.applied >= sequence, timeout)
+
+    def position(self):
+        return self.applied
+
+    def status(self):
+        with self.lock:
+            return reddit_pb2.ReplicationStatus(
+                role=reddit_pb2.ReplicationRole.REPLICATION_ROLE_FOLLOWER,
+                applied_sequence=self.applied,
+                leader_sequence=self.leader_sequence,
+                lag=self.leader_sequence - self.applied,
+                seconds_since_contact=-1.0 if self.last_contact is None else
+                time.monotonic() - self.last_contact)
+
+    def close(self):
+        with self.lock:
+            self.closed.set()
+            if self.call is not None:
+                self.call.cancel()
+        self.thread.join()
+
+
+def wrap_behavior(handler, wrap):
+    """Return the handler with its behavior function replaced by wrap(it)"""
+    for kind in ('unary_unary', 'unary_stream', 'stream_unary',
+                 'stream_stream'):
+        behavior = getattr(handler, kind)
+        if behavior is not None:
+            return handler._replace(**{kind: wrap(behavior)})
+    return handler
+
+
+class PositionInterceptor(grpc.ServerInterceptor):
+    """
+    Sends position() as the log-position trailing metadata of every
+    unary answer, read after the answer was computed: a client reading
+    from a follower with it as min-log-position sees the changes of
+    its earlier calls. Behaviors are wrapped rather than run here, as
+    intercept_service runs before the call is handed to a worker thread.
+    """
+
+    def __init__(self, position):
+        self.position = position
+        self.handlers = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or handler.response_streaming:
+            return handler
+        wrapped = self.handlers.get(handler, None)
+        if wrapped is None:
+            wrapped = self.handlers[handler] = wrap_behavior(
+                handler, self.with_position)
+        return wrapped
+
+    def with_position(self, behavior):
+        def call(request, context):
+            response = behavior(request, context)
+            context.set_trailing_metadata(
+                ((LOG_POSITION, str(self.position())),))
+            return response
+        return call
+
+
+class FollowerInterceptor(grpc.ServerInterceptor):
+    """
+    Makes a follower's server read-only, and holds each call with a
+    min-log-position metadata until the follower applied that record,
+    failing it with UNAVAILABLE after max_wait seconds.
+    """
+
+    def __init__(self, follower: Follower, max_wait: float = 1.0):
+        self.follower = follower
+        self.max_wait = max_wait
+        self.handlers = {}
+        self.refusing = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        if handler_call_details.method.rsplit('/', 1)[-1] in WRITE_METHODS:
+            return self.read_only(continuation(handler_call_details))
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return handler
+        wrapped = self.handlers.get(handler, None)
+        if wrapped is None:
+            wrapped = self.handlers[handler] = wrap_behavior(
+                handler, self.after_position)
+        return wrapped
+
+    def read_only(self, handler):
+        if handler is None:
+            return handler
+        wrapped = self.refusing.get(handler, None)
+        if wrapped is None:
+            wrapped = self.refusing[handler] = wrap_behavior(
+                handler, lambda behavior: self.refuse)
+        return wrapped
+
+    @staticmethod
+    def refuse(request, context):
+        context.abort(grpc.StatusCode.FAILED_PRECONDITION,
+                      'this server is a read-only follower')
+
+    def after_position(self, behavior):
+        def call(request, context):
+            for key, value in context.invocation_metadata():
+                if key == MIN_LOG_POSITION and not self.follower.wait_for(
+                        int(value), self.max_wait):
+                    context.abort(grpc.StatusCode.UNAVAILABLE,
+                                  f'follower has not applied record {value}')
+            return behavior(request, context)
+        return call
+
+
+class FollowerPool(futures.ThreadPoolExecutor):
+    """
+    The threads of a leader's Replicate streams, one per follower,
+    counting the streams it holds (gRPC hands it cancelled calls too).
+    """
+
+    def __init__(self, max_followers: int):
+        super().__init__(max_workers=max_followers)
+        self.max_followers = max_followers
+        self.streams = 0
+        self.lock = threading.Lock()
+
+    def full(self):
+        with self.lock:
+            return self.streams >= self.max_followers
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self.lock:
+            self.streams += 1
+
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.streams -= 1
+        return super().submit(run)
+
+
+class LeaderInterceptor(grpc.ServerInterceptor):
+    """
+    Runs the Replicate streams of a leader's server on a FollowerPool,
+    so a follower holds one of its threads rather than a worker
+    answering calls, for as long as it is connected. A follower beyond
+    max_followers is refused with RESOURCE_EXHAUSTED, and retries after
+    its retry_interval. gRPC looks the handler up and hands the call to
+    the pool on one thread, so full() is not raced.
+    """
+
+    def __init__(self, max_followers: int = 16):
+        self.pool = FollowerPool(max_followers)
+        self.handlers = {}
+        self.refusing = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or \
+                not handler_call_details.method.endswith('/Replicate'):
+            return handler
+        if self.pool.full():
+            wrapped = self.refusing.get(handler, None)
+            if wrapped is None:
+                wrapped = self.refusing[handler] = wrap_behavior(
+                    handler, lambda behavior: self.refuse)
+            return wrapped
+        wrapped = self.handlers.get(handler, None)
+        if wrapped is None:
+            wrapped = self.handlers[handler] = wrap_behavior(
+                handler, self.on_pool)
+        return wrapped
+
+    @staticmethod
+    def refuse(request, context):
+        context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                      'leader has as many followers as it streams to')
+
+    def on_pool(self, behavior):
+        def call(request, context):
+            yield from behavior(request, context)
+        call.experimental_thread_pool = self.pool
+        return call
+
+
+class ReadYourWritesStub:
+    """
+    A RedditServiceStub for RedditClient over a leader and followers:
+    writes go to the leader, reads to the followers in turn, each with
+    the log position of the client's last write as min-log-position, so
+    the client always sees its own changes. A read a follower cannot
+    answer in time is sent to the leader.
+    """
+
+    def __init__(self, leader, followers):
+        self.leader = leader
+        self.followers = itertools.cycle(followers)
+        self.position = 0
+
+    def __getattr__(self, method: str):
+        if method in WRITE_METHODS:
+            return WriteCall(self, getattr(self.leader, method))
+        return ReadCall(self, method)
+
+    def metadata(self):
+        return ((MIN_LOG_POSITION, str(self.position)),)
+
+    def saw(self, call):
+        for key, value in call.trailing_metadata() or ():
+            if key == LOG_POSITION:
+                self.position = max(self.position, int(value))
+
+
+class WriteCall:
+
+    def __init__(self, stub: ReadYourWritesStub, method):
+        self.stub = stub
+        self.method = method
+
+    def __call__(self, request, **kwargs):
+        response, call = self.method.with_call(request, **kwargs)
+        self.stub.saw(call)
+        return response
+
+
+class ReadCall:
+
+    def __init__(self, stub: ReadYourWritesStub, method: str):
+        self.stub = stub
+        self.method = method
+
+    def __call__(self, request, **kwargs):
+        follower = getattr(next(self.stub.followers), self.method)
+        try:
+            return follower(request, metadata=self.stub.metadata(), **kwargs)
+        except grpc.RpcError as error:
+            if error.code() != grpc.StatusCode.UNAVAILABLE:
+                raise
+        return getattr(self.stub.leader, self.method)(request, **kwargs)
+
+    def future(self, request, **kwargs):
+        return getattr(next(self.stub.followers), self.method).future(
+            request, metadata=self.stub.metadata(), **kwargs)
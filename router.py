@@ -0,0 +1,266 @@
+import argparse
+import itertools
+from concurrent import futures
+
+import grpc
+
+import ids
+import reddit_pb2
+import reddit_pb2_grpc
+
+# Fields holding post or comment ids, in any request or response message
+ID_FIELDS = frozenset(('post_id', 'comment_id', 'parent_post_id',
+                       'parent_comment_id', 'post_ids', 'comment_ids'))
+
+
+def map_ids(message, function):
+    """Replace every id set in a message (and its sub messages) by function(id)"""
+    for field, value in message.ListFields():
+        repeated = field.label == field.LABEL_REPEATED
+        if field.type == field.TYPE_MESSAGE:
+            for sub_message in (value if repeated else (value,)):
+                map_ids(sub_message, function)
+        elif field.name in ID_FIELDS:
+            if repeated:
+                value[:] = [function(item_id) for item_id in value]
+            else:
+                setattr(message, field.name, function(value))
+    return message
+
+
+class RedditRouter(reddit_pb2_grpc.RedditServiceServicer):
+    """
+    Front end of a sharded deployment: N server.py processes (shards),
+    each with its own controller, and this servicer forwarding every RPC
+    to the shard owning the post or comment it is about.
+
+    Ids are global: the post or comment of row `local` of shard s has id
+    local * N + s, so the shard of any id is id % N. A comment lives on
+    the shard of its parent, so a post and its whole comment tree are on
+    one shard. Shards know nothing of it, the router translates the ids
+    of every request to the shard's rows and of every response back.
+    New posts go to the shards in turn; batches are split by shard and
+    the parts sent concurrently.
+
+    If the shards allocate ids (ids.py, each with its shard number), the
+    ids are global as they are: pass an allocator of the same kind as
+    `ids`, whose shard_of() then finds the shard of an id, and nothing
+    is translated.
+    """
+
+    def __init__(self, addresses, ids=None):
+        self.channels = [grpc.insecure_channel(address)
+                         for address in addresses]
+        self.stubs = [reddit_pb2_grpc.RedditServiceStub(channel)
+                      for channel in self.channels]
+        self.next_shard = itertools.count()
+        self.ids = ids
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+
+    def shard(self, item_id: int):
+        if self.ids is not None:
+            return self.ids.shard_of(item_id) % len(self.stubs)
+        return item_id % len(self.stubs)
+
+    def to_local(self, message):
+        if self.ids is not None:
+            return message
+        shards = len(self.stubs)
+        return map_ids(message, lambda item_id: item_id // shards)
+
+    def to_global(self, message, shard: int):
+        if self.ids is not None:
+            return message
+        shards = len(self.stubs)
+        return map_ids(message, lambda item_id: item_id * shards + shard)
+
+    def call(self, method: str, shard: int, request, context):
+        """Call a unary method of a shard, with ids translated both ways"""
+        try:
+            response = getattr(self.stubs[shard], method)(
+                self.to_local(request),
+                metadata=context.invocation_metadata())
+        except grpc.RpcError as error:
+            context.abort(error.code(), error.details())
+        return self.to_global(response, shard)
+
+    def call_shards(self, method: str, requests, context):
+        """
+        Call a unary method of several shards at once with a {shard:
+        request} dict, return {shard: response}.
+        """
+        calls = {shard: getattr(self.stubs[shard], method).future(
+            self.to_local(request), metadata=context.invocation_metadata())
+            for shard, request in requests.items()}
+        try:
+            return {shard: self.to_global(call.result(), shard)
+                    for shard, call in calls.items()}
+        except grpc.RpcError as error:
+            context.abort(error.code(), error.details())
+
+    def split(self, item_ids):
+        """Return {shard: [indexes of the ids it owns]}"""
+        indexes = {}
+        for i, item_id in enumerate(item_ids):
+            indexes.setdefault(self.shard(item_id), []).append(i)
+        return indexes
+
+    def CreatePost(self, request, context):
+        shard = next(self.next_shard) % len(self.stubs)
+        return self.call('CreatePost', shard, request, context)
+
+    def VotePost(self, request, context):
+        return self.call('VotePost', self.shard(request.post_id), request,
+                         context)
+
+    def GetPostContent(self, request, context):
+        return self.call('GetPostContent', self.shard(request.post_id),
+                         request, context)
+
+    def comment_shard(self, comment: reddit_pb2.Comment):
+        if comment.HasField('parent_comment_id'):
+            return self.shard(comment.parent_comment_id)
+        if comment.HasField('parent_post_id'):
+            return self.shard(comment.parent_post_id)
+        return next(self.next_shard) % len(self.stubs)
+
+    def CreateComment(self, request, context):
+        return self.call('CreateComment', self.comment_shard(request.comment),
+                         request, context)
+
+    def VoteComment(self, request, context):
+        return self.call('VoteComment', self.shard(request.comment_id),
+                         request, context)
+
+    def BatchVote(self, request, context):
+        post_shards = self.split([vote.post_id
+                                  for vote in request.post_votes])
+        comment_shards = self.split([vote.comment_id
+                                     for vote in request.comment_votes])
+        requests = {}
+        for shard in set(post_shards).union(comment_shards):
+            requests[shard] = reddit_pb2.BatchVoteRequest(
+                post_votes=[request.post_votes[i]
+                            for i in post_shards.get(shard, ())],
+                comment_votes=[request.comment_votes[i]
+                               for i in comment_shards.get(shard, ())])
+        responses = self.call_shards('BatchVote', requests, context)
+        post_votes = [None] * len(request.post_votes)
+        comment_votes = [None] * len(request.comment_votes)
+        for shard, response in responses.items():
+            for i, result in zip(post_shards.get(shard, ()),
+                                 response.post_votes):
+                post_votes[i] = result
+            for i, result in zip(comment_shards.get(shard, ()),
+                                 response.comment_votes):
+                comment_votes[i] = result
+        return reddit_pb2.BatchVoteResponse(post_votes=post_votes,
+                                            comment_votes=comment_votes)
+
+    def StreamVotes(self, request_iterator, context):
+        response = reddit_pb2.BatchVoteResponse()
+        for request in request_iterator:
+            response.MergeFrom(self.BatchVote(request, context))
+        return response
+
+    def BatchCreateComment(self, request, context):
+        shards = {}
+        for i, item in enumerate(request.comments):
+            shards.setdefault(self.comment_shard(item.comment), []).append(i)
+        responses = self.call_shards('BatchCreateComment', {
+            shard: reddit_pb2.BatchCreateCommentRequest(
+                comments=[request.comments[i] for i in indexes])
+            for shard, indexes in shards.items()}, context)
+        return reddit_pb2.BatchCreateCommentResponse(
+            comments=self.merge(shards, responses, 'comments',
+                                len(request.comments)))
+
+    def StreamCreateComments(self, request_iterator, context):
+        response = reddit_pb2.BatchCreateCommentResponse()
+        for request in request_iterator:
+            response.MergeFrom(self.BatchCreateComment(request, context))
+        return response
+
+    def merge(self, shards, responses, field: str, count: int):
+        """Put the results of every shard back in request order"""
+        results = [None] * count
+        for shard, indexes in shards.items():
+            for i, result in zip(indexes, getattr(responses[shard], field)):
+                results[i] = result
+        return results
+
+    def BatchGetPosts(self, request, context):
+        shards = self.split(request.post_ids)
+        responses = self.call_shards('BatchGetPosts', {
+            shard: reddit_pb2.BatchGetPostsRequest(
+                post_ids=[request.post_ids[i] for i in indexes])
+            for shard, indexes in shards.items()}, context)
+        return reddit_pb2.BatchGetPostsResponse(
+            posts=self.merge(shards, responses, 'posts',
+                             len(request.post_ids)))
+
+    def BatchGetComments(self, request, context):
+        shards = self.split(request.comment_ids)
+        responses = self.call_shards('BatchGetComments', {
+            shard: reddit_pb2.BatchGetCommentsRequest(
+                comment_ids=[request.comment_ids[i] for i in indexes])
+            for shard, indexes in shards.items()}, context)
+        return reddit_pb2.BatchGetCommentsResponse(
+            comments=self.merge(shards, responses, 'comments',
+                                len(request.comment_ids)))
+
+    def GetMostUpvotedComments(self, request, context):
+        return self.call('GetMostUpvotedComments', self.shard(request.post_id),
+                         request, context)
+
+    def ExpandCommentBranch(self, request, context):
+        return self.call('ExpandCommentBranch',
+                         self.shard(request.comment_id), request, context)
+
+    def GetPostThread(self, request, context):
+        return self.call('GetPostThread', self.shard(request.post_id),
+                         request, context)
+
+    def StreamCommentTree(self, request, context):
+        shard = self.shard(request.comment_id)
+        try:
+            for node in self.stubs[shard].StreamCommentTree(
+                    self.to_local(request),
+                    metadata=context.invocation_metadata()):
+                yield self.to_global(node, shard)
+        except grpc.RpcError as error:
+            context.abort(error.code(), error.details())
+
+
+def make_router(host, port, addresses, max_workers=10, ids=None):
+    """Return the started router server and the port it listens on"""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    router = RedditRouter(addresses, ids)
+    reddit_pb2_grpc.add_RedditServiceServicer_to_server(router, server)
+    port = server.add_insecure_port(f"{host}:{port}")
+    server.start()
+    return server, port
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='forward RedditService calls to the shard owning '
+        'their post or comment')
+    parser.add_argument('--port', type=int, default=50051)
+    parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--shards', type=str, nargs='+', required=True,
+                        metavar='HOST:PORT',
+                        help='addresses of the shard servers, in shard order')
+    parser.add_argument('--max-workers', type=int, default=10)
+    parser.add_argument('--ids', type=str, default='rows', choices=ids.KINDS,
+                        help='id allocator of the shards (server.py --ids)')
+    parser.add_argument('--id-block-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    server, _ = make_router(
+        args.host, args.port, args.shards, args.max_workers,
+        ids.allocator(args.ids, 0, len(args.shards), args.id_block_size))
+    server.wait_for_termination()
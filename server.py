@@ -1,15 +1,76 @@
 import grpc
+import grpc.aio
 from concurrent import futures
 import argparse
+import asyncio
+import collections
+import itertools
+import json
+import sys
+import threading
+import time
+import reddit_pb2
 import reddit_pb2_grpc
+import os
 import controller
+import dataset
+import ids
+import ranking
+import wire
+from cache import ResponseCache
+from metrics import AsyncMetricsInterceptor, Metrics, MetricsInterceptor, \
+    serve_http
+import snapshot
+import wal
+from replication import Follower, FollowerInterceptor, LeaderInterceptor, \
+    PositionInterceptor, ReplicationLog, wrap_behavior
+from storage import NO_ID
+
+FOUND = reddit_pb2.ItemStatus.ITEM_STATUS_FOUND
+
+COMPRESSION = {'none': grpc.Compression.NoCompression,
+               'deflate': grpc.Compression.Deflate,
+               'gzip': grpc.Compression.Gzip}
 
 
 class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
 
-    def __init__(self):
-        self.controller = controller.RedditNativeController()
-        self.controller.init()
+    def __init__(self, reddit_controller=None, cache_size=10_000,
+                 max_staleness=0.0, raw_responses=False,
+                 max_tree_nodes=10_000, replication=None, heartbeat=1.0,
+                 metrics=None):
+        if reddit_controller is None:
+            reddit_controller = controller.RedditNativeController()
+            reddit_controller.init()
+        self.controller = reddit_controller
+        # answer the comment RPCs with wire.RawResponse, assembled from the
+        # serialized comments (needs wire.RawResponseInterceptor)
+        self.raw_responses = raw_responses
+        # most comments in one ExpandCommentBranch tree, whatever is asked
+        self.max_tree_nodes = max_tree_nodes
+        # answers of GetMostUpvotedComments and ExpandCommentBranch,
+        # checked against the controller's versions (cache_size 0: off)
+        self.cache = ResponseCache(cache_size, max_staleness) \
+            if cache_size > 0 else None
+        # the ReplicationLog of a leader or the Follower of a follower;
+        # an idle Replicate stream sends the leader's position every
+        # heartbeat seconds
+        self.replication = replication
+        self.heartbeat = heartbeat
+        # metrics.Metrics for GetServerStats, None if they are not kept
+        self.metrics = metrics
+        if metrics is not None and self.cache is not None:
+            metrics.add_cache('responses', self.cache)
+
+    def cached(self, key, version, compute):
+        """Return the cached response of key, or compute and cache it"""
+        if self.cache is None:
+            return compute()
+        response = self.cache.get(key, version)
+        if response is None:
+            response = compute()
+            self.cache.put(key, version, response)
+        return response
 
     def CreatePost(self, request, context):
         if not request.HasField('post'):
@@ -43,7 +104,7 @@ class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
             return reddit_pb2.GetPostContentResponse(success=False)
 
         post_id = request.post_id
-        post = self.controller.get_post_content(post_id)
+        post = self.controller.get_post(post_id)
         if post is None:
             return reddit_pb2.GetPostContentResponse(success=False)
         else:
@@ -52,12 +113,12 @@ class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
     def CreateComment(self, request, context):
         if not request.HasField('comment'):
             return reddit_pb2.CreateCommentResponse(success=False)
-        comment = self.controller.create_comment(request.comment)
+        comment = request.comment
         if request.HasField('author'):
-            author = request.author
-            comment.author = author
-
-        self.controller.create_comment(request.comment)
+            comment.author.CopyFrom(request.author)
+        comment = self.controller.create_comment(comment)
+        if comment is None:
+            return reddit_pb2.CreateCommentResponse(success=False)
         return reddit_pb2.CreateCommentResponse(success=True, comment_id=comment.comment_id)
 
     def VoteComment(self, request, context):
@@ -82,10 +143,123 @@ class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
                 success=False,
             )
 
+    def BatchVote(self, request, context):
+        return self.batch_vote(request)
+
+    def StreamVotes(self, request_iterator, context):
+        # each batch is applied as it arrives
+        response = reddit_pb2.BatchVoteResponse()
+        for request in request_iterator:
+            response.MergeFrom(self.batch_vote(request))
+        return response
+
+    def batch_vote(self, request):
+        response = reddit_pb2.BatchVoteResponse()
+        self.apply_votes(request.post_votes, 'post_id',
+                         self.controller.vote_posts, response.post_votes)
+        self.apply_votes(request.comment_votes, 'comment_id',
+                         self.controller.vote_comments,
+                         response.comment_votes)
+        return response
+
+    def apply_votes(self, votes, id_field, vote_items, responses):
+        """Apply the complete votes of a batch together, answer each vote"""
+        complete = [i for i, vote in enumerate(votes)
+                    if vote.HasField(id_field) and vote.HasField('user') and
+                    vote.HasField('is_upvote')]
+        results = [(False, 0)] * len(votes)
+        for i, result in zip(complete, vote_items(
+                [(getattr(votes[i], id_field), votes[i].user.user_id,
+                  votes[i].is_upvote) for i in complete])):
+            results[i] = result
+        for success, score in results:
+            if success:
+                responses.add(success=True, score=score)
+            else:
+                responses.add(success=False)
+
+    def BatchCreateComment(self, request, context):
+        return self.batch_create_comment(request)
+
+    def StreamCreateComments(self, request_iterator, context):
+        response = reddit_pb2.BatchCreateCommentResponse()
+        for request in request_iterator:
+            response.MergeFrom(self.batch_create_comment(request))
+        return response
+
+    def batch_create_comment(self, request):
+        comments = []
+        for item in request.comments:
+            if item.HasField('comment'):
+                comment = item.comment
+                if item.HasField('author'):
+                    comment.author.CopyFrom(item.author)
+                comments.append(comment)
+        created = iter(self.controller.create_comments(comments))
+        response = reddit_pb2.BatchCreateCommentResponse()
+        for item in request.comments:
+            comment = next(created) if item.HasField('comment') else None
+            if comment is not None:
+                response.comments.add(
+                    success=True, comment_id=comment.comment_id)
+            else:
+                response.comments.add(success=False)
+        return response
+
+    def BatchGetPosts(self, request, context):
+        response = reddit_pb2.BatchGetPostsResponse()
+        for post_id in request.post_ids:
+            post = self.controller.get_post(post_id)
+            if post is None:
+                response.posts.add(
+                    status=self.missing(self.controller.posts, post_id))
+            else:
+                response.posts.add(status=FOUND, post=post)
+        return response
+
+    def BatchGetComments(self, request, context):
+        if self.raw_responses:
+            results = []
+            for comment_id in request.comment_ids:
+                row = self.controller.comment_row(comment_id)
+                if row == NO_ID:
+                    results.append((self.missing(
+                        self.controller.comments, comment_id), None))
+                else:
+                    results.append((FOUND, self.controller.comment_bytes(row)))
+            return wire.RawResponse(wire.item_results(results))
+        response = reddit_pb2.BatchGetCommentsResponse()
+        for comment_id in request.comment_ids:
+            comment = self.controller.get_comment(comment_id)
+            if comment is None:
+                response.comments.add(
+                    status=self.missing(self.controller.comments, comment_id))
+            else:
+                response.comments.add(status=FOUND, comment=comment)
+        return response
+
+    def missing(self, store, item_id):
+        """ItemStatus of an item the controller did not return"""
+        if item_id in store:
+            return reddit_pb2.ItemStatus.ITEM_STATUS_HIDDEN
+        return reddit_pb2.ItemStatus.ITEM_STATUS_NOT_FOUND
+
     def GetMostUpvotedComments(self, request, context):
+        post_id = request.post_id
         limit = request.limit
+        return self.cached(
+            ('GetMostUpvotedComments', post_id, limit),
+            self.controller.post_version(post_id),
+            lambda: self.most_upvoted_comments(post_id, limit))
+
+    def most_upvoted_comments(self, post_id, limit):
+        if self.raw_responses:
+            comment_bytes = self.controller.comment_bytes
+            return wire.RawResponse(wire.most_upvoted_comments(
+                (comment_bytes(comment_id), has_sub) for comment_id, has_sub
+                in self.controller.top_comment_ids(post_id, limit)))
         result = self.controller.retrieve_n_most_upvoted_comment(
-            request.post_id, limit)
+            post_id, limit)
         comment_pair_list = []
         for comment, has_sub in result:
             comment_pair_list.append(
@@ -99,9 +273,25 @@ class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
         )
 
     def ExpandCommentBranch(self, request, context):
+        comment_id = request.comment_id
         limit = request.limit
-        result = self.controller.retrieve_comment_branch(
-            request.comment_id, limit)
+        if request.HasField('max_depth'):
+            # versions only track two levels, deeper trees are not cached
+            return self.comment_tree(request)
+        return self.cached(
+            ('ExpandCommentBranch', comment_id, limit),
+            self.controller.comment_version(comment_id),
+            lambda: self.comment_branch(comment_id, limit))
+
+    def comment_branch(self, comment_id, limit):
+        if self.raw_responses:
+            comment_bytes = self.controller.comment_bytes
+            return wire.RawResponse(wire.comment_branch(
+                (comment_bytes(sub_id), [comment_bytes(sub_sub_id)
+                                         for sub_sub_id in sub_sub_ids])
+                for sub_id, sub_sub_ids
+                in self.controller.comment_branch_ids(comment_id, limit)))
+        result = self.controller.retrieve_comment_branch(comment_id, limit)
         comment_subcomments_list = []
         for sub_comment_dict in result:
             sub = sub_comment_dict['sub_comment']
@@ -116,6 +306,196 @@ class RedditServicer(reddit_pb2_grpc.RedditServiceServicer):
             subcomments=comment_subcomments_list,
         )
 
+    def comment_tree(self, request):
+        max_nodes = self.max_tree_nodes
+        if request.HasField('max_nodes'):
+            max_nodes = min(max_nodes, request.max_nodes)
+        nodes = self.controller.comment_tree_ids(
+            request.comment_id, request.max_depth, request.level_limits,
+            request.limit, max_nodes)
+        if self.raw_responses:
+            return wire.RawResponse(wire.comment_tree(
+                nodes, self.controller.comment_bytes))
+        response = reddit_pb2.ExpandCommentBranchResponse()
+        self.fill_tree(response.tree, nodes)
+        return response
+
+    def fill_tree(self, top, nodes):
+        """Add the (parent_id, comment_id, has_sub, depth) nodes to CommentTrees"""
+        trees = {None: top}
+        for parent_id, child_id, has_sub, _ in nodes:
+            tree = trees[parent_id].add(
+                comment=self.controller.comments.to_message(child_id),
+                has_subcomment=has_sub)
+            trees[child_id] = tree.replies
+
+    def StreamCommentTree(self, request, context):
+        """
+        Send the comments of ExpandCommentBranch's tree one at a time, as
+        the walk finds them. gRPC only asks for the next one once the
+        previous one was handed to the transport, so the server never
+        holds more than one message, whatever the size of the tree.
+        """
+        nodes = self.controller.comment_tree_ids(
+            request.comment_id, request.max_depth, request.level_limits,
+            request.limit,
+            request.max_nodes if request.HasField('max_nodes') else None)
+        for _, comment_id, has_sub, depth in nodes:
+            if self.raw_responses:
+                yield wire.RawResponse(wire.comment_tree_node(
+                    self.controller.comment_bytes(comment_id), has_sub, depth))
+            else:
+                yield reddit_pb2.CommentTreeNode(
+                    comment=self.controller.comments.to_message(comment_id),
+                    has_subcomment=has_sub, depth=depth)
+
+    def GetPostThread(self, request, context):
+        post_id = request.post_id
+        # the post's score is not covered by its version
+        version = self.controller.post_version(post_id)
+        post = self.controller.get_post(post_id)
+        if post is None:
+            return reddit_pb2.GetPostThreadResponse(success=False)
+        return self.cached(
+            ('GetPostThread', post_id, request.limit, request.reply_limit),
+            (version, post.score),
+            lambda: self.post_thread(post, request.limit, request.reply_limit))
+
+    def post_thread(self, post, limit, reply_limit):
+        nodes = self.controller.post_tree_ids(
+            post.post_id, 2, (limit, reply_limit))
+        if self.raw_responses:
+            return wire.RawResponse(wire.post_thread(
+                post.SerializeToString(), nodes,
+                self.controller.comment_bytes))
+        response = reddit_pb2.GetPostThreadResponse(success=True, post=post)
+        self.fill_tree(response.comments, nodes)
+        return response
+
+    def Replicate(self, request, context):
+        if not isinstance(self.replication, ReplicationLog):
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION,
+                          'this server is not a replication leader')
+        after = request.after_sequence
+        while context.is_active():
+            try:
+                records, last = self.replication.read(after, self.heartbeat)
+            except LookupError as error:
+                context.abort(grpc.StatusCode.OUT_OF_RANGE, str(error))
+            yield reddit_pb2.LogRecord(sequence=last)
+            # the records are sent as they were serialized when appended
+            for data in records:
+                yield wire.RawResponse(data)
+            after += len(records)
+
+    def GetReplicationStatus(self, request, context):
+        if self.replication is None:
+            return reddit_pb2.ReplicationStatus(
+                role=reddit_pb2.ReplicationRole.REPLICATION_ROLE_NONE)
+        return self.replication.status()
+
+    def GetServerStats(self, request, context):
+        if self.metrics is None:
+            return reddit_pb2.ServerStats()
+        return self.metrics.to_message()
+
+
+class AsyncRedditServicer(reddit_pb2_grpc.RedditServiceServicer):
+    """
+    The RedditServicer of a grpc.aio server, answering every RPC with the
+    wrapped RedditServicer on the event loop, so an RPC in flight costs
+    no thread. Calls that may block are sent to the executor instead:
+    writes when the controller waits for its write-ahead log, and with
+    offload_ranking the calls that rank comments (they hold the loop for
+    as long as the ranking takes).
+    """
+
+    def __init__(self, servicer: RedditServicer, executor=None,
+                 offload_ranking=False):
+        self.servicer = servicer
+        self.executor = executor
+        self.offload_ranking = offload_ranking
+
+    async def run(self, offload, function, *args):
+        if offload:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, function, *args)
+        return function(*args)
+
+    async def write(self, function, *args):
+        return await self.run(self.servicer.controller.log is not None,
+                              function, *args)
+
+    async def rank(self, function, *args):
+        return await self.run(self.offload_ranking, function, *args)
+
+    async def CreatePost(self, request, context):
+        return await self.write(self.servicer.CreatePost, request, context)
+
+    async def VotePost(self, request, context):
+        return await self.write(self.servicer.VotePost, request, context)
+
+    async def GetPostContent(self, request, context):
+        return self.servicer.GetPostContent(request, context)
+
+    async def CreateComment(self, request, context):
+        return await self.write(self.servicer.CreateComment, request, context)
+
+    async def VoteComment(self, request, context):
+        return await self.write(self.servicer.VoteComment, request, context)
+
+    async def BatchVote(self, request, context):
+        return await self.write(self.servicer.BatchVote, request, context)
+
+    async def StreamVotes(self, request_iterator, context):
+        response = reddit_pb2.BatchVoteResponse()
+        async for request in request_iterator:
+            response.MergeFrom(
+                await self.write(self.servicer.batch_vote, request))
+        return response
+
+    async def BatchCreateComment(self, request, context):
+        return await self.write(
+            self.servicer.BatchCreateComment, request, context)
+
+    async def StreamCreateComments(self, request_iterator, context):
+        response = reddit_pb2.BatchCreateCommentResponse()
+        async for request in request_iterator:
+            response.MergeFrom(
+                await self.write(self.servicer.batch_create_comment, request))
+        return response
+
+    async def BatchGetPosts(self, request, context):
+        return self.servicer.BatchGetPosts(request, context)
+
+    async def BatchGetComments(self, request, context):
+        return self.servicer.BatchGetComments(request, context)
+
+    async def GetMostUpvotedComments(self, request, context):
+        return await self.rank(
+            self.servicer.GetMostUpvotedComments, request, context)
+
+    async def ExpandCommentBranch(self, request, context):
+        return await self.rank(
+            self.servicer.ExpandCommentBranch, request, context)
+
+    async def GetPostThread(self, request, context):
+        return await self.rank(self.servicer.GetPostThread, request, context)
+
+    async def GetServerStats(self, request, context):
+        return self.servicer.GetServerStats(request, context)
+
+    async def StreamCommentTree(self, request, context, chunk=64):
+        # the walk is resumed chunk comments at a time
+        nodes = self.servicer.StreamCommentTree(request, context)
+        while True:
+            responses = await self.rank(
+                lambda: list(itertools.islice(nodes, chunk)))
+            for response in responses:
+                yield response
+            if len(responses) < chunk:
+                return
+
 
 class AuthInterceptor(grpc.ServerInterceptor):
 
@@ -124,20 +504,560 @@ class AuthInterceptor(grpc.ServerInterceptor):
         return continuation(handler_call_details)
 
 
-def serve(host, port):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10),
-                         interceptors=(AuthInterceptor(),))
+class AsyncAuthInterceptor(grpc.aio.ServerInterceptor):
+
+    async def intercept_service(self, continuation, handler_call_details):
+        """This is a dummy auth implementation"""
+        return await continuation(handler_call_details)
+
+
+class ConcurrencyLimit:
+    """
+    Adaptive limit on the calls a threaded server holds, queued or
+    running, shared by its LimitInterceptor and LimitedThreadPool.
+    Every call reports how long it waited from its arrival until its
+    handler ran, for a worker and its request: a wait over target_delay
+    cuts the limit by `backoff`, at most once per `interval` seconds
+    (calls queued before a cut still report long waits); a shorter one,
+    while at least half the limit is used, raises it by 1 / limit. The
+    limit so settles around the calls the server gets through within
+    target_delay.
+
+    A streaming call is released once its handler runs: it may stay open
+    for as long as its client likes, and counting it would let a few
+    streams take up the whole limit. A call is also admitted over the
+    limit while no call waits for a worker, so the limit always gets the
+    waits it needs to recover, however low it was cut.
+    """
+
+    def __init__(self, target_delay: float = 0.05, initial: int = 10,
+                 minimum: int = 1, maximum: int = 1000,
+                 backoff: float = 0.9, interval: float = 0.1):
+        self.target_delay = target_delay
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.interval = interval
+        self.limit = float(initial)
+        self.holding = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.last_cut = 0.0
+        self.lock = threading.Lock()
+        # arrival time of the call a worker thread runs, and whether it
+        # is still counted
+        self.local = threading.local()
+
+    def admit(self):
+        """Whether a new call fits in the limit, counting it if not"""
+        with self.lock:
+            if self.holding < self.limit or self.waiting == 0:
+                return True
+            self.rejected += 1
+            return False
+
+    def queued(self):
+        """Count a call handed to the pool, return the time it was"""
+        with self.lock:
+            self.holding += 1
+            self.waiting += 1
+        return time.monotonic()
+
+    def running(self, queued: float):
+        """Note that the calling worker took up the call queued then"""
+        self.local.queued = queued
+        self.local.held = True
+        with self.lock:
+            self.waiting -= 1
+
+    def release(self):
+        """Stop counting the call the calling worker runs"""
+        local = self.local
+        if getattr(local, 'held', False):
+            local.held = False
+            self.finished()
+
+    def started(self, waited: float):
+        with self.lock:
+            if waited > self.target_delay:
+                now = time.monotonic()
+                if now - self.last_cut >= self.interval:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self.last_cut = now
+            elif self.holding * 2 >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def finished(self):
+        with self.lock:
+            self.holding -= 1
+
+
+class LimitedThreadPool(futures.ThreadPoolExecutor):
+    """
+    The worker pool of a server with a ConcurrencyLimit. gRPC hands it
+    every call but the rejected ones and those run on a pool of their
+    own, cancelled calls included, so it counts the calls held, and
+    notes when they arrived for the LimitInterceptor to time their wait.
+    """
+
+    def __init__(self, limit: ConcurrencyLimit, max_workers: int):
+        super().__init__(max_workers=max_workers)
+        self.limit = limit
+
+    def submit(self, fn, /, *args, **kwargs):
+        limit = self.limit
+        queued = limit.queued()
+
+        def run():
+            limit.running(queued)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                limit.release()
+        return super().submit(run)
+
+
+class LimitInterceptor(grpc.ServerInterceptor):
+    """
+    Answers calls with RESOURCE_EXHAUSTED straight away while the server
+    holds as many calls as its ConcurrencyLimit allows, rather than
+    queueing them for a worker, and reports the wait of the calls it
+    admits. Replicate streams are always admitted: a leader runs them
+    on a pool of their own (see replication.LeaderInterceptor), and any
+    other server refuses them at once.
+    """
+
+    def __init__(self, limit: ConcurrencyLimit):
+        self.limit = limit
+        self.handlers = {}
+        self.rejecting = {}
+
+        def reject(request, context):
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                          'server overloaded, retry later')
+
+        # gRPC runs it on a thread of its own, not queued behind the workers
+        reject.experimental_thread_pool = futures.ThreadPoolExecutor(
+            max_workers=1)
+        self.reject = reject
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None or \
+                handler_call_details.method.endswith('/Replicate'):
+            return handler
+        if self.limit.admit():
+            timed = self.handlers.get(handler, None)
+            if timed is None:
+                timed = self.handlers[handler] = wrap_behavior(
+                    handler, self.timed_stream if handler.request_streaming
+                    or handler.response_streaming else self.timed)
+            return timed
+        rejecting = self.rejecting.get(handler, None)
+        if rejecting is None:
+            # as a request stream, so the answer does not wait for the
+            # request; a unary request is a stream of one on the wire
+            rejecting = self.rejecting[handler] = (
+                grpc.stream_stream_rpc_method_handler
+                if handler.response_streaming else
+                grpc.stream_unary_rpc_method_handler)(
+                    self.reject, handler.request_deserializer,
+                    handler.response_serializer)
+        return rejecting
+
+    def timed(self, behavior):
+        limit = self.limit
+
+        def call(request, context):
+            limit.started(time.monotonic() - limit.local.queued)
+            return behavior(request, context)
+        return call
+
+    def timed_stream(self, behavior):
+        limit = self.limit
+
+        def call(request, context):
+            limit.started(time.monotonic() - limit.local.queued)
+            limit.release()
+            return behavior(request, context)
+        return call
+
+
+def grpc_options(keepalive_time=None, keepalive_timeout=None,
+                 min_client_ping_interval=None, max_connection_age=None,
+                 max_receive_message_length=None,
+                 max_send_message_length=None):
+    """
+    gRPC channel arguments of a server, times in seconds and lengths in
+    bytes; None keeps gRPC's default.
+    """
+    options = []
+    for name, value, scale in (
+            ('grpc.keepalive_time_ms', keepalive_time, 1000),
+            ('grpc.keepalive_timeout_ms', keepalive_timeout, 1000),
+            ('grpc.http2.min_ping_interval_without_data_ms',
+             min_client_ping_interval, 1000),
+            ('grpc.max_connection_age_ms', max_connection_age, 1000),
+            ('grpc.max_receive_message_length',
+             max_receive_message_length, 1),
+            ('grpc.max_send_message_length', max_send_message_length, 1)):
+        if value is not None:
+            options.append((name, int(value * scale)))
+    return options
+
+
+def config_args(path):
+    """
+    Command line arguments of a JSON config file of option values, e.g.
+    {"max-workers": 32, "replicate": true}. A true flag is given, a false
+    or null one left out.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    args = []
+    for name, value in config.items():
+        option = '--' + name.replace('_', '-')
+        if value is True:
+            args.append(option)
+        elif value is not False and value is not None:
+            args += [option, str(value)]
+    return args
+
+
+def load_controller(snapshot_path=None, dataset_path=None,
+                    **controller_kwargs):
+    """
+    Return a controller loaded from the snapshot if one is given and
+    exists, otherwise from the dataset if one is given, otherwise empty;
+    the log position it reflects; and whether it is empty.
+    """
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        reddit_controller, sequence = snapshot.load(
+            snapshot_path, **controller_kwargs)
+        return reddit_controller, sequence, False
+    reddit_controller = controller.RedditNativeController(**controller_kwargs)
+    if dataset_path is not None:
+        dataset.load(reddit_controller, dataset.read_records(dataset_path))
+        return reddit_controller, 0, False
+    return reddit_controller, 0, True
+
+
+def open_controller(wal_path=None, wal_durability='batch', wal_interval=0.01,
+                    snapshot_path=None, dataset_path=None,
+                    replication_buffer=0, sample=True, **controller_kwargs):
+    """
+    Build the controller. It starts from the snapshot if one is given and
+    exists, otherwise from the bulk loaded dataset if one is given; then
+    the write-ahead log (if any) is replayed on top of it. init() only
+    runs (and is logged) when none of them held any data, and `sample`.
+    With replication_buffer > 0 the controller is a replication leader:
+    its log is a ReplicationLog (over the write-ahead log, if any)
+    keeping that many records, replayed ones included, for followers.
+    controller_kwargs go to RedditNativeController.
+    """
+    reddit_controller, sequence, empty = load_controller(
+        snapshot_path, dataset_path, **controller_kwargs)
+    replayed = collections.deque(maxlen=replication_buffer)
+    if wal_path is not None:
+        log = wal.WriteAheadLog(wal_path, wal_durability, wal_interval)
+
+        def apply(record):
+            reddit_controller.apply_record(record)
+            replayed.append(record)
+
+        if log.replay(apply, after=sequence):
+            empty = False
+        reddit_controller.log = log
+    if replication_buffer > 0:
+        reddit_controller.log = ReplicationLog(
+            reddit_controller.log, replication_buffer, sequence, replayed)
+    if empty and sample:
+        reddit_controller.init()
+    return reddit_controller
+
+
+def open_follower(leader, snapshot_path=None, dataset_path=None,
+                  retry_interval=1.0, **controller_kwargs):
+    """
+    Build a read-only follower of the leader server at address `leader`.
+    It must start from the snapshot or dataset the leader started from,
+    if any (a snapshot of the leader taken later works too, as it records
+    its log position). Returns the controller and its started Follower.
+    """
+    reddit_controller, sequence, _ = load_controller(
+        snapshot_path, dataset_path, **controller_kwargs)
+    return reddit_controller, Follower(
+        reddit_controller, leader, sequence, retry_interval).start()
+
+
+def make_server(host, port, reddit_controller=None, max_replica_wait=1.0,
+                max_followers=16, max_workers=10, limit=None, options=(),
+                maximum_concurrent_rpcs=None, compression=None,
+                **servicer_kwargs):
+    """
+    Return the started server and the port it listens on,
+    servicer_kwargs go to RedditServicer. With a replication ReplicationLog
+    or Follower, unary answers carry the log position they reflect; a
+    follower's server is read-only and waits up to max_replica_wait
+    seconds for the min-log-position of a call; a leader streams to at
+    most max_followers followers, each on a thread of its own besides
+    the max_workers answering calls. With a ConcurrencyLimit,
+    calls beyond it are rejected at once. With servicer_kwargs['metrics']
+    (a metrics.Metrics), every call is counted and timed in it. options
+    (see grpc_options), maximum_concurrent_rpcs and compression go to
+    grpc.server.
+    """
+    interceptors = [AuthInterceptor(), wire.RawResponseInterceptor()]
+    replication = servicer_kwargs.get('replication', None)
+    if isinstance(replication, Follower):
+        interceptors.append(FollowerInterceptor(replication, max_replica_wait))
+    if replication is not None:
+        interceptors.append(PositionInterceptor(replication.position))
+    if isinstance(replication, ReplicationLog):
+        interceptors.append(LeaderInterceptor(max_followers))
+    if limit is not None:
+        interceptors.insert(0, LimitInterceptor(limit))
+        pool = LimitedThreadPool(limit, max_workers)
+    else:
+        pool = futures.ThreadPoolExecutor(max_workers=max_workers)
+    if servicer_kwargs.get('metrics', None) is not None:
+        # outermost, so rejected calls are counted too
+        interceptors.insert(0, MetricsInterceptor(servicer_kwargs['metrics']))
+    server = grpc.server(pool, interceptors=interceptors, options=options,
+                         maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+                         compression=compression)
     reddit_pb2_grpc.add_RedditServiceServicer_to_server(
-        RedditServicer(), server)
-    server.add_insecure_port(f"{host}:{port}")
+        RedditServicer(reddit_controller, **servicer_kwargs), server)
+    port = server.add_insecure_port(f"{host}:{port}")
     server.start()
+    return server, port
+
+
+def serve(host, port, reddit_controller=None, **server_kwargs):
+    server, _ = make_server(host, port, reddit_controller, **server_kwargs)
     server.wait_for_termination()
 
 
+async def make_async_server(host, port, reddit_controller=None,
+                            executor_workers=10, offload_ranking=False,
+                            options=(), maximum_concurrent_rpcs=None,
+                            compression=None, **servicer_kwargs):
+    """
+    make_server for a grpc.aio server answering with AsyncRedditServicer,
+    whose blocking calls go to a pool of executor_workers threads.
+    """
+    interceptors = [AsyncAuthInterceptor(),
+                    wire.AsyncRawResponseInterceptor()]
+    if servicer_kwargs.get('metrics', None) is not None:
+        interceptors.insert(
+            0, AsyncMetricsInterceptor(servicer_kwargs['metrics']))
+    server = grpc.aio.server(
+        interceptors=interceptors,
+        options=options, maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+        compression=compression)
+    reddit_pb2_grpc.add_RedditServiceServicer_to_server(AsyncRedditServicer(
+        RedditServicer(reddit_controller, **servicer_kwargs),
+        futures.ThreadPoolExecutor(max_workers=executor_workers),
+        offload_ranking), server)
+    port = server.add_insecure_port(f"{host}:{port}")
+    await server.start()
+    return server, port
+
+
+async def serve_async(host, port, reddit_controller=None, **server_kwargs):
+    server, _ = await make_async_server(
+        host, port, reddit_controller, **server_kwargs)
+    await server.wait_for_termination()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default=None,
+                        help='JSON file of option values, e.g. '
+                        '{"max-workers": 32}; options given on the command '
+                        'line take precedence')
     parser.add_argument('--port', type=int, default=50051)
     parser.add_argument('--host', type=str, default='localhost')
+    parser.add_argument('--wal', type=str, default=None,
+                        help='write-ahead log file, replayed on startup')
+    parser.add_argument('--wal-durability', type=str, default='batch',
+                        choices=wal.WriteAheadLog.DURABILITY,
+                        help='batch: fsync before replying, shared by '
+                        'concurrent writers; interval: fsync every '
+                        '--wal-interval seconds; none: never fsync')
+    parser.add_argument('--wal-interval', type=float, default=0.01)
+    parser.add_argument('--snapshot', type=str, default=None,
+                        help='snapshot file (see snapshot.py) to start '
+                        'from, the write-ahead log is replayed on top')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='dataset file (see dataset.py) to bulk load '
+                        'instead of the sample data, unless --snapshot '
+                        'exists')
+    parser.add_argument('--empty', action='store_true',
+                        help='start without the sample data when there is '
+                        'no --snapshot, --dataset or --wal to load')
+    parser.add_argument('--cache-size', type=int, default=10_000,
+                        help='responses of GetMostUpvotedComments and '
+                        'ExpandCommentBranch to cache, 0 disables the cache')
+    parser.add_argument('--cache-max-staleness', type=float, default=0.0,
+                        help='seconds a cached response may be served after '
+                        'the thread changed, 0 always serves fresh answers')
+    parser.add_argument('--raw-responses', action='store_true',
+                        help='keep every returned comment serialized and '
+                        'assemble comment responses from those bytes')
+    parser.add_argument('--coalesce-votes', type=float, default=0.0,
+                        metavar='SECONDS',
+                        help='apply the score changes of votes in batches, '
+                        'at least every SECONDS; 0 applies every vote alone')
+    parser.add_argument('--ranking', type=str, default='sorted',
+                        choices=ranking.ChildIndexFactory.RANKINGS,
+                        help='child index of each parent: sorted lists, or '
+                        'numpy arrays past --numpy-threshold children')
+    parser.add_argument('--numpy-threshold', type=int, default=100_000,
+                        help='with --ranking numpy, children a parent needs '
+                        'before it switches to arrays')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='serve with grpc.aio on one event loop instead '
+                        'of a pool of --max-workers threads')
+    parser.add_argument('--offload-ranking', action='store_true',
+                        help='with --async, rank comments on a thread pool '
+                        'instead of the event loop')
+    parser.add_argument('--replicate', action='store_true',
+                        help='be a replication leader: stream every change '
+                        'to followers started with --follow')
+    parser.add_argument('--replication-buffer', type=int, default=1_000_000,
+                        help='changes a leader keeps for followers, one '
+                        'further behind has to restart from a snapshot')
+    parser.add_argument('--max-followers', type=int, default=16,
+                        help='followers a leader streams to at once, each '
+                        'on a thread of its own; more are refused and retry')
+    parser.add_argument('--follow', type=str, default=None,
+                        metavar='HOST:PORT',
+                        help='be a read-only follower of this leader, '
+                        'started from the same --snapshot or --dataset')
+    parser.add_argument('--max-replica-wait', type=float, default=1.0,
+                        help='seconds a follower holds a read until it '
+                        'applied the min-log-position of the call')
+    parser.add_argument('--ids', type=str, default='rows', choices=ids.KINDS,
+                        help='rows: ids are row numbers; blocks: each thread '
+                        'takes blocks of --id-block-size ids; snowflake: '
+                        'time ordered 63-bit ids')
+    parser.add_argument('--id-shard', type=int, default=0,
+                        help='number of this server among the shards, '
+                        'encoded in blocks and snowflake ids')
+    parser.add_argument('--id-shards', type=int, default=1,
+                        help='number of shards sharing the blocks id space')
+    parser.add_argument('--id-block-size', type=int, default=1024)
+    parser.add_argument('--max-workers', type=int, default=10,
+                        help='threads answering calls (with --async: '
+                        'running blocking calls)')
+    parser.add_argument('--max-concurrent-rpcs', type=int, default=None,
+                        help='calls beyond this many at once are rejected '
+                        'with RESOURCE_EXHAUSTED by gRPC')
+    parser.add_argument('--target-queue-delay', type=float, default=0.0,
+                        metavar='SECONDS',
+                        help='adapt a limit on the calls queued or running '
+                        'so they wait about SECONDS for a worker, and '
+                        'reject calls beyond it with RESOURCE_EXHAUSTED; '
+                        '0 queues every call')
+    parser.add_argument('--min-concurrency', type=int, default=1,
+                        help='lowest limit of --target-queue-delay')
+    parser.add_argument('--max-concurrency', type=int, default=1000,
+                        help='highest limit of --target-queue-delay')
+    parser.add_argument('--keepalive-time', type=float, default=None,
+                        metavar='SECONDS',
+                        help='ping idle client connections this often')
+    parser.add_argument('--keepalive-timeout', type=float, default=None,
+                        metavar='SECONDS',
+                        help='close a connection whose ping is not '
+                        'answered within SECONDS')
+    parser.add_argument('--min-client-ping-interval', type=float,
+                        default=None, metavar='SECONDS',
+                        help='shortest interval between client pings '
+                        'without calls the server accepts')
+    parser.add_argument('--max-connection-age', type=float, default=None,
+                        metavar='SECONDS',
+                        help='close connections after SECONDS, so clients '
+                        'reconnect and spread over the servers')
+    parser.add_argument('--max-receive-message-length', type=int,
+                        default=None, metavar='BYTES')
+    parser.add_argument('--max-send-message-length', type=int, default=None,
+                        metavar='BYTES')
+    parser.add_argument('--compression', type=str, default='none',
+                        choices=COMPRESSION,
+                        help='compression of the responses')
+    parser.add_argument('--metrics', action='store_true',
+                        help='count and time every call, and the lookup, '
+                        'ranking, message and serialize stages, for '
+                        'GetServerStats')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve the metrics in the Prometheus text '
+                        'format at http://HOST:PORT/metrics (implies '
+                        '--metrics)')
     args = parser.parse_args()
+    if args.config is not None:
+        args = parser.parse_args(config_args(args.config) + sys.argv[1:])
+    if args.use_async and (args.replicate or args.follow is not None):
+        parser.error('replication is not supported with --async')
+    if args.use_async and args.target_queue_delay > 0:
+        parser.error('--target-queue-delay is not supported with --async')
+    if args.follow is not None and (args.replicate or args.wal is not None):
+        parser.error('a follower has no --wal and cannot --replicate')
+    try:
+        ids.check(args.ids, shards=args.id_shards)
+    except ValueError as e:
+        parser.error(f'{e}, pass a smaller --id-shards')
+    try:
+        # the workers, and the main thread loading the data, allocate ids
+        ids.check(args.ids, threads=args.max_workers + 1)
+    except ValueError as e:
+        parser.error(f'{e} (--max-workers and the main thread), pass a '
+                     'smaller --max-workers')
 
-    serve(args.host, args.port)
+    controller_kwargs = dict(
+        wire_cache=args.raw_responses, vote_flush_interval=args.coalesce_votes,
+        ranking=args.ranking, numpy_threshold=args.numpy_threshold,
+        ids=ids.allocator(args.ids, args.id_shard, args.id_shards,
+                          args.id_block_size))
+    replication = None
+    if args.follow is not None:
+        reddit_controller, replication = open_follower(
+            args.follow, args.snapshot, args.dataset, **controller_kwargs)
+    else:
+        reddit_controller = open_controller(
+            args.wal, args.wal_durability, args.wal_interval, args.snapshot,
+            args.dataset,
+            args.replication_buffer if args.replicate else 0,
+            not args.empty, **controller_kwargs)
+        if args.replicate:
+            replication = reddit_controller.log
+    metrics = None
+    if args.metrics or args.metrics_port is not None:
+        metrics = Metrics()
+        reddit_controller.instrument(metrics)
+        if args.metrics_port is not None:
+            serve_http(metrics, args.host, args.metrics_port)
+    server_kwargs = dict(
+        cache_size=args.cache_size, max_staleness=args.cache_max_staleness,
+        raw_responses=args.raw_responses, metrics=metrics,
+        options=grpc_options(
+            args.keepalive_time, args.keepalive_timeout,
+            args.min_client_ping_interval, args.max_connection_age,
+            args.max_receive_message_length, args.max_send_message_length),
+        maximum_concurrent_rpcs=args.max_concurrent_rpcs,
+        compression=COMPRESSION[args.compression])
+    if args.use_async:
+        asyncio.run(serve_async(
+            args.host, args.port, reddit_controller,
+            executor_workers=args.max_workers,
+            offload_ranking=args.offload_ranking, **server_kwargs))
+    else:
+        limit = None
+        if args.target_queue_delay > 0:
+            limit = ConcurrencyLimit(
+                args.target_queue_delay, args.max_workers,
+                args.min_concurrency, args.max_concurrency)
+        serve(args.host, args.port, reddit_controller,
+              max_replica_wait=args.max_replica_wait,
+              max_followers=args.max_followers, replication=replication,
+              max_workers=args.max_workers, limit=limit, **server_kwargs)
@@ -0,0 +1,197 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import controller
+import dataset
+import ids
+import wal
+from storage import TextPool
+from votes import UserInterner
+
+# file layout: MAGIC, sections aligned to 8 bytes, a JSON directory,
+# then TRAILER (directory offset, directory length, MAGIC)
+MAGIC = b'RDTSNAP1'
+TRAILER = struct.Struct('<QQ8s')
+ALIGN = 8
+
+
+def text_sections(name: str, pool):
+    blob, offsets = pool.buffers()
+    return [(f'{name}.blob', 'B', blob), (f'{name}.offsets', 'Q', offsets)]
+
+
+def vote_sections(name: str, votes):
+    """Votes as sorted item ids, offsets and (handle << 1 | is_upvote)"""
+    item_ids = array('q')
+    offsets = array('Q', [0])
+    entries = array('I')
+    for item_id in votes.item_ids():
+        before = len(entries)
+        entries.extend(handle << 1 | (vote > 0)
+                       for handle, vote in votes.voters(item_id))
+        if len(entries) > before:
+            item_ids.append(item_id)
+            offsets.append(len(entries))
+    return [(f'{name}.items', 'q', item_ids),
+            (f'{name}.offsets', 'Q', offsets),
+            (f'{name}.entries', 'I', entries)]
+
+
+def children_sections(name: str, children_map):
+    """Child ids of every parent in rank order"""
+    parents = array('q')
+    offsets = array('Q', [0])
+    children = array('q')
+    for parent_id in children_map.parent_ids():
+        children.extend(children_map.ranked_ids(parent_id))
+        parents.append(parent_id)
+        offsets.append(len(children))
+    return [(f'{name}.parents', 'q', parents),
+            (f'{name}.offsets', 'Q', offsets),
+            (f'{name}.children', 'q', children)]
+
+
+def store_sections(name: str, store):
+    # ids is empty when ids are rows
+    sections = [(f'{name}.{column}', typecode, getattr(store, column))
+                for column, typecode in store.COLUMNS + (('ids', 'q'),)]
+    for text in store.TEXTS:
+        sections += text_sections(f'{name}.{text}', getattr(store, text))
+    return sections
+
+
+def save(reddit_controller, path: str, log_sequence: int = 0):
+    """
+    Write a snapshot of the controller. Nothing may change the controller
+    while it is saved. log_sequence is the sequence of the last log record
+    the snapshot includes, records up to it are skipped when the log is
+    replayed on top of the snapshot.
+    """
+    reddit_controller.flush_votes()
+    sections = text_sections('users', reddit_controller.users.names)
+    sections += store_sections('posts', reddit_controller.posts)
+    sections += store_sections('comments', reddit_controller.comments)
+    sections += vote_sections('posts_votes', reddit_controller.posts_votes)
+    sections += vote_sections('comments_votes',
+                              reddit_controller.comments_votes)
+    sections += children_sections('post_children',
+                                  reddit_controller.post_children)
+    sections += children_sections('comment_children',
+                                  reddit_controller.comment_children)
+    directory = {
+        'meta': {'log_sequence': log_sequence, 'byteorder': sys.byteorder},
+        'sections': {},
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for name, typecode, data in sections:
+            f.write(bytes(-f.tell() % ALIGN))
+            directory['sections'][name] = [f.tell(), len(data) *
+                                           array(typecode).itemsize, typecode]
+            f.write(data)
+        directory_bytes = json.dumps(directory).encode()
+        directory_offset = f.tell()
+        f.write(directory_bytes)
+        f.write(TRAILER.pack(directory_offset, len(directory_bytes), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """A snapshot file mapped into memory, sections are read-only views"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if len(self.map) < len(MAGIC) + TRAILER.size or \
+                self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot")
+        offset, length, magic = TRAILER.unpack_from(
+            self.map, len(self.map) - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is truncated")
+        directory = json.loads(bytes(self.view[offset:offset + length]))
+        self.meta = directory['meta']
+        self.sections = directory['sections']
+        if self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written on a "
+                             f"{self.meta['byteorder']} endian machine")
+
+    def raw(self, name: str):
+        offset, nbytes, _ = self.sections[name]
+        return self.view[offset:offset + nbytes]
+
+    def __getitem__(self, name: str):
+        return self.raw(name).cast(self.sections[name][2])
+
+    def fill(self, column: array, name: str):
+        """Append a section to an array, one copy of the whole section"""
+        column.frombytes(self.raw(name))
+
+    def text_pool(self, name: str):
+        return TextPool(self[f'{name}.blob'], self[f'{name}.offsets'])
+
+
+def load(path: str, **controller_kwargs):
+    """
+    Build a controller from a snapshot. Columns are copied out of the
+    mapped file, as they change; strings, votes and child lists stay in
+    the mapping and are only copied (or indexed) when first touched.
+    A snapshot with allocated ids needs a controller_kwargs id allocator.
+    """
+    snap = Snapshot(path)
+    reddit_controller = controller.RedditNativeController(**controller_kwargs)
+    reddit_controller.users = UserInterner(snap.text_pool('users'))
+    for name in ('posts', 'comments'):
+        store = getattr(reddit_controller, name)
+        store.users = reddit_controller.users
+        for column, _ in store.COLUMNS:
+            snap.fill(getattr(store, column), f'{name}.{column}')
+        for text in store.TEXTS:
+            setattr(store, text, snap.text_pool(f'{name}.{text}'))
+        if f'{name}.ids' in snap.sections:
+            snap.fill(store.ids, f'{name}.ids')
+        store.index_ids()
+    for name in ('posts_votes', 'comments_votes'):
+        getattr(reddit_controller, name).load_base(
+            snap[f'{name}.items'], snap[f'{name}.offsets'],
+            snap[f'{name}.entries'])
+    for name in ('post_children', 'comment_children'):
+        getattr(reddit_controller, name).load_base(
+            snap[f'{name}.parents'], snap[f'{name}.offsets'],
+            snap[f'{name}.children'])
+    reddit_controller.reserve_ids()
+    return reddit_controller, snap.meta['log_sequence']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='write a snapshot of a dataset and/or the data in a '
+        'write-ahead log, or of the sample data if neither is given')
+    parser.add_argument('output', type=str)
+    parser.add_argument('--dataset', type=str, default=None)
+    parser.add_argument('--wal', type=str, default=None)
+    parser.add_argument('--ids', type=str, default='rows', choices=ids.KINDS,
+                        help='id allocator the log was written with')
+    args = parser.parse_args()
+
+    reddit_controller = controller.RedditNativeController(
+        ids=ids.allocator(args.ids))
+    sequence = 0
+    if args.dataset is not None:
+        dataset.load(reddit_controller, dataset.read_records(args.dataset))
+    elif args.wal is None:
+        reddit_controller.init()
+    if args.wal is not None:
+        for _, record in wal.read_records(args.wal):
+            reddit_controller.apply_record(record)
+            sequence = record.sequence
+    save(reddit_controller, args.output, sequence)
@@ -0,0 +1,335 @@
+import sys
+import threading
+from array import array
+from datetime import datetime
+
+import reddit_pb2
+
+NO_ID = -1
+
+
+def format_date(timestamp: float):
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+def parse_date(date: str):
+    return datetime.fromisoformat(date).timestamp()
+
+
+class TextPool:
+    """
+    Append-only pool of strings addressed by index. The strings are kept
+    utf-8 encoded back to back in one buffer, so a string costs its bytes
+    plus an 8-byte offset instead of a Python str object.
+
+    A pool loaded from a snapshot keeps the loaded strings in read-only
+    base buffers (e.g. slices of a memory map) and appends after them.
+    """
+
+    def __init__(self, base_blob=b'', base_offsets=(0,)):
+        self.base_blob = base_blob
+        self.base_offsets = base_offsets
+        self.base_count = len(base_offsets) - 1
+        self.blob = bytearray()
+        self.offsets = array('Q', [0])
+
+    def __len__(self):
+        return self.base_count + len(self.offsets) - 1
+
+    def __getitem__(self, index: int):
+        if index < self.base_count:
+            blob, offsets = self.base_blob, self.base_offsets
+        else:
+            blob, offsets = self.blob, self.offsets
+            index -= self.base_count
+        return str(blob[offsets[index]:offsets[index + 1]], 'utf-8')
+
+    def append(self, text: str):
+        self.blob += text.encode()
+        self.offsets.append(len(self.blob))
+        return len(self) - 1
+
+    def buffers(self):
+        """Return (blob, offsets) of every string, base ones included"""
+        if self.base_count == 0:
+            return self.blob, self.offsets
+        base_size = self.base_offsets[-1]
+        offsets = array('Q', self.base_offsets)
+        offsets.extend(base_size + offset for offset in self.offsets[1:])
+        return bytes(self.base_blob) + self.blob, offsets
+
+    def memory_usage(self):
+        return sys.getsizeof(self.blob) + sys.getsizeof(self.offsets)
+
+
+class ColumnStore:
+    """
+    Rows of a table kept column by column in typed arrays. Subclasses
+    list their columns in COLUMNS as (name, typecode) and their string
+    columns in TEXTS.
+
+    With row_ids the id of a row is its index. Otherwise ids are given
+    by an allocator (ids.py): self.ids holds the id of every row and
+    self.rows maps ids back to rows. Either way columns are indexed by
+    row, and row() and id_of() translate.
+
+    Appending a row touches every column, so appends are serialized by
+    self.lock; reading or updating a single cell needs no lock beyond
+    the caller's own striping.
+    """
+
+    COLUMNS = ()
+    TEXTS = ()
+
+    def __init__(self, users, row_ids: bool = True):
+        self.users = users
+        self.lock = threading.Lock()
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+        for name in self.TEXTS:
+            setattr(self, name, TextPool())
+        self.ids = array('q')
+        self.rows = None if row_ids else {}
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __contains__(self, item_id: int):
+        return self.row(item_id) != NO_ID
+
+    def row(self, item_id: int):
+        """Row of an id, NO_ID if there is none"""
+        if self.rows is None:
+            return item_id if 0 <= item_id < len(self.flags) else NO_ID
+        return self.rows.get(item_id, NO_ID)
+
+    def id_of(self, row: int):
+        return row if self.rows is None else self.ids[row]
+
+    def new_id(self, item_id: int = None):
+        """
+        Return the id of the next row: item_id, or the row's index if it
+        is None. Raises ValueError if the id cannot be used.
+        The caller holds self.lock.
+        """
+        row = len(self.flags)
+        if item_id is None:
+            return row
+        if self.rows is None and item_id != row:
+            raise ValueError(f"id {item_id} is not the next row {row}")
+        if self.rows is not None and item_id in self.rows:
+            raise ValueError(f"id {item_id} already exists")
+        return item_id
+
+    def add_id(self, item_id: int):
+        """
+        Register the id of the row just appended, so row() finds it.
+        The caller holds self.lock.
+        """
+        if self.rows is not None:
+            self.ids.append(item_id)
+            self.rows[item_id] = len(self.flags) - 1
+
+    def index_ids(self):
+        """
+        Rebuild self.rows after self.ids was loaded. Rows loaded without
+        ids (saved by a store with row_ids) keep their index as id.
+        """
+        if self.rows is None:
+            if len(self.ids):
+                raise ValueError("the rows have allocated ids, the store "
+                                 "needs an id allocator")
+            return
+        if len(self.ids) < len(self.flags):
+            self.ids = array('q', range(len(self.flags)))
+        self.rows = {item_id: row for row, item_id in enumerate(self.ids)}
+
+    def max_id(self):
+        """The largest id, -1 if there is none"""
+        if self.rows is None:
+            return len(self.flags) - 1
+        return max(self.ids, default=-1)
+
+    def author_handle(self, message):
+        if message.HasField('author') and message.author.HasField('user_id'):
+            return self.users.intern(message.author.user_id)
+        return NO_ID
+
+    def author_id(self, row: int):
+        handle = self.author[row]
+        if handle == NO_ID:
+            return None
+        return self.users.user_id(handle)
+
+    def publication_date(self, row: int):
+        return format_date(self.publication_time[row])
+
+    def memory_usage(self):
+        """Approximate number of bytes used by the columns"""
+        total = sum(sys.getsizeof(getattr(self, name))
+                    for name, _ in self.COLUMNS)
+        return total + sum(getattr(self, name).memory_usage()
+                           for name in self.TEXTS)
+
+
+class PostStore(ColumnStore):
+
+    COLUMNS = (
+        ('author', 'q'),
+        ('score', 'q'),
+        ('post_state', 'b'),
+        ('publication_time', 'd'),
+        ('comment_count', 'q'),
+        ('flags', 'B'),
+    )
+    TEXTS = ('title', 'text', 'url')
+
+    # flags: which optional fields are set
+    HAS_TITLE = 1
+    HAS_TEXT = 2
+    VIDEO_URL = 4
+    IMAGE_URL = 8
+
+    def append(self, post: reddit_pb2.Post, publication_time: float,
+               post_id: int = None):
+        """
+        Add a row for post and return its post_id (see new_id).
+        The caller holds self.lock.
+        """
+        post_id = self.new_id(post_id)
+        flags = 0
+        if post.HasField('title'):
+            flags |= self.HAS_TITLE
+        if post.HasField('text'):
+            flags |= self.HAS_TEXT
+        url = post.WhichOneof('content_url')
+        if url == 'video_url':
+            flags |= self.VIDEO_URL
+        elif url == 'image_url':
+            flags |= self.IMAGE_URL
+        self.title.append(post.title)
+        self.text.append(post.text)
+        self.url.append(getattr(post, url) if url else '')
+        self.author.append(self.author_handle(post))
+        self.score.append(post.score)
+        self.post_state.append(post.post_state)
+        self.publication_time.append(publication_time)
+        self.comment_count.append(0)
+        self.flags.append(flags)
+        self.add_id(post_id)
+        return post_id
+
+    def to_message(self, row: int):
+        """Build the Post message of a row"""
+        flags = self.flags[row]
+        post = reddit_pb2.Post(
+            post_id=self.id_of(row),
+            score=self.score[row],
+            post_state=self.post_state[row],
+            publication_date=self.publication_date(row),
+            comment_count=self.comment_count[row],
+        )
+        if flags & self.HAS_TITLE:
+            post.title = self.title[row]
+        if flags & self.HAS_TEXT:
+            post.text = self.text[row]
+        if flags & self.VIDEO_URL:
+            post.video_url = self.url[row]
+        elif flags & self.IMAGE_URL:
+            post.image_url = self.url[row]
+        author = self.author_id(row)
+        if author is not None:
+            post.author.user_id = author
+        return post
+
+
+class CommentStore(ColumnStore):
+    """
+    The parent_* columns hold the rows of the parents, NO_ID for none.
+    """
+
+    COLUMNS = (
+        ('parent_post_id', 'q'),
+        ('parent_comment_id', 'q'),
+        ('author', 'q'),
+        ('score', 'q'),
+        ('comment_state', 'b'),
+        ('publication_time', 'd'),
+        ('comment_count', 'q'),
+        ('flags', 'B'),
+    )
+    TEXTS = ('text',)
+
+    HAS_TEXT = 1
+
+    def __init__(self, users, posts: PostStore, row_ids: bool = True):
+        super().__init__(users, row_ids)
+        self.posts = posts
+        # a votes.VoteBuffer whose pending score changes messages show
+        self.pending_votes = None
+
+    def parent_rows(self, comment: reddit_pb2.Comment):
+        """
+        Return the rows of the parent post and comment of a new comment,
+        NO_ID for none. Raises ValueError if a parent it names does not
+        exist.
+        """
+        post_row = comment_row = NO_ID
+        if comment.HasField('parent_post_id'):
+            post_row = self.posts.row(comment.parent_post_id)
+            if post_row == NO_ID:
+                raise ValueError(
+                    f"parent post {comment.parent_post_id} does not exist")
+        if comment.HasField('parent_comment_id'):
+            comment_row = self.row(comment.parent_comment_id)
+            if comment_row == NO_ID:
+                raise ValueError(f"parent comment "
+                                 f"{comment.parent_comment_id} does not exist")
+        return post_row, comment_row
+
+    def append(self, comment: reddit_pb2.Comment, publication_time: float,
+               comment_id: int = None):
+        """
+        Add a row for comment and return its comment_id (see new_id).
+        Raises ValueError, adding nothing, if a parent does not exist
+        (see parent_rows) or the id cannot be used.
+        The caller holds self.lock.
+        """
+        post_row, comment_row = self.parent_rows(comment)
+        comment_id = self.new_id(comment_id)
+        self.text.append(comment.text)
+        self.parent_post_id.append(post_row)
+        self.parent_comment_id.append(comment_row)
+        self.author.append(self.author_handle(comment))
+        self.score.append(comment.score)
+        self.comment_state.append(comment.comment_state)
+        self.publication_time.append(publication_time)
+        self.comment_count.append(0)
+        self.flags.append(self.HAS_TEXT if comment.HasField('text') else 0)
+        self.add_id(comment_id)
+        return comment_id
+
+    def to_message(self, row: int):
+        """Build the Comment message of a row"""
+        score = self.score[row]
+        if self.pending_votes is not None:
+            score += self.pending_votes.delta(row)
+        comment = reddit_pb2.Comment(
+            comment_id=self.id_of(row),
+            score=score,
+            comment_state=self.comment_state[row],
+            publication_date=self.publication_date(row),
+            comment_count=self.comment_count[row],
+        )
+        if self.parent_post_id[row] != NO_ID:
+            comment.parent_post_id = self.posts.id_of(
+                self.parent_post_id[row])
+        if self.parent_comment_id[row] != NO_ID:
+            comment.parent_comment_id = self.id_of(
+                self.parent_comment_id[row])
+        if self.flags[row] & self.HAS_TEXT:
+            comment.text = self.text[row]
+        author = self.author_id(row)
+        if author is not None:
+            comment.author.user_id = author
+        return comment
@@ -1,10 +1,35 @@
+import asyncio
+import collections
+import functools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import urllib.request
 from unittest.mock import patch, MagicMock
 import grpc
+import grpc.aio
 
 from reddit_pb2_grpc import RedditServiceStub
 import reddit_pb2
-from client import RedditClient
+from client import RedditClient, AsyncRedditClient
+from controller import RedditNativeController
+from votes import VoteStore, UPVOTE, DOWNVOTE, NO_VOTE
+import dataset
+import ranking
+import snapshot
+import wal
+from cache import ResponseCache
+from server import RedditServicer, make_server, make_async_server, \
+    ConcurrencyLimit, config_args, grpc_options
+from router import make_router
+from replication import Follower, ReplicationLog, ReadYourWritesStub, \
+    FollowerInterceptor, LeaderInterceptor
+from ids import BlockIds, SnowflakeIds, allocator, check as check_ids
+from metrics import BUCKETS, Histogram, Metrics, serve_http
 
 
 # high level fuctions:
@@ -375,5 +400,1771 @@ class TestClient(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestController(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = RedditNativeController()
+        self.controller.init()
+
+    def test_most_upvoted_comments(self):
+        result = self.controller.retrieve_n_most_upvoted_comment(0, 2)
+        self.assertEqual(
+            [(comment.comment_id, has_sub) for comment, has_sub in result],
+            [(0, True), (4, False)],
+        )
+
+    def test_vote_reorders_comments(self):
+        self.controller.vote_comment(4, 'user3', True)
+        self.controller.vote_comment(0, 'user1', False)
+        result = self.controller.retrieve_n_most_upvoted_comment(0, 3)
+        self.assertEqual(
+            [(comment.comment_id, comment.score) for comment, _ in result],
+            [(4, 3), (0, 1), (3, 0)],
+        )
+
+    def test_post_round_trip(self):
+        post = self.controller.create_post(reddit_pb2.Post(
+            title='title', image_url='url',
+            author=reddit_pb2.User(user_id='author')))
+        stored = self.controller.get_post(post.post_id)
+        self.assertEqual(stored, post)
+        self.assertEqual(stored.WhichOneof('content_url'), 'image_url')
+        self.assertFalse(stored.HasField('text'))
+        self.assertIsNone(self.controller.get_post(5))
+        self.assertIsNone(self.controller.get_post(100))
+
+    def test_comment_count(self):
+        self.assertEqual(self.controller.get_post(0).comment_count, 3)
+        self.assertEqual(self.controller.get_comment(0).comment_count, 4)
+        self.controller.set_comment_state(
+            9, reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
+        self.controller.set_comment_state(
+            10, reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
+        self.controller.set_comment_state(
+            11, reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
+        self.assertEqual(self.controller.get_comment(5).comment_count, 0)
+        result = self.controller.retrieve_comment_branch(0, 1)
+        self.assertEqual(result[0]['sub_sub_comments'], [])
+        self.controller.set_comment_state(
+            12, reddit_pb2.CommentState.COMMENT_STATE_NORMAL)
+        self.assertEqual(self.controller.get_post(0).comment_count, 4)
+
+    def test_comment_branch(self):
+        result = self.controller.retrieve_comment_branch(0, 2)
+        self.assertEqual(
+            [(branch['sub_comment'].comment_id,
+              [c.comment_id for c in branch['sub_sub_comments']])
+             for branch in result],
+            [(5, [9, 11]), (7, [])],
+        )
+
+    def test_hidden_comment_is_ignored(self):
+        result = self.controller.retrieve_n_most_upvoted_comment(0, 10)
+        self.assertNotIn(
+            'hidden_comment', [comment.text for comment, _ in result])
+
+
+@unittest.skipIf(ranking.np is None, 'numpy is not installed')
+class TestNumpyRanking(unittest.TestCase):
+
+    def test_same_ranking_as_sorted(self):
+        rng = random.Random(0)
+        controllers = [
+            RedditNativeController(),
+            RedditNativeController(ranking='numpy', numpy_threshold=0),
+            RedditNativeController(ranking='numpy', numpy_threshold=20),
+        ]
+        for controller in controllers:
+            controller.create_post(reddit_pb2.Post(title='post'))
+            controller.create_comment(reddit_pb2.Comment(parent_post_id=0))
+        for i in range(300):
+            parent = rng.choice([{'parent_post_id': 0},
+                                 {'parent_comment_id': rng.randrange(i + 1)}])
+            votes = [(f'user{rng.randrange(30)}', rng.random() < 0.7)
+                     for _ in range(rng.randrange(6))]
+            hide = rng.random() < 0.1
+            for controller in controllers:
+                comment = controller.create_comment(
+                    reddit_pb2.Comment(**parent))
+                for user_id, is_upvote in votes:
+                    controller.vote_comment(
+                        comment.comment_id, user_id, is_upvote)
+                if hide:
+                    controller.set_comment_state(
+                        comment.comment_id,
+                        reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
+
+        def top(controller):
+            return [(c.comment_id, c.score, has_sub) for c, has_sub in
+                    controller.retrieve_n_most_upvoted_comment(0, 25)]
+
+        def branch(controller):
+            return [(b['sub_comment'].comment_id,
+                     [c.comment_id for c in b['sub_sub_comments']])
+                    for b in controller.retrieve_comment_branch(0, 7)]
+
+        for controller in controllers[1:]:
+            self.assertEqual(top(controller), top(controllers[0]))
+            self.assertEqual(branch(controller), branch(controllers[0]))
+
+
+class TestVoteStore(unittest.TestCase):
+
+    def test_sparse_votes(self):
+        store = VoteStore()
+        self.assertEqual(store.get(1, 5), NO_VOTE)
+        self.assertNotIn(1, store.items)
+        store.set(1, 5, UPVOTE)
+        store.set(1, 1000, DOWNVOTE)
+        self.assertEqual(store.get(1, 5), UPVOTE)
+        self.assertEqual(store.get(1, 1000), DOWNVOTE)
+        self.assertEqual(store.get(1, 6), NO_VOTE)
+        store.set(1, 5, NO_VOTE)
+        self.assertEqual(list(store.voters(1)), [(1000, DOWNVOTE)])
+
+    def test_dense_votes_use_bitmap(self):
+        store = VoteStore()
+        expected = {}
+        for handle in range(0, 600, 3):
+            vote = UPVOTE if handle % 2 else DOWNVOTE
+            store.set(7, handle, vote)
+            expected[handle] = vote
+        self.assertIsInstance(store.items[7], bytearray)
+        store.set(7, 3, NO_VOTE)
+        del expected[3]
+        store.set(7, 5000, UPVOTE)
+        expected[5000] = UPVOTE
+        self.assertEqual(dict(store.voters(7)), expected)
+        for handle in range(5100):
+            self.assertEqual(store.get(7, handle),
+                             expected.get(handle, NO_VOTE))
+
+
+class TestWriteAheadLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'reddit.wal')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self, durability='batch'):
+        controller = RedditNativeController()
+        log = wal.WriteAheadLog(self.path, durability)
+        replayed = log.replay(controller.apply_record)
+        controller.log = log
+        return controller, replayed
+
+    def snapshot(self, controller):
+        return ([controller.get_post(i) for i in range(len(controller.posts))],
+                controller.retrieve_n_most_upvoted_comment(0, 10),
+                controller.retrieve_comment_branch(0, 10))
+
+    def test_replay_restores_state(self):
+        controller, replayed = self.open()
+        self.assertEqual(replayed, 0)
+        controller.init()
+        controller.vote_post(0, 'user1', True)
+        controller.set_comment_state(
+            12, reddit_pb2.CommentState.COMMENT_STATE_NORMAL)
+        expected = self.snapshot(controller)
+        controller.log.close()
+
+        controller, replayed = self.open()
+        self.assertGreater(replayed, 0)
+        self.assertEqual(self.snapshot(controller), expected)
+        # the replayed votes are known, so a repeated vote is rejected
+        self.assertEqual(controller.vote_post(0, 'user1', True), (False, 0))
+        self.assertEqual(controller.vote_comment(0, 'user1', False),
+                         (True, 1))
+        controller.log.close()
+
+    def test_torn_tail_is_dropped(self):
+        controller, _ = self.open()
+        controller.create_post(reddit_pb2.Post(title='kept'))
+        controller.create_post(reddit_pb2.Post(title='torn'))
+        controller.log.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 3)
+
+        controller, replayed = self.open()
+        self.assertEqual(replayed, 1)
+        self.assertEqual(controller.get_post(0).title, 'kept')
+        post = controller.create_post(reddit_pb2.Post(title='after'))
+        self.assertEqual(post.post_id, 1)
+        controller.log.close()
+        self.assertEqual(
+            [record.sequence for _, record in wal.read_records(self.path)],
+            [1, 2])
+
+    def test_group_commit(self):
+        for durability in wal.WriteAheadLog.DURABILITY:
+            controller, _ = self.open(durability)
+            post = controller.create_post(reddit_pb2.Post(title='post'))
+            threads = [threading.Thread(
+                target=lambda t=t: [
+                    controller.vote_post(post.post_id, f'{t}-{i}', True)
+                    for i in range(50)])
+                for t in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            controller.log.close()
+            controller, _ = self.open(durability)
+            self.assertEqual(controller.get_post(post.post_id).score, 400)
+            controller.log.close()
+            os.remove(self.path)
+
+    def test_no_vote_is_logged_after_a_hide(self):
+        controller, _ = self.open()
+        controller.init()
+        # the comment is looked up before a concurrent hide, which then
+        # runs before the vote takes the comment's lock
+        controller.comment_row = controller.comments.row
+        controller.set_comment_state(
+            0, reddit_pb2.CommentState.COMMENT_STATE_HIDDEN)
+        self.assertEqual(controller.vote_comment(0, 'late', True), (False, 0))
+        self.assertEqual(controller.vote_comments([(0, 'late', True)]),
+                         [(False, 0)])
+        controller.log.close()
+        self.assertFalse(any(
+            record.vote_comment.user.user_id == 'late'
+            for _, record in wal.read_records(self.path)))
+
+    def test_failed_fsync_fails_the_log(self):
+        controller, _ = self.open()
+        post = controller.create_post(reddit_pb2.Post(title='post'))
+        durable = controller.log.durable
+        with patch('os.fsync', side_effect=OSError(28, 'No space left')):
+            with self.assertRaises(OSError):
+                controller.vote_post(post.post_id, 'user1', True)
+        self.assertEqual(controller.log.durable, durable)
+        # the lost record is never reported durable, nor is anything later
+        with self.assertRaises(OSError):
+            controller.log.sync(controller.log.appended)
+        with self.assertRaises(OSError):
+            controller.vote_post(post.post_id, 'user2', True)
+        with self.assertRaises(OSError):
+            controller.log.close()
+
+    def test_failed_write_stops_interval_flusher(self):
+        controller, _ = self.open('interval')
+        with patch('os.fsync', side_effect=OSError(5, 'I/O error')):
+            controller.create_post(reddit_pb2.Post(title='post'))
+            controller.log.flusher.join(5)
+        self.assertFalse(controller.log.flusher.is_alive())
+        with self.assertRaises(OSError):
+            controller.create_post(reddit_pb2.Post(title='after'))
+        with self.assertRaises(OSError):
+            controller.log.close()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'reddit.snap')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def state(self, controller):
+        return ([controller.get_post(i) for i in range(len(controller.posts))],
+                [controller.get_comment(i)
+                 for i in range(len(controller.comments))],
+                controller.retrieve_n_most_upvoted_comment(0, 10),
+                controller.retrieve_comment_branch(0, 10))
+
+    def test_round_trip(self):
+        controller = RedditNativeController()
+        controller.init()
+        controller.vote_post(0, 'user1', True)
+        # enough voters for the comment's votes to be kept as a bitmap
+        for i in range(40):
+            controller.vote_comment(3, f'user{i}', i % 3 != 0)
+        snapshot.save(controller, self.path, log_sequence=7)
+
+        loaded, sequence = snapshot.load(self.path)
+        self.assertEqual(sequence, 7)
+        self.assertEqual(self.state(loaded), self.state(controller))
+        # votes, child lists and users keep working after the load
+        self.assertEqual(loaded.vote_post(0, 'user1', True), (False, 0))
+        self.assertEqual(loaded.vote_comment(3, 'user0', True),
+                         controller.vote_comment(3, 'user0', True))
+        self.assertEqual(loaded.vote_comment(4, 'newuser', False),
+                         controller.vote_comment(4, 'newuser', False))
+        comment = reddit_pb2.Comment(
+            author=reddit_pb2.User(user_id='user9'), parent_post_id=0)
+        self.assertEqual(loaded.create_comment(comment).comment_id,
+                         len(controller.comments))
+        controller.create_comment(reddit_pb2.Comment(
+            author=reddit_pb2.User(user_id='user9'), parent_post_id=0),
+            publication_time=loaded.comments.publication_time[-1])
+        self.assertEqual(self.state(loaded), self.state(controller))
+
+    def test_log_is_replayed_after_snapshot(self):
+        log_path = os.path.join(self.directory.name, 'reddit.wal')
+        controller = RedditNativeController(log=wal.WriteAheadLog(log_path))
+        controller.log.open()
+        controller.init()
+        snapshot.save(controller, self.path, controller.log.appended)
+        controller.vote_comment(4, 'user3', True)
+        expected = self.state(controller)
+        controller.log.close()
+
+        loaded, sequence = snapshot.load(self.path)
+        log = wal.WriteAheadLog(log_path)
+        self.assertEqual(log.replay(loaded.apply_record, after=sequence), 1)
+        self.assertEqual(self.state(loaded), expected)
+        log.close()
+
+
+class TestDataset(unittest.TestCase):
+
+    def state(self, controller):
+        return ([controller.get_post(i) for i in range(len(controller.posts))],
+                [controller.get_comment(i)
+                 for i in range(len(controller.comments))],
+                [controller.retrieve_n_most_upvoted_comment(i, 5)
+                 for i in range(len(controller.posts))],
+                [controller.retrieve_comment_branch(i, 3)
+                 for i in range(len(controller.comments))])
+
+    def test_bulk_load_matches_create_calls(self):
+        records = list(dataset.generate(20, 500, 2000, users=50, seed=3))
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('data.jsonl', 'data.pb'):
+                path = os.path.join(directory, name)
+                self.assertEqual(dataset.write_records(path, records),
+                                 len(records))
+                loaded = dataset.load(RedditNativeController(),
+                                      dataset.read_records(path))
+                replayed = RedditNativeController()
+                for record in dataset.read_records(path):
+                    replayed.apply_record(record)
+                self.assertEqual(self.state(loaded), self.state(replayed))
+        # the generated threads are deeper than one level of replies
+        parents = loaded.comments.parent_comment_id
+        self.assertTrue(any(parents[parent_id] != -1
+                            for parent_id in parents if parent_id != -1))
+
+    def test_split_serves_as_the_whole_dataset(self):
+        def records():
+            return dataset.generate(20, 500, 2000, users=50, seed=3)
+
+        def without_ids(comments):
+            # comments are numbered by shard, posts keep their ids
+            return [{key: value for key, value in comment.items()
+                     if key not in ('comment_id', 'parent_comment_id')}
+                    for comment in comments]
+
+        def branch(client, comment_id):
+            return without_ids(
+                comment for sub in client.expand_comment_branch(comment_id, 3)
+                for comment in [sub['sub_comment']] + sub['sub_sub_comments'])
+
+        servers = [make_server('localhost', 0, dataset.load(
+            RedditNativeController(), dataset.split(records(), shard, 3)))
+            for shard in range(3)]
+        servers.append(make_server('localhost', 0, dataset.load(
+            RedditNativeController(), records())))
+        router, port = make_router(
+            'localhost', 0, [f'localhost:{port}' for _, port in servers[:3]])
+        try:
+            sharded = RedditClient(host='localhost', port=port)
+            whole = RedditClient(host='localhost', port=servers[3][1])
+            for post_id in range(20):
+                self.assertEqual(sharded.get_post_content(post_id),
+                                 whole.get_post_content(post_id))
+                tops = (sharded.get_most_upvoted_comments(post_id, 3),
+                        whole.get_most_upvoted_comments(post_id, 3))
+                self.assertEqual(without_ids(tops[0]), without_ids(tops[1]))
+                for sharded_top, whole_top in zip(*tops):
+                    self.assertEqual(
+                        branch(sharded, sharded_top['comment_id']),
+                        branch(whole, whole_top['comment_id']))
+        finally:
+            router.stop(None)
+            for server, _ in servers:
+                server.stop(None)
+
+    def test_ids_must_be_dense(self):
+        records = [reddit_pb2.LogRecord(
+            create_post=reddit_pb2.Post(post_id=1, title='gap'))]
+        with self.assertRaises(ValueError):
+            dataset.load(RedditNativeController(), records)
+
+
+class TestIdAllocation(unittest.TestCase):
+
+    def allocate(self, allocator, threads=8, count=1000):
+        """Ids allocated by each of `threads` concurrent threads"""
+        results = [None] * threads
+
+        def worker(t):
+            results[t] = [allocator.next_id() for _ in range(count)]
+
+        threads = [threading.Thread(target=worker, args=(t,))
+                   for t in range(threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def assert_unique_and_ordered(self, per_thread):
+        all_ids = [item_id for ids in per_thread for item_id in ids]
+        self.assertEqual(len(set(all_ids)), len(all_ids))
+        for ids in per_thread:
+            self.assertEqual(ids, sorted(ids))
+
+    def test_blocks(self):
+        shards = [BlockIds(block_size=16, shard=shard, shards=3)
+                  for shard in range(3)]
+        per_shard = [self.allocate(allocator, 4, 100) for allocator in shards]
+        self.assert_unique_and_ordered(sum(per_shard, []))
+        for shard, per_thread in enumerate(per_shard):
+            self.assertEqual({shards[0].shard_of(item_id)
+                              for ids in per_thread for item_id in ids},
+                             {shard})
+        shards[1].advance(10_000)
+        self.assertGreater(shards[1].next_id(), 10_000)
+
+    def test_snowflake(self):
+        start = time.time()
+        shards = [SnowflakeIds(shard=shard) for shard in range(2)]
+        per_shard = [self.allocate(allocator) for allocator in shards]
+        end = time.time()
+        self.assert_unique_and_ordered(sum(per_shard, []))
+        for shard, per_thread in enumerate(per_shard):
+            for item_id in per_thread[0]:
+                self.assertEqual(shards[0].shard_of(item_id), shard)
+                self.assertGreaterEqual(item_id, shards[0].first_id(start))
+                self.assertLess(item_id, shards[0].first_id(end + 0.001))
+        # a thread using up a millisecond's sequence numbers borrows the next
+        allocator = SnowflakeIds(sequence_bits=2)
+        self.assert_unique_and_ordered(self.allocate(allocator, 1, 100))
+        allocator.advance(allocator.first_id(end + 60))
+        self.assertGreaterEqual(allocator.timestamp(allocator.next_id()),
+                                end + 60)
+
+    def test_slots_of_finished_threads_are_reused(self):
+        allocator = SnowflakeIds(thread_bits=1)
+        per_thread = sum((self.allocate(allocator, 2, 10) for _ in range(5)),
+                         [])
+        self.assert_unique_and_ordered(per_thread)
+
+    def test_snowflake_layout_limits(self):
+        check_ids('snowflake', shards=16, threads=64)
+        with self.assertRaisesRegex(ValueError, '16 shards, not 17'):
+            allocator('snowflake', 0, 17)
+        with self.assertRaisesRegex(ValueError, '64 threads'):
+            check_ids('snowflake', threads=65)
+        check_ids('blocks', shards=100, threads=100)
+
+    def test_controller_with_allocated_ids(self):
+        def texts(controller, post_id):
+            return [(comment.text, comment.score, has_sub) for comment, has_sub
+                    in controller.retrieve_n_most_upvoted_comment(post_id, 10)]
+
+        expected = RedditNativeController()
+        expected.init()
+        for allocator in (BlockIds(block_size=4), SnowflakeIds()):
+            controller = RedditNativeController(ids=allocator)
+            controller.init()
+            post_ids = list(controller.posts.ids)
+            comment_ids = list(controller.comments.ids)
+            self.assertEqual(len(set(post_ids + comment_ids)), 19)
+            self.assertEqual(texts(controller, post_ids[0]),
+                             texts(expected, 0))
+            branch = controller.retrieve_comment_branch(comment_ids[0], 2)
+            self.assertEqual(
+                [(sub['sub_comment'].parent_comment_id,
+                  [subsub.text for subsub in sub['sub_sub_comments']])
+                 for sub in branch],
+                [(comment_ids[0], ['comment000', 'comment002']),
+                 (comment_ids[0], [])])
+            self.assertEqual(controller.vote_post(post_ids[1], 'a', True),
+                             (True, 1))
+            self.assertTrue(controller.set_comment_state(
+                comment_ids[0], reddit_pb2.CommentState.COMMENT_STATE_HIDDEN))
+            self.assertIsNone(controller.get_comment(comment_ids[0]))
+            self.assertEqual(controller.get_post(post_ids[0]).comment_count, 2)
+
+    def test_log_and_snapshot_keep_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'reddit.wal')
+            snap_path = os.path.join(directory, 'reddit.snap')
+            controller = RedditNativeController(
+                ids=SnowflakeIds(), log=wal.WriteAheadLog(log_path))
+            controller.log.open()
+            controller.init()
+            post = controller.create_post(reddit_pb2.Post(title='post'))
+            snapshot.save(controller, snap_path, controller.log.appended)
+            comment = controller.create_comment(reddit_pb2.Comment(
+                text='comment', parent_post_id=post.post_id))
+            controller.vote_comment(comment.comment_id, 'a', True)
+            controller.log.close()
+
+            replayed = RedditNativeController(ids=SnowflakeIds())
+            log = wal.WriteAheadLog(log_path)
+            log.replay(replayed.apply_record)
+            loaded, sequence = snapshot.load(snap_path, ids=SnowflakeIds())
+            self.assertEqual(log.replay(loaded.apply_record, after=sequence),
+                             2)
+            log.close()
+            for restored in (replayed, loaded):
+                self.assertEqual(restored.get_comment(comment.comment_id),
+                                 controller.get_comment(comment.comment_id))
+                self.assertEqual(
+                    restored.retrieve_n_most_upvoted_comment(post.post_id, 5),
+                    controller.retrieve_n_most_upvoted_comment(
+                        post.post_id, 5))
+                self.assertGreater(restored.create_post(
+                    reddit_pb2.Post()).post_id, comment.comment_id)
+            with self.assertRaises(ValueError):
+                snapshot.load(snap_path)
+
+    def test_unknown_ids_are_rejected(self):
+        for ids in (None, SnowflakeIds()):
+            controller = RedditNativeController(ids=ids)
+            post = controller.create_post(reddit_pb2.Post())
+            comment = controller.create_comment(
+                reddit_pb2.Comment(parent_post_id=post.post_id))
+            unknown = comment.comment_id + 1
+            self.assertFalse(controller.set_comment_score(unknown, 100))
+            self.assertFalse(controller.set_comment_state(
+                unknown, reddit_pb2.CommentState.COMMENT_STATE_HIDDEN))
+            self.assertEqual(
+                controller.get_comment(comment.comment_id).score, 0)
+            self.assertTrue(controller.set_comment_score(
+                comment.comment_id, 100))
+            self.assertEqual(
+                controller.get_comment(comment.comment_id).score, 100)
+            # a comment on a parent that does not exist is not created
+            self.assertIsNone(controller.create_comment(
+                reddit_pb2.Comment(parent_post_id=post.post_id + 1)))
+            self.assertIsNone(controller.create_comment(
+                reddit_pb2.Comment(parent_comment_id=unknown)))
+            created = controller.create_comments([
+                reddit_pb2.Comment(parent_comment_id=unknown),
+                reddit_pb2.Comment(parent_comment_id=comment.comment_id)])
+            self.assertIsNone(created[0])
+            self.assertEqual(len(controller.comments), 2)
+            self.assertEqual(
+                controller.get_comment(comment.comment_id).comment_count, 1)
+
+    def test_router_routes_by_allocated_shard(self):
+        shards = [make_server('localhost', 0, RedditNativeController(
+            ids=SnowflakeIds(shard=shard))) for shard in range(2)]
+        router, port = make_router(
+            'localhost', 0, [f'localhost:{port}' for _, port in shards],
+            ids=SnowflakeIds())
+        try:
+            client = RedditClient(host='localhost', port=port)
+            post_ids = [client.create_post(f'post {i}', 'x') for i in range(4)]
+            self.assertEqual([SnowflakeIds().shard_of(post_id)
+                              for post_id in post_ids], [0, 1, 0, 1])
+            comment_id = client.create_comment('a', parent_post_id=post_ids[3])
+            self.assertEqual(SnowflakeIds().shard_of(comment_id), 1)
+            self.assertEqual(client.vote_comment(comment_id, 'b', True), 1)
+            self.assertEqual(
+                [post['title'] for post in client.get_posts(post_ids)],
+                [f'post {i}' for i in range(4)])
+            self.assertEqual(client.get_most_upvoted_comments(
+                post_ids[3], 5)[0]['comment_id'], comment_id)
+        finally:
+            router.stop(None)
+            for server, _ in shards:
+                server.stop(None)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_cached_answers_stay_fresh(self):
+        controller = RedditNativeController()
+        controller.init()
+        cached = RedditServicer(controller)
+        uncached = RedditServicer(controller, cache_size=0)
+        rng = random.Random(0)
+        for step in range(300):
+            comments = len(controller.comments)
+            change = rng.randrange(4)
+            if change == 0:
+                controller.vote_comment(rng.randrange(comments),
+                                        f'user{rng.randrange(20)}',
+                                        rng.random() < 0.7)
+            elif change == 1:
+                controller.create_comment(reddit_pb2.Comment(
+                    author=reddit_pb2.User(user_id='user1'),
+                    parent_comment_id=rng.randrange(comments)))
+            elif change == 2:
+                controller.set_comment_state(
+                    rng.randrange(comments), rng.choice(
+                        [reddit_pb2.CommentState.COMMENT_STATE_NORMAL,
+                         reddit_pb2.CommentState.COMMENT_STATE_HIDDEN]))
+            for _ in range(5):
+                request = reddit_pb2.GetMostUpvotedCommentsRequest(
+                    post_id=rng.randrange(3), limit=3)
+                self.assertEqual(
+                    cached.GetMostUpvotedComments(request, None),
+                    uncached.GetMostUpvotedComments(request, None))
+                request = reddit_pb2.ExpandCommentBranchRequest(
+                    comment_id=rng.randrange(comments), limit=3)
+                self.assertEqual(
+                    cached.ExpandCommentBranch(request, None),
+                    uncached.ExpandCommentBranch(request, None))
+        self.assertGreater(cached.cache.hits, 0)
+
+    def test_eviction_and_staleness(self):
+        now = [0.0]
+        cache = ResponseCache(2, max_staleness=0.5, clock=lambda: now[0])
+        cache.put('a', 1, 'A')
+        cache.put('b', 1, 'B')
+        self.assertEqual(cache.get('a', 1), 'A')
+        cache.put('c', 1, 'C')
+        # 'b' was the least recently used
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.evictions, 1)
+        # a newer version is served the stale answer until it is too old
+        self.assertEqual(cache.get('a', 2), 'A')
+        now[0] = 1.0
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 2,
+                                         'evictions': 1, 'size': 2})
+
+
+class TestCommentTree(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = RedditNativeController(wire_cache=True)
+        self.controller.init()
+        self.servicer = RedditServicer(self.controller)
+
+    def tree(self, **request):
+        response = self.servicer.ExpandCommentBranch(
+            reddit_pb2.ExpandCommentBranchRequest(**request), None)
+
+        def ids(trees):
+            return [(tree.comment.comment_id, tree.has_subcomment,
+                     ids(tree.replies)) for tree in trees]
+        return ids(response.tree)
+
+    def test_two_levels_match_branch(self):
+        branch = self.controller.retrieve_comment_branch(0, 2)
+        self.assertEqual(
+            [(comment_id, [sub_id for sub_id, _, _ in replies])
+             for comment_id, _, replies in self.tree(
+                 comment_id=0, limit=2, max_depth=2)],
+            [(sub['sub_comment'].comment_id,
+              [subsub.comment_id for subsub in sub['sub_sub_comments']])
+             for sub in branch])
+
+    def test_level_limits_and_node_budget(self):
+        self.assertEqual(
+            self.tree(comment_id=0, max_depth=3, level_limits=[2, 1]),
+            [(5, True, [(9, False, [])]), (7, False, [])])
+        # breadth first: the whole first level comes before any reply
+        self.assertEqual(
+            self.tree(comment_id=0, limit=10, max_depth=5, max_nodes=4),
+            [(5, True, []), (7, False, []), (6, False, []), (8, False, [])])
+
+    def test_raw_tree_and_client(self):
+        request = reddit_pb2.ExpandCommentBranchRequest(
+            comment_id=0, limit=3, max_depth=4)
+        raw = RedditServicer(self.controller, raw_responses=True)
+        self.assertEqual(
+            raw.ExpandCommentBranch(request, None).data,
+            self.servicer.ExpandCommentBranch(
+                request, None).SerializeToString())
+        server, port = make_server('localhost', 0, self.controller,
+                                   raw_responses=True)
+        try:
+            client = RedditClient(host='localhost', port=port)
+            tree = client.expand_comment_tree(0, 4, 3)
+        finally:
+            server.stop(None)
+        self.assertEqual([comment['comment_id'] for comment in tree],
+                         [5, 7, 6])
+        self.assertEqual([reply['comment_id'] for reply in tree[0]['replies']],
+                         [9, 11, 10])
+        self.assertTrue(tree[0]['has_subcomment'])
+
+
+class TestStreamCommentTree(unittest.TestCase):
+
+    def test_stream_is_tree_breadth_first(self):
+        controller = RedditNativeController(wire_cache=True)
+        controller.init()
+        for parent_id in (9, 9, 13):
+            controller.create_comment(
+                reddit_pb2.Comment(parent_comment_id=parent_id))
+        for raw_responses in (False, True):
+            server, port = make_server('localhost', 0, controller,
+                                       raw_responses=raw_responses)
+            try:
+                client = RedditClient(host='localhost', port=port)
+                stream = client.stream_comment_tree(0, 10, 2)
+                first = next(stream)
+                streamed = [first] + list(stream)
+                tree = client.expand_comment_tree(0, 10, 2)
+                budget = list(client.stream_comment_tree(
+                    0, 10, 2, max_nodes=3))
+            finally:
+                server.stop(None)
+            level, depth, expected = tree, 1, []
+            while level:
+                expected += [(comment['comment_id'], depth)
+                             for comment in level]
+                level = [reply for comment in level
+                         for reply in comment['replies']]
+                depth += 1
+            self.assertEqual([(comment['comment_id'], comment['depth'])
+                              for comment in streamed], expected)
+            self.assertEqual(max(depth for _, depth in expected), 4)
+            self.assertEqual(budget, streamed[:3])
+
+
+class TestPostThread(unittest.TestCase):
+
+    def test_same_as_separate_calls(self):
+        controller = RedditNativeController(wire_cache=True)
+        controller.init()
+        for raw_responses in (False, True):
+            server, port = make_server('localhost', 0, controller,
+                                       raw_responses=raw_responses)
+            try:
+                client = RedditClient(host='localhost', port=port)
+                thread = client.get_post_thread(0, 3, 2)
+                post = client.get_post_content(0)
+                comments = client.get_most_upvoted_comments(0, 3)
+                replies = [client.expand_comment_branch(
+                    comment['comment_id'], 2) for comment in comments]
+                missing = client.get_post_thread(5, 3, 2)
+            finally:
+                server.stop(None)
+            self.assertEqual(thread['post'], post)
+            self.assertEqual(
+                [{key: value for key, value in comment.items()
+                  if key != 'replies'} for comment in thread['comments']],
+                comments)
+            self.assertEqual(
+                [[reply['comment_id'] for reply in comment['replies']]
+                 for comment in thread['comments']],
+                [[sub['sub_comment']['comment_id'] for sub in branch]
+                 for branch in replies])
+            # post 5 is hidden
+            self.assertIsNone(missing)
+
+    def test_cached_thread_follows_post_votes(self):
+        controller = RedditNativeController()
+        controller.init()
+        servicer = RedditServicer(controller)
+        request = reddit_pb2.GetPostThreadRequest(
+            post_id=0, limit=3, reply_limit=2)
+        servicer.GetPostThread(request, None)
+        controller.vote_post(0, 'user1', True)
+        controller.create_comment(reddit_pb2.Comment(parent_comment_id=6))
+        response = servicer.GetPostThread(request, None)
+        self.assertEqual(response.post.score, 1)
+        self.assertEqual(response, RedditServicer(
+            controller, cache_size=0).GetPostThread(request, None))
+
+
+class TestBatchWrites(unittest.TestCase):
+
+    def state(self, controller):
+        return ([(post.post_id, post.score)
+                 for post in map(controller.get_post,
+                                 range(len(controller.posts))) if post],
+                [(comment.comment_id, comment.score, comment.comment_count)
+                 for comment, _ in
+                 controller.retrieve_n_most_upvoted_comment(0, 10)],
+                controller.comment_branch_ids(0, 10))
+
+    def test_batches_match_single_calls(self):
+        batched, single = RedditNativeController(), RedditNativeController()
+        batched.init()
+        single.init()
+        rng = random.Random(1)
+        post_votes = [(rng.randrange(5), f'user{rng.randrange(4)}',
+                       rng.random() < 0.7) for _ in range(200)]
+        comment_votes = [(rng.randrange(14), f'user{rng.randrange(4)}',
+                          rng.random() < 0.7) for _ in range(200)]
+        self.assertEqual(
+            batched.vote_posts(post_votes),
+            [single.vote_post(*vote) for vote in post_votes])
+        self.assertEqual(
+            batched.vote_comments(comment_votes),
+            [single.vote_comment(*vote) for vote in comment_votes])
+        comments = [dict(parent_post_id=0), dict(parent_comment_id=0),
+                    dict(parent_comment_id=5), dict(parent_comment_id=13),
+                    dict(parent_comment_id=0, comment_state=reddit_pb2.CommentState
+                         .COMMENT_STATE_HIDDEN)]
+        created = batched.create_comments(
+            [reddit_pb2.Comment(**comment) for comment in comments])
+        self.assertEqual([comment.comment_id for comment in created],
+                         [single.create_comment(reddit_pb2.Comment(
+                             **comment)).comment_id for comment in comments])
+        self.assertEqual(self.state(batched), self.state(single))
+        self.assertEqual(batched.comment_branch_ids(13, 5),
+                         [(16, [])])
+
+    def test_batch_rpcs(self):
+        controller = RedditNativeController()
+        controller.init()
+        server, port = make_server('localhost', 0, controller)
+        try:
+            client = RedditClient(host='localhost', port=port)
+            self.assertEqual(
+                client.vote_batch([(0, 'a', True), (0, 'a', True),
+                                   (99, 'a', True)], [(3, 'a', False)]),
+                ([1, None, None], [-1]))
+            self.assertEqual(
+                client.stream_votes(((0, f'u{i}', True) for i in range(5)),
+                                    [(3, 'b', False)], batch_size=2),
+                ([2, 3, 4, 5, 6], [-2]))
+            self.assertEqual(client.create_comments(
+                [{'author_id': 'a', 'parent_post_id': 1, 'text': 'x'},
+                 {'author_id': 'b', 'parent_comment_id': 13}]), [13, 14])
+            self.assertEqual(client.stream_create_comments(
+                ({'author_id': 'c', 'parent_comment_id': 13}
+                 for _ in range(3)), batch_size=2), [15, 16, 17])
+            self.assertIsNone(client.create_comment('d', parent_post_id=99))
+            self.assertEqual(client.create_comments(
+                [{'author_id': 'd', 'parent_comment_id': 99},
+                 {'author_id': 'd', 'parent_post_id': 1}]), [None, 18])
+        finally:
+            server.stop(None)
+        self.assertEqual(controller.comments.comment_count[13], 4)
+        self.assertEqual(controller.get_comment(13).text, 'x')
+
+
+class TestBatchReads(unittest.TestCase):
+
+    def test_batch_get(self):
+        controller = RedditNativeController(wire_cache=True)
+        controller.init()
+        post_ids = [3, 5, 99, 0, 3, 1, 2, 4, -1]
+        comment_ids = [12, 0, 7, 13, 11]
+        for raw_responses in (False, True):
+            server, port = make_server('localhost', 0, controller,
+                                       raw_responses=raw_responses)
+            try:
+                client = RedditClient(host='localhost', port=port)
+                posts = client.get_posts(post_ids, batch_size=2)
+                comments = client.get_comments(comment_ids, batch_size=3)
+                response = client.stub.BatchGetComments(
+                    reddit_pb2.BatchGetCommentsRequest(comment_ids=[12, 13]))
+                self.assertEqual(
+                    [post and post['post_id'] for post in posts],
+                    [3, None, None, 0, 3, 1, 2, 4, None])
+                self.assertEqual(posts[0], client.get_post_content(3))
+                self.assertEqual(
+                    [comment and comment['comment_id']
+                     for comment in comments], [None, 0, 7, None, 11])
+                self.assertEqual(
+                    [result.status for result in response.comments],
+                    [reddit_pb2.ItemStatus.ITEM_STATUS_HIDDEN,
+                     reddit_pb2.ItemStatus.ITEM_STATUS_NOT_FOUND])
+                self.assertFalse(response.comments[0].HasField('comment'))
+            finally:
+                server.stop(None)
+
+
+class TestAsyncServer(unittest.TestCase):
+
+    async def call_all(self, stub):
+        vote = await stub.VotePost(reddit_pb2.VotePostRequest(
+            post_id=0, user=reddit_pb2.User(user_id='a'), is_upvote=True))
+        top = await stub.GetMostUpvotedComments(
+            reddit_pb2.GetMostUpvotedCommentsRequest(post_id=0, limit=3))
+        thread = await stub.GetPostThread(reddit_pb2.GetPostThreadRequest(
+            post_id=0, limit=3, reply_limit=2))
+        nodes = [node async for node in stub.StreamCommentTree(
+            reddit_pb2.ExpandCommentBranchRequest(
+                comment_id=0, limit=5, max_depth=3))]
+
+        async def batches():
+            for user in ('b', 'c'):
+                yield reddit_pb2.BatchVoteRequest(
+                    comment_votes=[reddit_pb2.VoteCommentRequest(
+                        comment_id=5, user=reddit_pb2.User(user_id=user),
+                        is_upvote=True)])
+        streamed = await stub.StreamVotes(batches())
+        return vote, top, thread, nodes, streamed
+
+    async def serve_and_call(self, make, **kwargs):
+        controller = RedditNativeController(wire_cache=True)
+        # the same dates in every controller
+        with patch('controller.time.time', return_value=1_700_000_000.0):
+            controller.init()
+        server, port = await make('localhost', 0, controller, **kwargs)
+        try:
+            async with grpc.aio.insecure_channel(
+                    f'localhost:{port}') as channel:
+                return await self.call_all(RedditServiceStub(channel))
+        finally:
+            stopped = server.stop(None)
+            if asyncio.iscoroutine(stopped):
+                await stopped
+
+    async def make_sync_server(self, *args, **kwargs):
+        return make_server(*args, **kwargs)
+
+    def test_same_answers_as_threaded_server(self):
+        expected = asyncio.run(self.serve_and_call(self.make_sync_server))
+        self.assertEqual([node.depth for node in expected[3]],
+                         [1, 1, 1, 1, 2, 2, 2])
+        for kwargs in ({}, {'offload_ranking': True},
+                       {'raw_responses': True}):
+            self.assertEqual(asyncio.run(self.serve_and_call(
+                make_async_server, **kwargs)), expected, kwargs)
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        controller = RedditNativeController()
+        controller.init()
+        self.server, self.port = make_server('localhost', 0, controller)
+        self.client = RedditClient(host='localhost', port=self.port)
+
+    def tearDown(self):
+        self.server.stop(None)
+
+    async def calls(self):
+        async with AsyncRedditClient(host='localhost',
+                                     port=self.port) as client:
+            return [
+                await client.create_post('t', 'x', author='a'),
+                await client.vote_post(0, 'a', True),
+                await client.vote_comment(0, 'a', True),
+                await client.get_post_content(0),
+                await client.get_most_upvoted_comments(0, 3),
+                await client.expand_comment_branch(0, 2),
+                await client.expand_comment_tree(0, 3, 2),
+                [node async for node in client.stream_comment_tree(0, 3, 2)],
+                await client.get_post_thread(0, 2, 2),
+                await client.gather_posts(range(8), concurrency=3),
+            ]
+
+    def test_same_results_as_sync_client(self):
+        results = asyncio.run(self.calls())
+        client = self.client
+        self.assertEqual(results[:3], [6, 1, 4])
+        self.assertEqual(results[3:], [
+            client.get_post_content(0),
+            client.get_most_upvoted_comments(0, 3),
+            client.expand_comment_branch(0, 2),
+            client.expand_comment_tree(0, 3, 2),
+            list(client.stream_comment_tree(0, 3, 2)),
+            client.get_post_thread(0, 2, 2),
+            [client.get_post_content(post_id) for post_id in range(8)],
+        ])
+
+    def test_gather_bounds_concurrency(self):
+        in_flight = []
+
+        async def call(i):
+            in_flight.append(i)
+            peak = len(in_flight)
+            await asyncio.sleep(0.001 * (i % 3))
+            in_flight.remove(i)
+            return i, peak
+
+        results = asyncio.run(AsyncRedditClient(stub=MagicMock()).gather(
+            [functools.partial(call, i) for i in range(20)], concurrency=4))
+        self.assertEqual([i for i, _ in results], list(range(20)))
+        self.assertEqual(max(peak for _, peak in results), 4)
+
+
+class TestRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = [make_server('localhost', 0, RedditNativeController())
+                       for _ in range(3)]
+        self.router, port = make_router(
+            'localhost', 0, [f'localhost:{port}' for _, port in self.shards])
+        self.client = RedditClient(host='localhost', port=port)
+
+    def tearDown(self):
+        self.router.stop(None)
+        for server, _ in self.shards:
+            server.stop(None)
+
+    def test_ids_encode_shard(self):
+        client = self.client
+        post_ids = [client.create_post(f'post {i}', 'x') for i in range(6)]
+        self.assertEqual(post_ids, [0, 1, 2, 3, 4, 5])
+        comment_ids = [client.create_comment('a', parent_post_id=post_id)
+                       for post_id in post_ids]
+        self.assertEqual([comment_id % 3 for comment_id in comment_ids],
+                         [post_id % 3 for post_id in post_ids])
+        reply_id = client.create_comment('b', parent_comment_id=comment_ids[4],
+                                         text='reply')
+        self.assertEqual(reply_id % 3, 1)
+        self.assertEqual(client.get_post_content(5)['post_id'], 5)
+        self.assertEqual(client.vote_post(4, 'a', True), 1)
+        self.assertEqual(client.vote_comment(reply_id, 'a', False), -1)
+        self.assertEqual(
+            client.expand_comment_branch(comment_ids[4], 5),
+            [{'sub_comment': client.get_comments([reply_id])[0],
+              'sub_sub_comments': []}])
+        top = client.get_most_upvoted_comments(4, 5)
+        self.assertEqual([(comment['comment_id'], comment['parent_post_id'])
+                          for comment in top], [(comment_ids[4], 4)])
+        self.assertEqual([comment['comment_id'] for comment in
+                          client.stream_comment_tree(comment_ids[4], 2, 5)],
+                         [reply_id])
+        thread = client.get_post_thread(4, 5, 5)
+        self.assertEqual(thread['comments'][0]['replies'][0]['text'], 'reply')
+
+    def test_batches_are_split_and_merged(self):
+        client = self.client
+        post_ids = [client.create_post(f'post {i}', 'x') for i in range(6)]
+        self.assertEqual(
+            [post and post['post_id']
+             for post in client.get_posts([5, 99, 0, 3, 4])],
+            [5, None, 0, 3, 4])
+        self.assertEqual(client.vote_batch(
+            [(post_id, 'a', True) for post_id in post_ids] + [(0, 'a', True)]),
+            ([1] * 6 + [None], []))
+        comment_ids = client.create_comments(
+            [{'author_id': 'a', 'parent_post_id': post_id}
+             for post_id in reversed(post_ids)])
+        self.assertEqual([comment_id % 3 for comment_id in comment_ids],
+                         [post_id % 3 for post_id in reversed(post_ids)])
+        self.assertEqual(client.stream_votes(
+            comment_votes=[(comment_id, 'b', True)
+                           for comment_id in comment_ids], batch_size=4),
+            ([], [1] * 6))
+        self.assertEqual([comment['parent_post_id'] for comment in
+                          client.get_comments(comment_ids)],
+                         list(reversed(post_ids)))
+
+
+class TestReplication(unittest.TestCase):
+
+    def setUp(self):
+        self.log = ReplicationLog(capacity=1000)
+        leader = RedditNativeController()
+        leader.log = self.log
+        leader.init()
+        self.leader, port = make_server('localhost', 0, leader,
+                                        replication=self.log, heartbeat=0.05)
+        self.address = f'localhost:{port}'
+        self.follower = Follower(RedditNativeController(), self.address,
+                                 retry_interval=0.05).start()
+        self.replica, replica_port = make_server(
+            'localhost', 0, self.follower.controller,
+            replication=self.follower)
+        self.leader_stub = RedditServiceStub(
+            grpc.insecure_channel(self.address))
+        self.replica_stub = RedditServiceStub(
+            grpc.insecure_channel(f'localhost:{replica_port}'))
+
+    def tearDown(self):
+        self.follower.close()
+        self.replica.stop(None)
+        self.leader.stop(None)
+
+    def test_follower_converges(self):
+        leader = RedditClient(self.leader_stub)
+        post_id = leader.create_post('title', 'text')
+        comment_id = leader.create_comment('b', parent_post_id=post_id)
+        leader.vote_comment(comment_id, 'c', True)
+        leader.vote_batch([(0, user, True) for user in 'abc'])
+        self.assertTrue(self.follower.wait_for(self.log.appended, 5))
+        replica = RedditClient(self.replica_stub)
+        self.assertEqual(replica.get_post_content(post_id),
+                         leader.get_post_content(post_id))
+        self.assertEqual(replica.get_most_upvoted_comments(post_id, 5),
+                         leader.get_most_upvoted_comments(post_id, 5))
+        self.assertEqual(replica.get_post_content(0)['score'], 3)
+        status = self.replica_stub.GetReplicationStatus(
+            reddit_pb2.ReplicationStatusRequest())
+        self.assertEqual(status.role,
+                         reddit_pb2.ReplicationRole.REPLICATION_ROLE_FOLLOWER)
+        self.assertEqual(status.applied_sequence, self.log.appended)
+        self.assertEqual(status.lag, 0)
+        self.assertGreaterEqual(status.seconds_since_contact, 0)
+
+    def test_follower_is_read_only(self):
+        with self.assertRaises(grpc.RpcError) as raised:
+            RedditClient(self.replica_stub).create_post('title', 'text')
+        self.assertEqual(raised.exception.code(),
+                         grpc.StatusCode.FAILED_PRECONDITION)
+        with self.assertRaises(grpc.RpcError) as raised:
+            next(self.replica_stub.Replicate(reddit_pb2.ReplicateRequest()))
+        self.assertEqual(raised.exception.code(),
+                         grpc.StatusCode.FAILED_PRECONDITION)
+
+    def test_read_your_writes(self):
+        client = RedditClient(ReadYourWritesStub(self.leader_stub,
+                                                 [self.replica_stub]))
+        for i in range(5):
+            post_id = client.create_post(f'post {i}', 'text')
+            self.assertEqual(client.stub.position, self.log.appended)
+            self.assertEqual(client.vote_post(post_id, 'a', True), 1)
+            self.assertEqual(client.get_post_content(post_id)['score'], 1)
+
+    def test_stalled_follower_falls_back_to_leader(self):
+        # a follower that never replicates holds reads until max_wait
+        stalled = Follower(RedditNativeController(), self.address)
+        server, port = make_server('localhost', 0, stalled.controller,
+                                   max_replica_wait=0.05, replication=stalled)
+        try:
+            replica_stub = RedditServiceStub(
+                grpc.insecure_channel(f'localhost:{port}'))
+            client = RedditClient(ReadYourWritesStub(self.leader_stub,
+                                                     [replica_stub]))
+            with self.assertRaises(grpc.RpcError) as raised:
+                replica_stub.GetPostContent(
+                    reddit_pb2.GetPostContentRequest(post_id=0),
+                    metadata=(('min-log-position', '1'),))
+            self.assertEqual(raised.exception.code(),
+                             grpc.StatusCode.UNAVAILABLE)
+            post_id = client.create_post('title', 'text')
+            self.assertEqual(client.get_post_content(post_id)['title'],
+                             'title')
+        finally:
+            server.stop(None)
+
+    def test_followers_have_threads_of_their_own(self):
+        server, port = make_server('localhost', 0, replication=self.log,
+                                   heartbeat=0.05, max_followers=1,
+                                   max_workers=1)
+        stub = RedditServiceStub(grpc.insecure_channel(f'localhost:{port}'))
+        stream = stub.Replicate(reddit_pb2.ReplicateRequest(
+            after_sequence=self.log.appended))
+        try:
+            next(stream)
+            with self.assertRaises(grpc.RpcError) as raised:
+                next(stub.Replicate(reddit_pb2.ReplicateRequest(
+                    after_sequence=self.log.appended), timeout=5))
+            self.assertEqual(raised.exception.code(),
+                             grpc.StatusCode.RESOURCE_EXHAUSTED)
+            # the only worker is not held by the stream
+            self.assertTrue(stub.GetPostContent(
+                reddit_pb2.GetPostContentRequest(post_id=0),
+                timeout=5).success)
+        finally:
+            stream.cancel()
+            server.stop(None)
+
+    def test_refusing_handlers_are_cached(self):
+        # the interceptors in front cache a wrapper per handler they get,
+        # so a refused method must get the same handler on every call
+        handler = grpc.unary_unary_rpc_method_handler(lambda r, c: None)
+        follower = FollowerInterceptor(self.follower)
+        details = MagicMock(method='/reddit.RedditService/CreatePost')
+        first, second = (follower.intercept_service(lambda d: handler, details)
+                         for _ in range(2))
+        self.assertIs(first, second)
+        self.assertEqual(len(follower.refusing), 1)
+        leader = LeaderInterceptor(max_followers=1)
+        leader.pool.streams = 1
+        details = MagicMock(method='/reddit.RedditService/Replicate')
+        first, second = (leader.intercept_service(lambda d: handler, details)
+                         for _ in range(2))
+        self.assertIs(first, second)
+        self.assertEqual(len(leader.refusing), 1)
+        leader.pool.shutdown()
+
+    def test_follower_too_far_behind_stops(self):
+        self.log.records.clear()
+        follower = Follower(RedditNativeController(), self.address).start()
+        follower.thread.join(5)
+        self.assertFalse(follower.thread.is_alive())
+        self.assertEqual(follower.error.code(), grpc.StatusCode.OUT_OF_RANGE)
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def test_limit_adapts_to_queue_delay(self):
+        limit = ConcurrencyLimit(target_delay=0.01, initial=10, interval=60)
+        for _ in range(10):
+            limit.queued()
+        limit.started(0.5)
+        self.assertAlmostEqual(limit.limit, 9)
+        # one cut per interval, the calls queued before it wait long too
+        limit.started(0.5)
+        self.assertAlmostEqual(limit.limit, 9)
+        limit.started(0.001)
+        self.assertAlmostEqual(limit.limit, 9 + 1 / 9)
+        self.assertFalse(limit.admit())
+        self.assertEqual(limit.rejected, 1)
+        for _ in range(10):
+            limit.finished()
+        self.assertTrue(limit.admit())
+        # an idle server does not raise its limit
+        limit.started(0.001)
+        self.assertAlmostEqual(limit.limit, 9 + 1 / 9)
+
+    def test_overload_is_rejected_at_once(self):
+        limit = ConcurrencyLimit(target_delay=0.01, initial=1, maximum=1)
+        reddit_controller = RedditNativeController()
+        reddit_controller.init()
+        server, port = make_server('localhost', 0, reddit_controller,
+                                   max_workers=1, limit=limit)
+        stub = RedditServiceStub(grpc.insecure_channel(f'localhost:{port}'))
+        release = threading.Event()
+        get_post = reddit_controller.get_post
+
+        def slow_get_post(post_id):
+            release.wait()
+            return get_post(post_id)
+
+        def until(condition):
+            while not condition():
+                time.sleep(0.01)
+
+        request = reddit_pb2.GetPostContentRequest(post_id=0)
+        try:
+            with patch.object(reddit_controller, 'get_post', slow_get_post):
+                # a slow call holds the only worker, the next one is
+                # admitted as nothing waits, and queued
+                running = stub.GetPostContent.future(request, timeout=5)
+                until(lambda: limit.holding == 1 and limit.waiting == 0)
+                queued = stub.GetPostContent.future(request, timeout=5)
+                until(lambda: limit.waiting == 1)
+                start = time.perf_counter()
+                with self.assertRaises(grpc.RpcError) as error:
+                    stub.GetPostContent(request, timeout=5)
+                self.assertEqual(error.exception.code(),
+                                 grpc.StatusCode.RESOURCE_EXHAUSTED)
+                self.assertLess(time.perf_counter() - start, 1)
+                release.set()
+                self.assertTrue(running.result().success)
+                self.assertTrue(queued.result().success)
+            until(lambda: limit.holding == 0)
+            stub.CreatePost(reddit_pb2.CreatePostRequest(
+                post=reddit_pb2.Post(title='t')), timeout=5)
+        finally:
+            release.set()
+            server.stop(None)
+
+    def test_recovers_from_the_lowest_limit(self):
+        limit = ConcurrencyLimit(target_delay=0.01, initial=2, interval=0)
+        # a stream no longer counts once its handler runs
+        limit.running(limit.queued())
+        limit.release()
+        self.assertEqual(limit.holding, 0)
+        limit.running(limit.queued())
+        for _ in range(10):
+            limit.started(0.5)
+        self.assertEqual(limit.limit, 1)
+        # held calls all running: one more may queue, to report its wait
+        self.assertTrue(limit.admit())
+        limit.queued()
+        self.assertFalse(limit.admit())
+
+    def test_streams_do_not_lock_the_server_out(self):
+        limit = ConcurrencyLimit(target_delay=0.01, initial=2, interval=0)
+        reddit_controller = RedditNativeController()
+        reddit_controller.init()
+        server, port = make_server('localhost', 0, reddit_controller,
+                                   max_workers=3, limit=limit)
+        stub = RedditServiceStub(grpc.insecure_channel(f'localhost:{port}'))
+        release = threading.Event()
+
+        def votes(user):
+            yield reddit_pb2.BatchVoteRequest(post_votes=[
+                reddit_pb2.VotePostRequest(
+                    post_id=0, user=reddit_pb2.User(user_id=user),
+                    is_upvote=True)])
+            release.wait()
+
+        try:
+            # two vote streams stay open, then slow calls cut the limit
+            score = reddit_controller.posts.score[0]
+            streams = [stub.StreamVotes.future(votes(user))
+                       for user in 'ab']
+            while reddit_controller.posts.score[0] < score + 2:
+                time.sleep(0.01)
+            for _ in range(10):
+                limit.started(0.5)
+            self.assertEqual(limit.limit, 1)
+            for _ in range(3):
+                self.assertTrue(stub.GetPostContent(
+                    reddit_pb2.GetPostContentRequest(post_id=0),
+                    timeout=5).success)
+            release.set()
+            for stream in streams:
+                stream.result(timeout=5)
+        finally:
+            release.set()
+            server.stop(None)
+
+    def test_config_and_options(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'server.json')
+            with open(path, 'w') as f:
+                f.write('{"max-workers": 32, "replicate": true, '
+                        '"follow": null, "target_queue_delay": 0.05}')
+            self.assertEqual(config_args(path), [
+                '--max-workers', '32', '--replicate',
+                '--target-queue-delay', '0.05'])
+        self.assertEqual(grpc_options(keepalive_time=30,
+                                      max_receive_message_length=1 << 20),
+                         [('grpc.keepalive_time_ms', 30000),
+                          ('grpc.max_receive_message_length', 1 << 20)])
+        server, port = make_server(
+            'localhost', 0, RedditNativeController(), max_workers=2,
+            options=grpc_options(max_receive_message_length=100),
+            compression=grpc.Compression.Gzip)
+        try:
+            stub = RedditServiceStub(
+                grpc.insecure_channel(f'localhost:{port}'))
+            stub.CreatePost(reddit_pb2.CreatePostRequest(
+                post=reddit_pb2.Post(title='t')))
+            with self.assertRaises(grpc.RpcError) as error:
+                stub.CreatePost(reddit_pb2.CreatePostRequest(
+                    post=reddit_pb2.Post(text='x' * 200)))
+            self.assertEqual(error.exception.code(),
+                             grpc.StatusCode.RESOURCE_EXHAUSTED)
+        finally:
+            server.stop(None)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_buckets(self):
+        histogram = Histogram()
+        for seconds in (BUCKETS[0], BUCKETS[0] * 1.5, 0.003, 100.0):
+            histogram.observe(seconds)
+        counts, total = histogram.snapshot()
+        self.assertEqual(counts[0], 1)
+        self.assertEqual(counts[1], 1)
+        self.assertEqual(counts[BUCKETS.index(5e-3)], 1)
+        self.assertEqual(counts[-1], 1)
+        self.assertEqual(sum(counts), 4)
+        self.assertAlmostEqual(total, 100.003 + BUCKETS[0] * 2.5)
+
+    def test_sampled_stage(self):
+        metrics = Metrics(stage_sample=4)
+        square = metrics.timed('square', lambda x: x * x)
+        self.assertEqual([square(x) for x in range(8)],
+                         [x * x for x in range(8)])
+        self.assertEqual(sum(metrics.stage('square').snapshot()[0]), 2)
+
+    def test_server_stats(self):
+        metrics = Metrics(stage_sample=1)
+        controller = RedditNativeController()
+        controller.init()
+        controller.instrument(metrics)
+        server, port = make_server('localhost', 0, controller,
+                                   cache_size=0, metrics=metrics)
+        http = serve_http(metrics, 'localhost', 0)
+        try:
+            stub = RedditServiceStub(
+                grpc.insecure_channel(f'localhost:{port}'))
+            client = RedditClient(stub)
+            for _ in range(2):
+                client.get_most_upvoted_comments(0, 5)
+            with self.assertRaises(grpc.RpcError):
+                list(stub.Replicate(reddit_pb2.ReplicateRequest()))
+            stats = stub.GetServerStats(reddit_pb2.ServerStatsRequest())
+            methods = {method.method: method for method in stats.methods}
+            top = methods['GetMostUpvotedComments']
+            self.assertEqual((top.requests, top.errors, top.in_flight),
+                             (2, 0, 0))
+            self.assertEqual(top.latency.count, 2)
+            self.assertEqual(sum(top.latency.counts), 2)
+            self.assertEqual(list(top.latency.bounds), list(BUCKETS))
+            self.assertEqual(methods['Replicate'].errors, 1)
+            # the stats call itself is still in flight
+            self.assertEqual(methods['GetServerStats'].in_flight, 1)
+            stages = {stage.stage: stage.latency.count
+                      for stage in stats.stages}
+            self.assertEqual(stages['lookup'], 2)
+            self.assertEqual(stages['ranking'], 2)
+            self.assertGreater(stages['message'], 0)
+            self.assertGreater(stages['serialize'], 0)
+
+            with urllib.request.urlopen(
+                    f'http://localhost:{http.server_address[1]}/metrics') \
+                    as response:
+                text = response.read().decode()
+            self.assertIn('reddit_rpc_requests_total'
+                          '{method="GetMostUpvotedComments"} 2', text)
+            self.assertIn('reddit_rpc_errors_total{method="Replicate"} 1',
+                          text)
+            self.assertIn('reddit_rpc_latency_seconds_bucket'
+                          '{method="GetMostUpvotedComments",le="+Inf"} 2',
+                          text)
+            self.assertIn('reddit_stage_seconds_count{stage="ranking"} 2',
+                          text)
+        finally:
+            http.shutdown()
+            server.stop(None)
+
+    def test_cache_stats(self):
+        metrics = Metrics()
+        server, port = make_server('localhost', 0, cache_size=1,
+                                   metrics=metrics)
+        try:
+            stub = RedditServiceStub(
+                grpc.insecure_channel(f'localhost:{port}'))
+            client = RedditClient(stub)
+            for post_id in (0, 0, 1):
+                client.get_most_upvoted_comments(post_id, 5)
+            stats = stub.GetServerStats(reddit_pb2.ServerStatsRequest())
+        finally:
+            server.stop(None)
+        self.assertEqual(
+            [(cache.cache, cache.hits, cache.misses, cache.evictions,
+              cache.size) for cache in stats.caches],
+            [('responses', 1, 2, 1, 1)])
+        text = metrics.prometheus_text()
+        self.assertIn('reddit_cache_hits_total{cache="responses"} 1', text)
+        self.assertIn('reddit_cache_misses_total{cache="responses"} 2', text)
+        self.assertIn('reddit_cache_evictions_total{cache="responses"} 1',
+                      text)
+        self.assertIn('reddit_cache_size{cache="responses"} 1', text)
+
+    def test_async_server_stats(self):
+        async def run():
+            metrics = Metrics()
+            server, port = await make_async_server(
+                'localhost', 0, None, metrics=metrics)
+            try:
+                async with grpc.aio.insecure_channel(
+                        f'localhost:{port}') as channel:
+                    stub = RedditServiceStub(channel)
+                    await stub.GetPostContent(
+                        reddit_pb2.GetPostContentRequest(post_id=0))
+                    nodes = [node async for node in stub.StreamCommentTree(
+                        reddit_pb2.ExpandCommentBranchRequest(
+                            comment_id=0, limit=2, max_depth=2))]
+                    return nodes, await stub.GetServerStats(
+                        reddit_pb2.ServerStatsRequest())
+            finally:
+                await server.stop(None)
+
+        nodes, stats = asyncio.run(run())
+        self.assertTrue(nodes)
+        methods = {method.method: method for method in stats.methods}
+        self.assertEqual(methods['GetPostContent'].requests, 1)
+        self.assertEqual(methods['StreamCommentTree'].latency.count, 1)
+        self.assertEqual(methods['StreamCommentTree'].in_flight, 0)
+
+
+class TestVoteCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        # batches of 4 votes, the flusher never runs during a test
+        self.controller = RedditNativeController(
+            vote_flush_interval=60, vote_batch=4)
+        self.controller.init()
+
+    def tearDown(self):
+        self.controller.close()
+
+    def test_voter_sees_own_vote(self):
+        controller = self.controller
+        score = controller.comments.score[3]
+        self.assertEqual(controller.vote_comment(3, 'a', True),
+                         (True, score + 1))
+        self.assertEqual(controller.vote_comment(3, 'b', True),
+                         (True, score + 2))
+        self.assertEqual(controller.vote_comment(3, 'b', True), (False, 0))
+        self.assertEqual(controller.vote_comment(3, 'b', False),
+                         (True, score))
+        self.assertEqual(controller.comments.score[3], score)
+        controller.vote_comment(3, 'c', True)
+        # the fourth vote filled the batch
+        self.assertEqual(controller.comments.score[3], score + 1)
+        self.assertEqual(controller.comment_vote_buffer.delta(3), 0)
+
+    def test_post_votes_are_applied_at_once(self):
+        controller = self.controller
+        self.assertEqual(controller.vote_post(1, 'a', True), (True, 1))
+        self.assertEqual(controller.posts.score[1], 1)
+        self.assertEqual(controller.get_post(1).score, 1)
+
+    def test_ranking_after_flush(self):
+        def top(controller):
+            return [(comment.comment_id, comment.score) for comment, _ in
+                    controller.retrieve_n_most_upvoted_comment(0, 5)]
+
+        controller = self.controller
+        expected = RedditNativeController()
+        expected.init()
+        for user in ('a', 'b', 'c', 'd', 'e'):
+            self.assertEqual(controller.vote_comment(3, user, True),
+                             expected.vote_comment(3, user, True))
+        # the fifth vote is still pending: shown, but not ranked by
+        self.assertEqual(controller.comments.score[3], 4)
+        self.assertEqual(sorted(top(controller)), sorted(top(expected)))
+        controller.flush_votes()
+        self.assertEqual(top(controller), top(expected))
+
+    def test_reads_show_pending_votes(self):
+        controller = RedditNativeController(
+            wire_cache=True, vote_flush_interval=60, vote_batch=4)
+        controller.init()
+        self.addCleanup(controller.close)
+        servicers = [RedditServicer(controller),
+                     RedditServicer(controller, raw_responses=True)]
+        top = reddit_pb2.GetMostUpvotedCommentsRequest(post_id=0, limit=5)
+        branch = reddit_pb2.ExpandCommentBranchRequest(comment_id=0, limit=5)
+        batch = reddit_pb2.BatchGetCommentsRequest(comment_ids=[3, 9])
+
+        def parse(response, message):
+            if hasattr(response, 'data'):
+                return message.FromString(response.data)
+            return response
+
+        def scores():
+            # the scores of comments 3 and 9 as every read answers them
+            seen = [(controller.get_comment(3).score,
+                     controller.get_comment(9).score)]
+            for servicer in servicers:
+                comments = {item.comment.comment_id: item.comment.score
+                            for item in parse(
+                                servicer.GetMostUpvotedComments(top, None),
+                                reddit_pb2.GetMostUpvotedCommentsResponse
+                            ).comments}
+                for item in parse(servicer.ExpandCommentBranch(branch, None),
+                                  reddit_pb2.ExpandCommentBranchResponse
+                                  ).subcomments:
+                    for sub in item.subcomments:
+                        comments[sub.comment_id] = sub.score
+                seen.append((comments[3], comments[9]))
+                seen.append(tuple(
+                    result.comment.score for result in parse(
+                        servicer.BatchGetComments(batch, None),
+                        reddit_pb2.BatchGetCommentsResponse).comments))
+            return set(seen)
+
+        before = scores()
+        self.assertEqual(len(before), 1)
+        (score3, score9), = before
+        controller.vote_comment(3, 'a', True)
+        controller.vote_comment(9, 'a', False)
+        self.assertEqual(controller.comments.score[3], score3)
+        self.assertEqual(scores(), {(score3 + 1, score9 - 1)})
+        controller.flush_votes()
+        self.assertEqual(scores(), {(score3 + 1, score9 - 1)})
+
+    def test_concurrent_votes_on_hot_post(self):
+        controller = self.controller
+        threads = [threading.Thread(
+            target=lambda t=t: [controller.vote_post(0, f'{t}-{i}', True)
+                                for i in range(101)])
+            for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(controller.get_post(0).score, 808)
+        controller.close()
+        self.assertEqual(controller.posts.score[0], 808)
+
+
+class TestRawResponses(unittest.TestCase):
+
+    def test_same_bytes_as_messages(self):
+        controller = RedditNativeController(wire_cache=True)
+        controller.init()
+        raw = RedditServicer(controller, cache_size=0, raw_responses=True)
+        messages = RedditServicer(controller, cache_size=0)
+        rng = random.Random(1)
+        for step in range(200):
+            comments = len(controller.comments)
+            if step % 3 == 0:
+                controller.create_comment(reddit_pb2.Comment(
+                    text=f'reply {step}', parent_comment_id=rng.randrange(
+                        comments)))
+            elif step % 3 == 1:
+                controller.vote_comment(rng.randrange(comments),
+                                        f'user{rng.randrange(10)}',
+                                        rng.random() < 0.6)
+            else:
+                controller.set_comment_state(
+                    rng.randrange(comments), rng.choice(
+                        [reddit_pb2.CommentState.COMMENT_STATE_NORMAL,
+                         reddit_pb2.CommentState.COMMENT_STATE_HIDDEN]))
+            request = reddit_pb2.GetMostUpvotedCommentsRequest(
+                post_id=rng.randrange(3), limit=3)
+            self.assertEqual(
+                raw.GetMostUpvotedComments(request, None).data,
+                messages.GetMostUpvotedComments(
+                    request, None).SerializeToString())
+            request = reddit_pb2.ExpandCommentBranchRequest(
+                comment_id=rng.randrange(comments), limit=3)
+            self.assertEqual(
+                raw.ExpandCommentBranch(request, None).data,
+                messages.ExpandCommentBranch(
+                    request, None).SerializeToString())
+        self.assertTrue(controller.comment_wire)
+
+    def test_served_over_grpc(self):
+        controller = RedditNativeController(wire_cache=True)
+        controller.init()
+        expected = RedditServicer(controller).ExpandCommentBranch(
+            reddit_pb2.ExpandCommentBranchRequest(comment_id=0, limit=2),
+            None)
+        server, port = make_server('localhost', 0, controller,
+                                   raw_responses=True)
+        try:
+            client = RedditClient(host='localhost', port=port)
+            self.assertEqual(client.stub.ExpandCommentBranch(
+                reddit_pb2.ExpandCommentBranchRequest(
+                    comment_id=0, limit=2)), expected)
+            self.assertEqual(len(client.get_most_upvoted_comments(0, 2)), 2)
+        finally:
+            server.stop(None)
+
+
+class TestControllerConcurrency(unittest.TestCase):
+
+    THREADS = 16
+    VOTES_PER_THREAD = 200
+
+    def setUp(self):
+        # switch threads as often as possible to provoke races
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def run_threads(self, target):
+        threads = [threading.Thread(target=target, args=(t,))
+                   for t in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_votes(self):
+        controller = RedditNativeController(lock_stripes=4)
+        posts = [controller.create_post(reddit_pb2.Post(title=f'post{i}'))
+                 for i in range(6)]
+        comments = [controller.create_comment(
+            reddit_pb2.Comment(parent_post_id=posts[0].post_id))
+            for i in range(6)]
+
+        def worker(t):
+            for i in range(self.VOTES_PER_THREAD):
+                user_id = f'user{t}-{i}'
+                for post in posts:
+                    controller.vote_post(post.post_id, user_id, True)
+                for comment in comments:
+                    controller.vote_comment(comment.comment_id, user_id, True)
+                if i % 4 == 0:
+                    # every fourth user changes their mind
+                    for post in posts:
+                        controller.vote_post(post.post_id, user_id, False)
+                    for comment in comments:
+                        controller.vote_comment(
+                            comment.comment_id, user_id, False)
+
+        self.run_threads(worker)
+        changed = self.THREADS * len(range(0, self.VOTES_PER_THREAD, 4))
+        expected = self.THREADS * self.VOTES_PER_THREAD - 2 * changed
+        for post in posts:
+            self.assertEqual(controller.get_post(post.post_id).score, expected)
+        for comment in comments:
+            self.assertEqual(
+                controller.get_comment(comment.comment_id).score, expected)
+        self.assertEqual(
+            len(controller.retrieve_n_most_upvoted_comment(0, 10)), 6)
+
+    def test_concurrent_creates(self):
+        controller = RedditNativeController(lock_stripes=4)
+        post = controller.create_post(reddit_pb2.Post(title='post'))
+
+        def worker(t):
+            for i in range(self.VOTES_PER_THREAD):
+                comment = controller.create_comment(
+                    reddit_pb2.Comment(parent_post_id=post.post_id))
+                controller.vote_comment(comment.comment_id, f'user{t}', True)
+
+        self.run_threads(worker)
+        total = self.THREADS * self.VOTES_PER_THREAD
+        self.assertEqual(len(controller.comments), total)
+        self.assertEqual(controller.get_post(post.post_id).comment_count, total)
+        result = controller.retrieve_n_most_upvoted_comment(
+            post.post_id, total)
+        self.assertEqual(sorted(c.comment_id for c, _ in result),
+                         list(range(total)))
+
+    def check_votes_during_create(self, create, batch=1):
+        """
+        Vote the newest comment while creators call create(controller,
+        post_id) for batches of comments, then check the post's child
+        index has every comment once, at its score.
+        """
+        controller = RedditNativeController(lock_stripes=4)
+        post = controller.create_post(reddit_pb2.Post(title='post'))
+        creators = self.THREADS // 2
+        done = threading.Event()
+        successes = collections.Counter()
+        counter_lock = threading.Lock()
+        errors = []
+
+        def worker(t):
+            try:
+                work(t)
+            except Exception as e:
+                errors.append(e)
+                done.set()
+
+        def work(t):
+            if t < creators:
+                for _ in range(self.VOTES_PER_THREAD // batch):
+                    create(controller, post.post_id)
+                return
+            i = 0
+            while not done.is_set():
+                # vote the newest row, which may still be being inserted
+                comment_id = len(controller.comments) - 1
+                i += 1
+                success, _ = controller.vote_comment(
+                    comment_id, f'user{t}-{i}', True)
+                if success:
+                    with counter_lock:
+                        successes[comment_id] += 1
+
+        threads = [threading.Thread(target=worker, args=(t,))
+                   for t in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads[:creators]:
+            thread.join()
+        done.set()
+        for thread in threads[creators:]:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        total = creators * (self.VOTES_PER_THREAD // batch) * batch
+        result = controller.retrieve_n_most_upvoted_comment(
+            post.post_id, total + 1)
+        self.assertEqual(sorted(c.comment_id for c, _ in result),
+                         list(range(total)))
+        for comment, _ in result:
+            self.assertEqual(comment.score, successes[comment.comment_id])
+        scores = [comment.score for comment, _ in result]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_votes_during_create(self):
+        self.check_votes_during_create(
+            lambda controller, post_id: controller.create_comment(
+                reddit_pb2.Comment(parent_post_id=post_id)))
+
+    def test_votes_during_batch_create(self):
+        self.check_votes_during_create(
+            lambda controller, post_id: controller.create_comments(
+                [reddit_pb2.Comment(parent_post_id=post_id)
+                 for _ in range(10)]),
+            batch=10)
+
+
 if __name__ == '__main__':
     unittest.main()
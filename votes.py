@@ -0,0 +1,230 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+
+from storage import TextPool
+
+NO_VOTE = 0
+UPVOTE = 1
+DOWNVOTE = -1
+
+# 2-bit codes of a vote inside a bitmap
+BITMAP_CODES = {NO_VOTE: 0, UPVOTE: 1, DOWNVOTE: 2}
+BITMAP_VOTES = (NO_VOTE, UPVOTE, DOWNVOTE, NO_VOTE)
+
+
+class UserInterner:
+    """
+    Map user_id strings to small integer handles, so each vote stores
+    an integer instead of a reference to a string.
+
+    The user ids are kept in a TextPool. An interner loaded from a
+    snapshot only builds its user_id -> handle dict on the first lookup,
+    so reads that never need it (building messages) start right away.
+    """
+
+    def __init__(self, names: TextPool = None):
+        self.names = TextPool() if names is None else names
+        self.handles = None if len(self.names) else {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def load_handles(self):
+        with self.lock:
+            if self.handles is None:
+                names = self.names
+                self.handles = {names[i]: i for i in range(len(names))}
+        return self.handles
+
+    def intern(self, user_id: str):
+        """Return the handle of user_id, allocating one if needed"""
+        handles = self.handles
+        if handles is None:
+            handles = self.load_handles()
+        handle = handles.get(user_id, None)
+        if handle is not None:
+            return handle
+        with self.lock:
+            handle = self.handles.get(user_id, None)
+            if handle is None:
+                handle = self.names.append(user_id)
+                self.handles[user_id] = handle
+        return handle
+
+    def user_id(self, handle: int):
+        return self.names[handle]
+
+    def memory_usage(self):
+        """Approximate number of bytes used by the interner"""
+        handles = self.handles or {}
+        return sys.getsizeof(handles) + self.names.memory_usage() + \
+            sum(sys.getsizeof(user_id) for user_id in handles)
+
+
+class VoteStore:
+    """
+    Votes of users on items (posts or comments).
+
+    Nothing is allocated for an item until its first vote. An item's votes
+    start as a sorted array of 4-byte entries (handle << 1 | is_upvote);
+    once the array would be larger than a bitmap of 2 bits per known user,
+    the item switches to the bitmap. Callers serialize access per item.
+
+    A store loaded from a snapshot keeps the loaded votes as read-only
+    sorted arrays (base_items, base_offsets, base_entries), and copies an
+    item's entries into self.items the first time the item is touched.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.base_items = ()
+        self.base_offsets = (0,)
+        self.base_entries = ()
+
+    def load_base(self, item_ids, offsets, entries):
+        """
+        Use entries[offsets[i]:offsets[i + 1]] as the votes of item_ids[i],
+        item_ids must be sorted.
+        """
+        self.base_items = item_ids
+        self.base_offsets = offsets
+        self.base_entries = entries
+
+    def item_votes(self, item_id: int):
+        """Return the vote container of an item, or None if it has no votes"""
+        votes = self.items.get(item_id, None)
+        if votes is None and self.base_items:
+            i = bisect_left(self.base_items, item_id)
+            if i < len(self.base_items) and self.base_items[i] == item_id:
+                votes = array('I')
+                votes.frombytes(self.base_entries[
+                    self.base_offsets[i]:self.base_offsets[i + 1]].cast('B'))
+                max_handle = votes[-1] >> 1
+                if len(votes) * votes.itemsize * 4 > max_handle + 1:
+                    votes = self.to_bitmap(votes, max_handle)
+                self.items[item_id] = votes
+        return votes
+
+    def item_ids(self):
+        """Return the sorted ids of every item with votes"""
+        return sorted(set(self.items).union(self.base_items))
+
+    def get(self, item_id: int, handle: int):
+        """Return UPVOTE, DOWNVOTE or NO_VOTE"""
+        votes = self.item_votes(item_id)
+        if votes is None:
+            return NO_VOTE
+        if isinstance(votes, bytearray):
+            index = handle >> 2
+            if index >= len(votes):
+                return NO_VOTE
+            return BITMAP_VOTES[(votes[index] >> ((handle & 3) << 1)) & 3]
+        i = bisect_left(votes, handle << 1)
+        if i < len(votes) and votes[i] >> 1 == handle:
+            return UPVOTE if votes[i] & 1 else DOWNVOTE
+        return NO_VOTE
+
+    def set(self, item_id: int, handle: int, vote: int):
+        """Record the vote of a user on an item, NO_VOTE removes it"""
+        votes = self.item_votes(item_id)
+        if votes is None:
+            if vote == NO_VOTE:
+                return
+            votes = self.items[item_id] = array('I')
+        if isinstance(votes, bytearray):
+            self.set_bitmap(votes, handle, vote)
+            return
+        entry = handle << 1
+        i = bisect_left(votes, entry)
+        if i < len(votes) and votes[i] >> 1 == handle:
+            if vote == NO_VOTE:
+                del votes[i]
+            else:
+                votes[i] = entry | (vote == UPVOTE)
+            return
+        if vote == NO_VOTE:
+            return
+        votes.insert(i, entry | (vote == UPVOTE))
+        max_handle = votes[-1] >> 1
+        if len(votes) * votes.itemsize * 4 > max_handle + 1:
+            self.items[item_id] = self.to_bitmap(votes, max_handle)
+
+    def set_bitmap(self, bitmap: bytearray, handle: int, vote: int):
+        index = handle >> 2
+        if index >= len(bitmap):
+            if vote == NO_VOTE:
+                return
+            # grow geometrically so new users do not resize on every vote
+            bitmap.extend(bytes(max(index + 1 - len(bitmap), len(bitmap) >> 3)))
+        shift = (handle & 3) << 1
+        bitmap[index] = (bitmap[index] & ~(3 << shift)) | \
+            (BITMAP_CODES[vote] << shift)
+
+    def to_bitmap(self, votes: array, max_handle: int):
+        bitmap = bytearray((max_handle >> 2) + 1)
+        for entry in votes:
+            self.set_bitmap(bitmap, entry >> 1,
+                            UPVOTE if entry & 1 else DOWNVOTE)
+        return bitmap
+
+    def voters(self, item_id: int):
+        """Yield (handle, vote) of every vote on an item, by handle"""
+        votes = self.item_votes(item_id)
+        if votes is None:
+            return
+        if isinstance(votes, bytearray):
+            for index, byte in enumerate(votes):
+                if byte:
+                    for slot in range(4):
+                        vote = BITMAP_VOTES[(byte >> (slot << 1)) & 3]
+                        if vote != NO_VOTE:
+                            yield (index << 2) | slot, vote
+            return
+        for entry in votes:
+            yield entry >> 1, UPVOTE if entry & 1 else DOWNVOTE
+
+    def memory_usage(self):
+        """Approximate number of bytes used by the store"""
+        return sys.getsizeof(self.items) + \
+            sum(sys.getsizeof(votes) for votes in self.items.values())
+
+
+class VoteBuffer:
+    """
+    Score changes of recorded votes that are not applied to the scores
+    yet, per item, as [delta, number of votes]. add() and take() of an
+    item are called under that item's lock; delta() is read without it,
+    to show the pending score in messages.
+    """
+
+    def __init__(self, batch_size: int = 256):
+        self.batch_size = batch_size
+        self.pending = {}
+
+    def add(self, item_id: int, delta: int):
+        """
+        Buffer a score change, return the item's pending delta and
+        whether the batch is full and should be applied now.
+        """
+        entry = self.pending.get(item_id, None)
+        if entry is None:
+            entry = self.pending[item_id] = [0, 0]
+        entry[0] += delta
+        entry[1] += 1
+        return entry[0], entry[1] >= self.batch_size
+
+    def delta(self, item_id: int):
+        """Return the pending delta of an item"""
+        entry = self.pending.get(item_id, None)
+        return 0 if entry is None else entry[0]
+
+    def take(self, item_id: int):
+        """Remove and return the pending delta of an item"""
+        entry = self.pending.pop(item_id, None)
+        return 0 if entry is None else entry[0]
+
+    def item_ids(self):
+        return list(self.pending)
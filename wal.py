@@ -0,0 +1,180 @@
+import os
+import struct
+import threading
+import zlib
+
+import reddit_pb2
+
+# every record is written as (length, crc32) followed by a LogRecord
+HEADER = struct.Struct('<II')
+
+
+def read_records(path: str):
+    """
+    Yield (end offset, LogRecord) for every complete record of a log file.
+    Stops at the first torn or corrupt record, which is what a crash in the
+    middle of a write leaves behind.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        length, crc = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset = start + length
+        yield offset, reddit_pb2.LogRecord.FromString(payload)
+
+
+class WriteAheadLog:
+    """
+    Append-only log of LogRecords with group commit.
+
+    append() only adds the record to an in-memory buffer and can be called
+    while holding controller locks. sync() is called after the locks are
+    released: with durability "batch" it waits until the record is on disk,
+    and whichever waiting thread gets there first writes and fsyncs the
+    records of every other waiter with it. With "interval" a background
+    thread writes and fsyncs every `interval` seconds and sync() returns at
+    once; "none" is the same without fsync, so a crash of the process loses
+    nothing but a crash of the machine may.
+
+    A failed write or fsync leaves the file in an unknown state, so the
+    log fails for good: the records of that group are never reported
+    durable, and every later append(), sync() and flush() raises
+    OSError.
+    """
+
+    DURABILITY = ('batch', 'interval', 'none')
+
+    def __init__(self, path: str, durability: str = 'batch',
+                 interval: float = 0.01):
+        if durability not in self.DURABILITY:
+            raise ValueError(f"unknown durability {durability!r}")
+        self.path = path
+        self.durability = durability
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+        self.buffer = bytearray()
+        self.appended = 0   # sequence of the last appended record
+        self.durable = 0    # sequence of the last written record
+        self.flushing = False
+        self.fsyncs = 0
+        self.error = None   # the OSError the log failed with
+        self.file = None
+        self.closed = threading.Event()
+        self.flusher = None
+
+    def replay(self, apply, after: int = 0):
+        """
+        Call apply(record) for every record already in the log, cut off a
+        torn tail and open the log for appending. Records up to sequence
+        `after` (e.g. already in a snapshot) are skipped. Returns the
+        number of records replayed.
+        """
+        count = 0
+        end = 0
+        self.appended = self.durable = after
+        if os.path.exists(self.path):
+            for end, record in read_records(self.path):
+                if record.sequence > after:
+                    apply(record)
+                    count += 1
+                self.appended = self.durable = max(after, record.sequence)
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+        self.open()
+        return count
+
+    def open(self):
+        self.file = open(self.path, 'ab')
+        if self.durability != 'batch':
+            self.flusher = threading.Thread(
+                target=self.flush_periodically, daemon=True)
+            self.flusher.start()
+
+    def check_failed(self):
+        """Raise if a write failed. Called with self.lock held."""
+        if self.error is not None:
+            raise OSError(f"write-ahead log {self.path} failed: "
+                          f"{self.error}") from self.error
+
+    def append(self, record: reddit_pb2.LogRecord):
+        """Buffer a record and return its sequence number"""
+        with self.lock:
+            self.check_failed()
+            self.appended += 1
+            record.sequence = self.appended
+            data = record.SerializeToString()
+            self.buffer += HEADER.pack(len(data), zlib.crc32(data))
+            self.buffer += data
+            return self.appended
+
+    def sync(self, sequence: int):
+        """Return once record `sequence` is as durable as configured"""
+        with self.lock:
+            if self.durability != 'batch':
+                self.check_failed()
+                return
+            while self.durable < sequence:
+                self.check_failed()
+                if self.flushing:
+                    self.flushed.wait()
+                else:
+                    self.flush_locked(fsync=True)
+
+    def flush_locked(self, fsync: bool):
+        """
+        Write out everything buffered so far. Called with self.lock held,
+        the lock is released during the write so other threads keep
+        appending (and join the next group).
+        """
+        self.flushing = True
+        data, self.buffer = self.buffer, bytearray()
+        upto = self.appended
+        self.lock.release()
+        try:
+            self.file.write(data)
+            self.file.flush()
+            if fsync:
+                os.fsync(self.file.fileno())
+                self.fsyncs += 1
+        except OSError as error:
+            # set before the waiters are woken up below
+            self.error = error
+            raise
+        finally:
+            self.lock.acquire()
+            self.flushing = False
+            self.flushed.notify_all()
+        self.durable = upto
+
+    def flush_periodically(self):
+        while not self.closed.wait(self.interval):
+            try:
+                self.flush(fsync=self.durability == 'interval')
+            except OSError:
+                # recorded in self.error, raised by the next append()
+                return
+
+    def flush(self, fsync: bool = True):
+        with self.lock:
+            while self.flushing:
+                self.flushed.wait()
+            self.check_failed()
+            if self.buffer:
+                self.flush_locked(fsync)
+
+    def close(self):
+        self.closed.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        if self.file is not None:
+            try:
+                self.flush(fsync=self.durability != 'none')
+            finally:
+                self.file.close()
+                self.file = None
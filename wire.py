@@ -0,0 +1,141 @@
+import grpc
+import grpc.aio
+
+# Protocol buffer wire format, enough to frame already serialized messages
+# into the repeated fields of a response.
+VARINT = 0
+LEN = 2
+
+
+def encode_varint(value: int):
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def tag(number: int, wire_type: int):
+    return encode_varint(number << 3 | wire_type)
+
+
+def field(number: int, data: bytes):
+    """A length-delimited field: a message, string or bytes"""
+    return tag(number, LEN) + encode_varint(len(data)) + data
+
+
+# CommentAndWetherSubcommentsExist.has_subcomment (field 2)
+HAS_SUBCOMMENT = {True: tag(2, VARINT) + b'\x01',
+                  False: tag(2, VARINT) + b'\x00'}
+
+
+def most_upvoted_comments(comments):
+    """
+    Serialized GetMostUpvotedCommentsResponse of
+    (serialized Comment, has_subcomment) pairs.
+    """
+    return b''.join(field(1, field(1, comment) + HAS_SUBCOMMENT[has_sub])
+                    for comment, has_sub in comments)
+
+
+def comment_branch(branch):
+    """
+    Serialized ExpandCommentBranchResponse of
+    (serialized Comment, [serialized sub Comment]) pairs.
+    """
+    return b''.join(
+        field(1, field(1, comment) + b''.join(field(2, sub) for sub in subs))
+        for comment, subs in branch)
+
+
+def comment_tree(nodes, comment_bytes, number: int = 2):
+    """
+    Serialized repeated CommentTree field (by default
+    ExpandCommentBranchResponse.tree) from the (parent_id, comment_id,
+    has_subcomment, depth) nodes of a tree in breadth first order,
+    parent_id None at the top. A CommentTree needs the sizes of its replies, so it is
+    built bottom up.
+    """
+    replies = {}
+    for parent_id, child_id, has_sub, _ in reversed(list(nodes)):
+        children = replies.pop(child_id, ())
+        replies.setdefault(parent_id, []).append(
+            field(1, comment_bytes(child_id)) + HAS_SUBCOMMENT[has_sub] +
+            b''.join(field(3, child) for child in reversed(children)))
+    return b''.join(field(number, tree)
+                    for tree in reversed(replies.get(None, ())))
+
+
+def post_thread(post: bytes, nodes, comment_bytes):
+    """Serialized successful GetPostThreadResponse"""
+    return tag(1, VARINT) + b'\x01' + field(2, post) + \
+        comment_tree(nodes, comment_bytes, 3)
+
+
+def comment_tree_node(comment: bytes, has_sub: bool, depth: int):
+    """Serialized CommentTreeNode"""
+    return field(1, comment) + HAS_SUBCOMMENT[has_sub] + \
+        tag(3, VARINT) + encode_varint(depth)
+
+
+def item_results(results):
+    """
+    Serialized BatchGetPostsResponse or BatchGetCommentsResponse of
+    (ItemStatus, serialized Post or Comment, or None) pairs.
+    """
+    return b''.join(
+        field(1, tag(1, VARINT) + encode_varint(status) +
+              (b'' if data is None else field(2, data)))
+        for status, data in results)
+
+
+class RawResponse:
+    """A response that is already serialized, sent as is"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def raw_serializer(serializer):
+    def serialize(response):
+        if isinstance(response, RawResponse):
+            return response.data
+        return serializer(response)
+    return serialize
+
+
+class RawResponseInterceptor(grpc.ServerInterceptor):
+    """
+    Lets every method of the server return a RawResponse instead of a
+    message, by wrapping the response serializers registered by
+    reddit_pb2_grpc (which is generated, so it is not edited by hand).
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def intercept_service(self, continuation, handler_call_details):
+        return self.wrap(continuation(handler_call_details))
+
+    def wrap(self, handler):
+        if handler is None or handler.response_serializer is None:
+            return handler
+        wrapped = self.handlers.get(handler, None)
+        if wrapped is None:
+            wrapped = self.handlers[handler] = handler._replace(
+                response_serializer=raw_serializer(
+                    handler.response_serializer))
+        return wrapped
+
+
+class AsyncRawResponseInterceptor(grpc.aio.ServerInterceptor):
+    """RawResponseInterceptor for a grpc.aio server"""
+
+    def __init__(self):
+        self.interceptor = RawResponseInterceptor()
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return self.interceptor.wrap(await continuation(handler_call_details))